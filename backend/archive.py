@@ -0,0 +1,125 @@
+"""Cold archive of records moved out of the hot MongoDB collections.
+
+Records are written as compressed JSONL under
+``ARCHIVE_DIR/<collection>/<YYYY-MM>/<batch>.jsonl.zst`` (gzip when the
+``zstandard`` package is unavailable), partitioned by the month of their
+``created_at``. Every archive file has a small ``.meta.json`` sidecar with its
+record count, time range and the distinct values of a few key fields, so
+queries only open the files that can contain matches.
+"""
+import gzip
+import io
+import json
+import os
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional
+
+try:
+    import zstandard
+except ImportError:  # Optional: fall back to gzip
+    zstandard = None
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", os.path.join(os.path.dirname(__file__), "archive"))
+
+# Fields whose distinct values are listed in the sidecar for pruning
+KEY_FIELDS = ("id", "agent_id", "conversation_id")
+META_SUFFIX = ".meta.json"
+
+
+def _encode(record: Dict[str, Any]) -> str:
+    return json.dumps(record, default=lambda v: v.isoformat() if isinstance(v, datetime) else str(v)) + "\n"
+
+
+def naive_utc(value: datetime) -> datetime:
+    return value.astimezone(timezone.utc).replace(tzinfo=None) if value.tzinfo else value
+
+
+def _created_at(record: Dict[str, Any]) -> datetime:
+    value = record.get("created_at")
+    if isinstance(value, str):
+        return datetime.fromisoformat(value)
+    return value or datetime.utcnow()
+
+
+def write_archive(collection: str, records: List[Dict[str, Any]], root: str = ARCHIVE_DIR) -> List[str]:
+    """Append records to the archive of ``collection``, returns the files written"""
+    by_month: Dict[str, List[Dict[str, Any]]] = {}
+    for record in records:
+        by_month.setdefault(_created_at(record).strftime("%Y-%m"), []).append(record)
+
+    paths = []
+    for month, batch in sorted(by_month.items()):
+        directory = os.path.join(root, collection, month)
+        os.makedirs(directory, exist_ok=True)
+        name = f"{datetime.utcnow():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+        payload = "".join(_encode(record) for record in batch).encode()
+        if zstandard is not None:
+            path, data = os.path.join(directory, f"{name}.jsonl.zst"), zstandard.ZstdCompressor(level=10).compress(payload)
+        else:
+            path, data = os.path.join(directory, f"{name}.jsonl.gz"), gzip.compress(payload)
+
+        created = [_created_at(record) for record in batch]
+        meta = {
+            "records": len(batch),
+            "min_created_at": min(created).isoformat(),
+            "max_created_at": max(created).isoformat(),
+            "keys": {
+                field: sorted({str(record[field]) for record in batch if record.get(field) is not None})
+                for field in KEY_FIELDS
+            }
+        }
+        # Data before sidecar, readers only look at files with a sidecar
+        for target, content in ((path, data), (path + META_SUFFIX, json.dumps(meta).encode())):
+            with open(target + ".tmp", "wb") as f:
+                f.write(content)
+            os.replace(target + ".tmp", target)
+        paths.append(path)
+    return paths
+
+
+def _open_lines(path: str) -> Iterator[str]:
+    if path.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError(f"zstandard is required to read {path}")
+        with open(path, "rb") as raw:
+            with zstandard.ZstdDecompressor().stream_reader(raw) as reader:
+                yield from io.TextIOWrapper(reader, encoding="utf-8")
+    else:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            yield from f
+
+
+def read_archive(collection: str, filters: Optional[Dict[str, str]] = None, since: Optional[datetime] = None,
+                 until: Optional[datetime] = None, root: str = ARCHIVE_DIR) -> Iterator[Dict[str, Any]]:
+    """Archived records matching equality ``filters`` and a created_at range, oldest month first"""
+    filters = {field: str(value) for field, value in (filters or {}).items() if value is not None}
+    since = naive_utc(since) if since else None
+    until = naive_utc(until) if until else None
+    base = os.path.join(root, collection)
+    if not os.path.isdir(base):
+        return
+
+    for month in sorted(os.listdir(base)):
+        # Skip whole months outside the range
+        if (since and month < since.strftime("%Y-%m")) or (until and month > until.strftime("%Y-%m")):
+            continue
+        directory = os.path.join(base, month)
+        for meta_name in sorted(name for name in os.listdir(directory) if name.endswith(META_SUFFIX)):
+            with open(os.path.join(directory, meta_name)) as f:
+                meta = json.load(f)
+            if since and meta["max_created_at"] < since.isoformat():
+                continue
+            if until and meta["min_created_at"] > until.isoformat():
+                continue
+            if any(field in meta["keys"] and value not in meta["keys"][field] for field, value in filters.items()):
+                continue
+
+            for line in _open_lines(os.path.join(directory, meta_name[:-len(META_SUFFIX)])):
+                record = json.loads(line)
+                if any(str(record.get(field)) != value for field, value in filters.items()):
+                    continue
+                created_at = record.get("created_at") or ""
+                if (since and created_at < since.isoformat()) or (until and created_at > until.isoformat()):
+                    continue
+                yield record
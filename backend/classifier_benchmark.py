@@ -0,0 +1,113 @@
+"""Regression check and micro-benchmark of the task classifier.
+
+Compares ``KeywordClassifier`` with the substring matching it replaced on a
+corpus of prompts, then times both on short and long prompts and a batch of 10k prompts::
+
+    python classifier_benchmark.py
+"""
+import os
+import re
+import sys
+import timeit
+
+from server import TASK_KEYWORDS
+from task_classifier import KeywordClassifier
+
+CORPUS = [
+    "Write a blog post about remote work",
+    "Create a marketing story for our new product launch",
+    "Brainstorm names for a coffee shop",
+    "Analyze the quarterly sales report and summarize the insights",
+    "Compare Python and Go for backend services",
+    "Evaluate this research paper and review its methodology",
+    "Debug this function, it throws a KeyError",
+    "Build a REST api with authentication",
+    "Write a script to rename files in a folder",
+    "Explain how neural networks learn",
+    "Why is the sky blue?",
+    "What is the meaning of life?",
+    "Can you help me clarify my thoughts on this?",
+    "Scrape https://example.com and extract all links",
+    "Fetch the html of this website and parse the tables",
+    "Crawl http://news.ycombinator.com for the top stories",
+    "Plot a chart of monthly revenue trends",
+    "Give me statistics and metrics for 2023 vs 2024",
+    "Create a graph visualization of user analytics data",
+    "Analyze image of the receipt and extract the totals",
+    "Upload the pdf document and describe each picture",
+    "Solve this logic problem step by step",
+    "Calculate 17 * 23 + 4",
+    "Think about it and deduce the answer",
+    "hello",
+    "Thanks!",
+    "Summarize this article: " + "The economy grew steadily over the last decade. " * 12,
+    "Review the following code for bugs and suggest a fix:\n" + "def add(a, b):\n    return a + b\n" * 10,
+    "Design a database schema for a library with 3 tables and 12 columns",
+    "Investigate why the build fails on the CI server",
+]
+
+# Prompts where word-start matching intentionally differs from substring matching
+BOUNDARY_CHANGES = [
+    "Add a prefix to every line",  # "fix" inside "prefix" is no longer coding
+    "Decode this base64 string",  # "code" inside "decode"
+    "What is the capital of France?",  # "api" inside "capital"
+    "Show statistics for 2023 vs 2024",  # "how" inside "show"
+]
+
+LONG_PROMPT = " ".join(CORPUS) * 20
+with open(os.path.join(os.path.dirname(__file__), "server_original.py")) as f:
+    PASTED_CODE = "Review this code and explain what it does:\n" + f.read()[:40000]
+
+
+def legacy_classify(prompt: str) -> tuple:
+    """Substring matching classifier the single-pass one replaced"""
+    prompt_lower = prompt.lower()
+    scores = {task_type: 0 for task_type in TASK_KEYWORDS}
+    for task_type, keywords in TASK_KEYWORDS.items():
+        for keyword in keywords:
+            if keyword in prompt_lower:
+                weight = 2 if prompt_lower.startswith(keyword) else 1
+                scores[task_type] += weight
+    if len(prompt.split()) > 50:
+        scores["analysis_tasks"] += 1
+        scores["reasoning"] += 1
+    if re.search(r'https?://', prompt):
+        scores["web_scraping"] += 3
+    if re.search(r'\d+.*\d+', prompt):
+        scores["data_analysis"] += 2
+    if any(word in prompt_lower for word in ["how", "why", "what", "explain"]):
+        scores["conversation"] += 1
+    max_score_type = max(scores, key=scores.get)
+    max_score = scores[max_score_type]
+    confidence = max_score / max(1, sum(scores.values()))
+    return (max_score_type if max_score > 0 else "fast_responses", confidence)
+
+
+def main() -> int:
+    classifier = KeywordClassifier(TASK_KEYWORDS)
+
+    mismatches = [prompt for prompt in CORPUS if classifier.classify(prompt) != legacy_classify(prompt)]
+    print(f"Regression corpus: {len(CORPUS) - len(mismatches)}/{len(CORPUS)} identical")
+    for prompt in mismatches:
+        print(f"  MISMATCH {prompt[:60]!r}: {legacy_classify(prompt)} -> {classifier.classify(prompt)}")
+    for prompt in BOUNDARY_CHANGES:
+        print(f"  word-start {prompt!r}: {legacy_classify(prompt)} -> {classifier.classify(prompt)}")
+
+    runs = (("short", CORPUS[3], 20000), ("long", LONG_PROMPT, 200), ("pasted code", PASTED_CODE, 200))
+    for name, prompt, number in runs:
+        legacy = timeit.timeit(lambda: legacy_classify(prompt), number=number) / number
+        single_pass = timeit.timeit(lambda: classifier.classify(prompt), number=number) / number
+        print(f"{name} prompt ({len(prompt)} chars): legacy {legacy * 1e6:.1f}us, "
+              f"single pass {single_pass * 1e6:.1f}us, {legacy / single_pass:.1f}x")
+
+    batch = (CORPUS * (10000 // len(CORPUS) + 1))[:10000]
+    if classifier.classify_batch(batch) != [classifier.classify(prompt) for prompt in batch]:
+        print("  MISMATCH between classify_batch and classify")
+        return 1
+    elapsed = timeit.timeit(lambda: classifier.classify_batch(batch), number=5) / 5
+    print(f"batch of {len(batch)} prompts: {elapsed * 1e3:.1f}ms")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
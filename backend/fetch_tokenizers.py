@@ -0,0 +1,76 @@
+"""Provision the local tokenizers used for token accounting.
+
+Downloads ``tokenizer.json`` of each model family from the Hugging Face Hub
+into ``TOKENIZER_DIR/<family>/`` (the server itself never downloads). Gated
+repositories need an access token in ``HF_TOKEN``::
+
+    python fetch_tokenizers.py
+    python fetch_tokenizers.py mistral --source mistral=mistralai/Mixtral-8x7B-v0.1
+
+Restart the server afterwards, it logs the active counter per model on startup.
+"""
+import argparse
+import os
+import sys
+
+from dotenv import load_dotenv
+
+from token_counter import DEFAULT_FAMILY, MODEL_FAMILIES, TOKENIZER_DIR
+
+load_dotenv()
+
+# Hub repositories whose tokenizer.json matches each family
+TOKENIZER_SOURCES = {
+    "llama3": "NousResearch/Meta-Llama-3-8B",
+    "llama2": "NousResearch/Llama-2-7b-hf",
+    "mistral": "mistralai/Mixtral-8x7B-v0.1",
+    "gemma": "google/gemma-7b",
+}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("families", nargs="*", default=[DEFAULT_FAMILY],
+                        help=f"Families to fetch: {', '.join(sorted(set(MODEL_FAMILIES.values())))}")
+    parser.add_argument("--source", action="append", default=[], metavar="FAMILY=REPO",
+                        help="Fetch a family from another Hub repository")
+    parser.add_argument("--output", default=TOKENIZER_DIR)
+    parser.add_argument("--force", action="store_true", help="Replace tokenizers already present")
+    args = parser.parse_args()
+
+    try:
+        from tokenizers import Tokenizer
+    except ImportError:
+        print("The tokenizers package is not installed, see requirements.txt", file=sys.stderr)
+        return 1
+
+    sources = dict(TOKENIZER_SOURCES)
+    for override in args.source:
+        family, _, repo = override.partition("=")
+        sources[family] = repo
+
+    failed = 0
+    for family in args.families:
+        if family not in sources:
+            print(f"{family}: no source repository, pass --source {family}=<repo>", file=sys.stderr)
+            failed += 1
+            continue
+        target = os.path.join(args.output, family, "tokenizer.json")
+        if os.path.exists(target) and not args.force:
+            print(f"{family}: {target} already present")
+            continue
+        try:
+            tokenizer = Tokenizer.from_pretrained(sources[family], auth_token=os.getenv("HF_TOKEN"))
+        except Exception as e:
+            print(f"{family}: download from {sources[family]} failed: {e}", file=sys.stderr)
+            failed += 1
+            continue
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tokenizer.save(target + ".tmp")
+        os.replace(target + ".tmp", target)
+        print(f"{family}: saved {sources[family]} to {target}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,225 @@
+"""Feedback-driven model routing.
+
+For every model and task type the router keeps a window of recent outcomes:
+LLM call latency, errors and final intelligence scores. A task goes to the
+cheapest model whose window meets the task type's SLO (quality, p95 latency
+and error rate). Models without enough evidence fall back to a static
+default, and cheaper unproven models get a small share of traffic so they can
+earn their place. Every decision comes with an explanation of why each
+candidate was taken or passed over.
+"""
+import math
+import random
+from collections import deque
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+DEFAULT_SLO = {"min_score": 0.5, "p95_latency": 15.0, "max_error_rate": 0.05}
+
+
+def histogram_quantile(histogram, q: float, **labels: str) -> Optional[float]:
+    """Quantile of a prometheus_client Histogram, interpolated within buckets like PromQL"""
+    buckets = []
+    for metric in histogram.collect():
+        for sample in metric.samples:
+            if sample.name.endswith("_bucket") and all(sample.labels.get(k) == v for k, v in labels.items()):
+                buckets.append((float(sample.labels["le"]), sample.value))
+    if not buckets:
+        return None
+    buckets.sort()
+    rank = q * buckets[-1][1]
+    if not rank:
+        return None
+    lower, below = 0.0, 0.0
+    for bound, count in buckets:
+        if count >= rank:
+            if math.isinf(bound):
+                return lower
+            return lower + (bound - lower) * (rank - below) / max(count - below, 1e-9)
+        lower, below = bound, count
+    return None
+
+
+def outcome_from_task(task: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Router outcome recorded by a stored task, None if it carries no evidence"""
+    model, task_type = task.get("model_used"), task.get("task_type")
+    if not model or not task_type:
+        return None
+    if task.get("status") == "failed":
+        return {"model": model, "task_type": task_type, "error": True}
+    if task.get("status") != "completed":
+        return None
+    performance = task.get("performance_data") or {}
+    outcome: Dict[str, Any] = {"model": model, "task_type": task_type}
+    # Cache hits and coalesced followers never reached a model, they say nothing about
+    # its errors or latency. processing_time also covers scraping and file processing,
+    # only llm_latency is the model's
+    if not performance.get("cache_hit") and not performance.get("coalesced"):
+        outcome["error"] = False
+        if performance.get("llm_latency") is not None:
+            outcome["latency"] = performance["llm_latency"]
+    if task.get("intelligence_score") is not None and not task.get("intelligence_score_provisional"):
+        outcome["score"] = task["intelligence_score"]
+    return outcome
+
+
+class ModelRouter:
+    """Cheapest-model-meeting-the-SLO router over rolling per model and task type windows"""
+
+    def __init__(self, costs: Dict[str, float], defaults: Dict[str, str], slos: Optional[Dict[str, Dict[str, float]]] = None,
+                 window: int = 200, min_samples: int = 20, explore: float = 0.05,
+                 latency_prior: Optional[Callable[[str], Optional[float]]] = None):
+        self.costs = costs
+        self.defaults = defaults
+        self.slos = slos or {}
+        self.window = window
+        self.min_samples = min_samples
+        self.explore = explore
+        # Model-wide p95 latency, e.g. from the LLM call histogram, vets unproven models
+        self.latency_prior = latency_prior
+        self._outcomes: Dict[Tuple[str, str], Dict[str, deque]] = {}
+
+    def _window(self, model: str, task_type: str) -> Dict[str, deque]:
+        key = (model, task_type)
+        if key not in self._outcomes:
+            self._outcomes[key] = {name: deque(maxlen=self.window) for name in ("latency", "error", "score")}
+        return self._outcomes[key]
+
+    def record(self, model: str, task_type: str, latency: Optional[float] = None, error: Optional[bool] = None,
+               score: Optional[float] = None):
+        """Add an outcome, each part may arrive separately (the final score comes later)"""
+        window = self._window(model, task_type)
+        if latency is not None:
+            window["latency"].append(latency)
+        if error is not None:
+            window["error"].append(error)
+        if score is not None:
+            window["score"].append(score)
+
+    def record_task(self, task: Dict[str, Any]):
+        """Add the outcome of a stored task document"""
+        outcome = outcome_from_task(task)
+        if outcome:
+            self.record(**outcome)
+
+    def slo(self, task_type: str) -> Dict[str, float]:
+        return {**DEFAULT_SLO, **self.slos.get("default", {}), **self.slos.get(task_type, {})}
+
+    def stats(self, model: str, task_type: str) -> Dict[str, Any]:
+        window = self._outcomes.get((model, task_type))
+        latencies = np.fromiter(window["latency"], dtype=np.float64) if window else np.empty(0)
+        errors = window["error"] if window else ()
+        scores = window["score"] if window else ()
+        return {
+            "samples": len(errors),
+            "timed": len(latencies),
+            "scored": len(scores),
+            "p50_latency": round(float(np.percentile(latencies, 50)), 3) if len(latencies) else None,
+            "p95_latency": round(float(np.percentile(latencies, 95)), 3) if len(latencies) else None,
+            "error_rate": round(sum(errors) / len(errors), 4) if errors else None,
+            "avg_score": round(sum(scores) / len(scores), 4) if scores else None
+        }
+
+    def _assess(self, model: str, task_type: str, slo: Dict[str, float]) -> Dict[str, Any]:
+        stats = self.stats(model, task_type)
+        misses, unproven = [], []
+        if stats["samples"] < self.min_samples:
+            unproven.append(f"{stats['samples']}/{self.min_samples} outcomes")
+        elif stats["error_rate"] > slo["max_error_rate"]:
+            misses.append(f"error rate {stats['error_rate']:.1%} > {slo['max_error_rate']:.1%}")
+        if stats["timed"] < self.min_samples:
+            unproven.append(f"{stats['timed']}/{self.min_samples} latencies")
+        elif stats["p95_latency"] > slo["p95_latency"]:
+            misses.append(f"p95 latency {stats['p95_latency']}s > {slo['p95_latency']}s")
+        if stats["scored"] < self.min_samples:
+            unproven.append(f"{stats['scored']}/{self.min_samples} scores")
+        elif stats["avg_score"] < slo["min_score"]:
+            misses.append(f"avg score {stats['avg_score']} < {slo['min_score']}")
+
+        prior = self.latency_prior(model) if self.latency_prior else None
+        if prior is not None:
+            stats["model_p95_latency"] = round(prior, 3)
+        return {
+            "model": model,
+            "cost": self.costs[model],
+            **stats,
+            "meets_slo": not misses and not unproven,
+            "misses": misses,
+            "unproven": unproven,
+            # Worth trying when nothing known rules it out
+            "explorable": not misses and (prior is None or prior <= slo["p95_latency"])
+        }
+
+    def select(self, task_type: str, explore: Optional[float] = None) -> Tuple[str, Dict[str, Any]]:
+        """Model for a task type and the explanation of the decision"""
+        slo = self.slo(task_type)
+        candidates = sorted(
+            (self._assess(model, task_type, slo) for model in self.costs),
+            key=lambda c: (c["cost"], c["p95_latency"] if c["p95_latency"] is not None else math.inf)
+        )
+        chosen = next((c for c in candidates if c["meets_slo"]), None)
+        if chosen:
+            model, reason = chosen["model"], "cheapest model meeting the SLO"
+        else:
+            model = self.defaults.get(task_type, self.defaults["default"])
+            reason = "no model meets the SLO yet, static default"
+
+        # Cheaper models without enough evidence get a share of traffic to gather it
+        cost = self.costs.get(model, math.inf)
+        cheaper = [c for c in candidates if c["cost"] < cost and c["unproven"] and c["explorable"]]
+        if cheaper and random.random() < (self.explore if explore is None else explore):
+            model, reason = cheaper[0]["model"], f"exploring a cheaper model instead of {model}"
+
+        return model, {
+            "model": model,
+            "task_type": task_type,
+            "reason": reason,
+            "slo": slo,
+            "candidates": candidates
+        }
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Current stats and decision of every task type seen so far"""
+        task_types = sorted({task_type for _, task_type in self._outcomes} | set(self.defaults) - {"default"})
+        return {
+            task_type: {
+                "stats": {model: self.stats(model, task_type) for model in self.costs},
+                "decision": self.select(task_type, explore=0.0)[0]
+            }
+            for task_type in task_types
+        }
+
+
+def simulate(router: ModelRouter, history: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """Replay stored tasks oldest first through ``router``.
+
+    Each task is routed with the evidence of the tasks before it, then its
+    recorded outcome is fed back. Returns how routing would have differed
+    from what was actually used and what it would have cost relative to it.
+    """
+    tasks = changed = 0
+    actual_cost = routed_cost = 0.0
+    by_task_type: Dict[str, Dict[str, Dict[str, int]]] = {}
+    for task in history:
+        outcome = outcome_from_task(task)
+        if not outcome:
+            continue
+        model, task_type = outcome["model"], outcome["task_type"]
+        chosen = router.select(task_type, explore=0.0)[0]
+        counts = by_task_type.setdefault(task_type, {"actual": {}, "routed": {}})
+        counts["actual"][model] = counts["actual"].get(model, 0) + 1
+        counts["routed"][chosen] = counts["routed"].get(chosen, 0) + 1
+        tasks += 1
+        changed += chosen != model
+        actual_cost += router.costs.get(model, 0.0)
+        routed_cost += router.costs.get(chosen, 0.0)
+        router.record(**outcome)
+
+    return {
+        "tasks": tasks,
+        "changed_decisions": changed,
+        "relative_cost": round(routed_cost / actual_cost, 4) if actual_cost else None,
+        "by_task_type": by_task_type,
+        "final": router.snapshot()
+    }
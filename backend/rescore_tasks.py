@@ -0,0 +1,153 @@
+"""Re-score stored tasks with the current intelligence scoring heuristics.
+
+Walks ``db.tasks`` in ``_id`` order one batch at a time, scores each batch
+across CPU cores while the next one is read, and writes the scores with
+unordered bulk writes together with ``score_version``. Agents' intelligence
+totals are corrected by the score differences. The last ``_id`` of every
+batch is checkpointed in ``job_checkpoints``, so an interrupted run resumes
+where it stopped::
+
+    python rescore_tasks.py --workers 8 --metrics-port 9108
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional
+
+from dotenv import load_dotenv
+from prometheus_client import Counter, Gauge, start_http_server
+from pymongo import MongoClient, UpdateOne
+
+from scoring import SCORE_VERSION, score_many
+
+load_dotenv()
+
+CHECKPOINT_ID = "rescore_tasks"
+IN_FLIGHT_GRACE = timedelta(hours=1)  # Newer provisional scores are still with the server's scorer
+PROJECTION = {"_id": 1, "agent_id": 1, "response": 1, "task_type": 1, "intelligence_score": 1}
+
+RESCORED_TASKS = Counter('rescore_tasks_total', 'Tasks re-scored by the backfill')
+RESCORE_THROUGHPUT = Gauge('rescore_tasks_per_second', 'Backfill throughput over the last batch')
+RESCORE_REMAINING = Gauge('rescore_remaining_tasks', 'Tasks left to re-score')
+
+
+def agent_update(correction: float) -> List[Dict[str, Any]]:
+    """Pipeline update adding a score correction to an agent's total and average"""
+    total_tasks = {"$max": [1, {"$ifNull": ["$performance_metrics.total_tasks", 0]}]}
+    return [
+        {"$set": {"performance_metrics.total_intelligence_score": {"$add": [
+            # Agents written before counters existed start from their average times count
+            {"$ifNull": ["$performance_metrics.total_intelligence_score",
+                         {"$multiply": [{"$ifNull": ["$intelligence_score", 0]}, total_tasks]}]},
+            correction
+        ]}}},
+        {"$set": {"intelligence_score": {"$divide": ["$performance_metrics.total_intelligence_score", total_tasks]}}}
+    ]
+
+
+def batches(db, query: Dict[str, Any], start_after: Optional[Any], batch_size: int) -> Iterator[List[Dict[str, Any]]]:
+    """Key-set pagination over ``_id``, only one batch is held at a time"""
+    last_id = start_after
+    while True:
+        page_query = {**query, "_id": {"$gt": last_id}} if last_id is not None else query
+        batch = list(db.tasks.find(page_query, PROJECTION).sort("_id", 1).limit(batch_size))
+        if not batch:
+            return
+        yield batch
+        last_id = batch[-1]["_id"]
+
+
+def write_batch(db, batch: List[Dict[str, Any]], scores: List[float], update_agents: bool):
+    db.tasks.bulk_write([
+        UpdateOne({"_id": task["_id"]}, {"$set": {
+            "intelligence_score": score,
+            "intelligence_score_provisional": False,
+            "score_version": SCORE_VERSION
+        }})
+        for task, score in zip(batch, scores)
+    ], ordered=False)
+
+    if update_agents:
+        corrections: Dict[str, float] = defaultdict(float)
+        for task, score in zip(batch, scores):
+            corrections[task.get("agent_id")] += score - (task.get("intelligence_score") or 0.0)
+        updates = [UpdateOne({"id": agent_id}, agent_update(correction))
+                   for agent_id, correction in corrections.items() if agent_id and correction]
+        if updates:
+            db.agents.bulk_write(updates, ordered=False)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Scoring processes")
+    parser.add_argument("--force", action="store_true", help=f"Also re-score tasks already at version {SCORE_VERSION}")
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and start from the first task")
+    parser.add_argument("--no-agents", dest="update_agents", action="store_false", help="Leave agent totals alone")
+    parser.add_argument("--metrics-port", type=int, default=0, help="Serve Prometheus progress metrics on this port")
+    args = parser.parse_args()
+
+    db = MongoClient(os.getenv("MONGO_URL")).agentic_ai
+    query: Dict[str, Any] = {
+        "status": "completed",
+        "response": {"$ne": None},
+        "$or": [
+            {"intelligence_score_provisional": {"$ne": True}},
+            {"completed_at": {"$lt": datetime.utcnow() - IN_FLIGHT_GRACE}}
+        ]
+    }
+    if not args.force:
+        query["score_version"] = {"$ne": SCORE_VERSION}
+
+    checkpoint = db.job_checkpoints.find_one({"_id": CHECKPOINT_ID})
+    start_after, processed = None, 0
+    if checkpoint and checkpoint.get("score_version") == SCORE_VERSION and not args.restart:
+        start_after, processed = checkpoint["last_id"], checkpoint.get("processed", 0)
+        print(f"Resuming after {start_after}, {processed} tasks already re-scored")
+
+    if args.metrics_port:
+        start_http_server(args.metrics_port)
+    remaining = db.tasks.count_documents({**query, "_id": {"$gt": start_after}} if start_after else query)
+    RESCORE_REMAINING.set(remaining)
+    print(f"{remaining} tasks to re-score with version {SCORE_VERSION} on {args.workers} workers")
+
+    started, session = time.time(), 0
+    with multiprocessing.get_context("spawn").Pool(args.workers) as pool:
+        pages = batches(db, query, start_after, args.batch_size)
+        batch = next(pages, None)
+        while batch:
+            batch_started = time.time()
+            items = [(task.get("response"), task.get("task_type")) for task in batch]
+            chunk = max(1, len(items) // (args.workers * 4))
+            scoring = pool.map_async(score_many, [items[i:i + chunk] for i in range(0, len(items), chunk)])
+            next_batch = next(pages, None)  # Read ahead while the pool scores
+            scores = [score for part in scoring.get() for score in part]
+
+            write_batch(db, batch, scores, args.update_agents)
+            processed += len(batch)
+            session += len(batch)
+            remaining = max(0, remaining - len(batch))
+            db.job_checkpoints.update_one({"_id": CHECKPOINT_ID}, {"$set": {
+                "last_id": batch[-1]["_id"],
+                "score_version": SCORE_VERSION,
+                "processed": processed,
+                "updated_at": datetime.utcnow()
+            }}, upsert=True)
+
+            RESCORED_TASKS.inc(len(batch))
+            RESCORE_THROUGHPUT.set(len(batch) / max(time.time() - batch_started, 1e-9))
+            RESCORE_REMAINING.set(remaining)
+            rate = session / max(time.time() - started, 1e-9)
+            print(f"{processed} re-scored, {rate:.0f} tasks/s, {remaining} left", flush=True)
+            batch = next_batch
+
+    print(f"Done: {processed} tasks at score version {SCORE_VERSION}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
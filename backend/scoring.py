@@ -0,0 +1,70 @@
+"""Intelligence scoring of task responses.
+
+Everything but readability is a cheap scan of the response and is available
+right away as a provisional score. Readability (textstat's syllable counting)
+grows with the response length, so the final score is computed off the
+request path in worker processes.
+"""
+from typing import List, Tuple
+
+from textstat import flesch_reading_ease
+
+# Bump whenever the heuristics below change, rescore_tasks.py then re-scores
+# every task stored with another version
+SCORE_VERSION = 1
+
+
+def provisional_intelligence_score(response: str, task_type: str) -> float:
+    """Intelligence score without the readability component"""
+    score = 0.0
+
+    # Length and structure scoring
+    word_count = len(response.split())
+    if 50 <= word_count <= 300:
+        score += 0.3
+    elif word_count > 300:
+        score += 0.2
+
+    # Content quality indicators
+    if task_type == "creative_tasks":
+        if any(word in response.lower() for word in ["creative", "innovative", "unique", "original"]):
+            score += 0.3
+    elif task_type == "analysis_tasks":
+        if any(word in response.lower() for word in ["analysis", "conclusion", "insight", "recommendation"]):
+            score += 0.3
+    elif task_type == "coding_tasks":
+        if "```" in response or any(word in response for word in ["function", "class", "import"]):
+            score += 0.3
+
+    # Completeness score
+    if response.strip().endswith(('.', '!', '?')):
+        score += 0.1
+
+    # Structure scoring
+    if '\n' in response:  # Multi-line structure
+        score += 0.1
+
+    return min(score, 1.0)  # Cap at 1.0
+
+
+def readability_score(response: str) -> float:
+    """Readability component of the intelligence score"""
+    try:
+        readability = flesch_reading_ease(response)
+        if 60 <= readability <= 80:  # Good readability
+            return 0.2
+        elif readability > 40:
+            return 0.1
+    except Exception:
+        pass
+    return 0.0
+
+
+def calculate_intelligence_score(response: str, task_type: str) -> float:
+    """Calculate AI response intelligence score"""
+    return min(provisional_intelligence_score(response, task_type) + readability_score(response), 1.0)
+
+
+def score_many(items: List[Tuple[str, str]]) -> List[float]:
+    """Final scores of ``(response, task_type)`` pairs, one process pool job per chunk"""
+    return [calculate_intelligence_score(response or "", task_type) for response, task_type in items]
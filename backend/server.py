@@ -1,8 +1,10 @@
 from fastapi import FastAPI, HTTPException, UploadFile, File, Request, BackgroundTasks, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
-from pydantic import BaseModel
-from typing import List, Optional, Dict, Any, Union
+from pymongo import ReturnDocument, UpdateOne, WriteConcern
+from pymongo.errors import DuplicateKeyError
+from pydantic import BaseModel, Field
+from typing import List, Optional, Dict, Any, Set, Tuple, Union
 import os
 from dotenv import load_dotenv
 import uuid
@@ -10,7 +12,9 @@ from datetime import datetime, timedelta
 import re
 import json
 import asyncio
-from groq import Groq
+from groq import AsyncGroq
+from groq.types.chat import ChatCompletion
+from groq.types.chat.chat_completion import Choice as ChatCompletionChoice, ChoiceLogprobs, ChoiceMessage
 import redis.asyncio as redis
 import httpx
 from bs4 import BeautifulSoup
@@ -21,21 +25,33 @@ from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 from slowapi.middleware import SlowAPIMiddleware
-from prometheus_client import Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client import Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
 from fastapi.responses import Response, StreamingResponse
 import psutil
 import time
 import hashlib
+import zlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 import nltk
-from textstat import flesch_reading_ease
 import base64
 from PIL import Image
 import io
 import magic
 from contextlib import asynccontextmanager
 from functools import wraps
+from collections import OrderedDict, deque
+from itertools import islice
 import logging
-from circuitbreaker import circuit
+from circuitbreaker import CircuitBreaker, CircuitBreakerError
+from vector_memory import VectorMemoryIndex
+from archive import naive_utc, read_archive, write_archive
+from task_classifier import FALLBACK_TASK_TYPE, KeywordClassifier
+from task_model import NaiveBayesTaskModel
+from model_router import ModelRouter, histogram_quantile, simulate
+from scoring import SCORE_VERSION, calculate_intelligence_score, provisional_intelligence_score
+from token_counter import TOKENS_PER_REQUEST, active_counter, count_message_tokens, count_tokens, message_tokens, usage_tokens
+from groq import APIStatusError, RateLimitError
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -48,28 +64,554 @@ REQUEST_COUNT = Counter('requests_total', 'Total requests', ['method', 'endpoint
 REQUEST_DURATION = Histogram('request_duration_seconds', 'Request duration')
 TASK_COUNT = Counter('tasks_total', 'Total tasks', ['status', 'model'])
 AI_INTELLIGENCE_SCORE = Histogram('ai_intelligence_score', 'AI response intelligence score')
-MEMORY_EFFICIENCY = Histogram('memory_efficiency', 'Conversation memory efficiency')
 ERROR_RATE = Counter('errors_total', 'Total errors', ['type', 'endpoint'])
+TIME_TO_FIRST_TOKEN = Histogram('time_to_first_token_seconds', 'Time until the first streamed token', ['model'])
+COMPLETION_CACHE_HITS = Counter('llm_completion_cache_hits_total', 'LLM completion cache hits', ['tier'])
+COMPLETION_CACHE_MISSES = Counter('llm_completion_cache_misses_total', 'LLM completion cache misses')
+TASK_QUEUE_WAIT = Histogram('task_queue_wait_seconds', 'Time queued tasks wait for a worker')
+SINGLE_FLIGHT_COALESCED = Counter('task_executions_coalesced_total', 'Task executions served by an identical in-flight execution', ['scope'])
+ADMISSION_QUEUE_DEPTH = Gauge('llm_admission_queue_depth', 'LLM calls waiting for model quota', ['model'])
+ADMISSION_WAIT = Histogram('llm_admission_wait_seconds', 'Time LLM calls wait for model quota', ['model'])
+# purpose "task" are the completions answering users, what routing latency priors are based on
+LLM_CALL_LATENCY = Histogram('llm_call_latency_seconds', 'Latency of successful LLM calls', ['model', 'purpose'])
+HEDGED_REQUESTS = Counter('llm_hedged_requests_total', 'Backup LLM requests sent for slow calls', ['model'])
+HEDGE_WINS = Counter('llm_hedge_wins_total', 'Hedged LLM requests that finished before the primary', ['model'])
+MEMORY_RECALL_LATENCY = Histogram('agent_memory_recall_seconds', 'Time to retrieve relevant past tasks for a prompt')
+AGENT_CACHE_HITS = Counter('agent_config_cache_hits_total', 'Agent configs served from the in-process cache')
+AGENT_CACHE_MISSES = Counter('agent_config_cache_misses_total', 'Agent configs loaded from MongoDB')
+AGENT_METRICS_FLUSH_SIZE = Histogram('agent_metrics_flush_tasks', 'Completed tasks folded into one agent metrics flush', buckets=(1, 5, 10, 25, 50, 100, 250, 500))
+ARCHIVED_RECORDS = Counter('archived_records_total', 'Records moved from MongoDB to the cold archive', ['collection'])
+TASK_CLASSIFICATIONS = Counter('task_classifications_total', 'Prompts classified, by the classifier that decided', ['source'])
+INTELLIGENCE_SCORING_LAG = Histogram('intelligence_scoring_lag_seconds', 'Time from task completion to its final intelligence score')
+MODEL_FALLBACKS = Counter('llm_model_fallbacks_total', 'LLM calls served by a fallback model', ['from_model', 'to_model', 'reason'])
 
-# Circuit breaker configuration
-@circuit(failure_threshold=5, recovery_timeout=30)
-async def groq_api_call(client, messages, model, **kwargs):
-    """Circuit breaker for Groq API calls"""
-    return client.chat.completions.create(
-        messages=messages,
-        model=model,
-        **kwargs
+# Async LLM client configuration
+GROQ_REQUEST_TIMEOUT = float(os.getenv("GROQ_REQUEST_TIMEOUT", "60"))
+GROQ_CONNECT_TIMEOUT = float(os.getenv("GROQ_CONNECT_TIMEOUT", "5"))
+GROQ_MAX_CONNECTIONS = int(os.getenv("GROQ_MAX_CONNECTIONS", "256"))
+GROQ_MAX_KEEPALIVE = int(os.getenv("GROQ_MAX_KEEPALIVE", "64"))
+GROQ_MAX_CONCURRENCY = int(os.getenv("GROQ_MAX_CONCURRENCY", "256"))
+
+# Per-model Groq quotas (requests and tokens per minute), override with a JSON env var
+GROQ_MODEL_LIMITS = json.loads(os.getenv("GROQ_MODEL_LIMITS", "null")) or {
+    "llama-3.1-8b-instant": {"rpm": 30, "tpm": 20000},
+    "llama3-70b-8192": {"rpm": 30, "tpm": 6000},
+    "llama-3.3-70b-versatile": {"rpm": 30, "tpm": 12000}
+}
+# Fallback chains tried in order when a model's circuit is open, its quota is
+# exhausted or the call fails, override with a JSON env var
+MODEL_FALLBACK_CHAINS = json.loads(os.getenv("MODEL_FALLBACK_CHAINS", "null")) or {
+    "llama-3.3-70b-versatile": ["llama3-70b-8192", "llama-3.1-8b-instant"],
+    "llama3-70b-8192": ["llama-3.3-70b-versatile", "llama-3.1-8b-instant"],
+    "llama-3.1-8b-instant": []
+}
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RECOVERY_TIMEOUT = int(os.getenv("CIRCUIT_RECOVERY_TIMEOUT", "30"))
+ADMISSION_REROUTE_AFTER = float(os.getenv("ADMISSION_REROUTE_AFTER", "2"))
+ADMISSION_MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", "30"))
+
+# Hedging of slow LLM calls per task type; "sibling" sends the backup to the
+# next model of the fallback chain instead of the same model
+HEDGE_POLICIES = json.loads(os.getenv("HEDGE_POLICIES", "null")) or {
+    "conversation": {"enabled": True, "sibling": False},
+    "fast_responses": {"enabled": True, "sibling": False},
+    "analysis_tasks": {"enabled": True, "sibling": True},
+    "reasoning": {"enabled": True, "sibling": True},
+    "default": {"enabled": False, "sibling": False}
+}
+HEDGE_BUDGET_RATIO = float(os.getenv("HEDGE_BUDGET_RATIO", "0.05"))  # Max extra load
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+
+class AsyncCircuitBreaker(CircuitBreaker):
+    """Circuit breaker usable around awaited calls via ``async with``"""
+
+    async def __aenter__(self):
+        if self.opened:
+            raise CircuitBreakerError(self)
+        return None
+
+    async def __aexit__(self, exc_type, exc_value, _traceback):
+        # A cancelled call says nothing about upstream health, quota rejections are
+        # admission control's business and a rejected request (4xx) is the caller's
+        # fault: all must leave the breaker state alone, passing them on would count
+        # them as successes that reset the failure count
+        if exc_type is not None and (issubclass(exc_type, (asyncio.CancelledError, GeneratorExit, RateLimitError))
+                                     or is_client_error(exc_value)):
+            return False
+        return self.__exit__(exc_type, exc_value, _traceback)
+
+def is_client_error(exc: BaseException) -> bool:
+    """A 4xx other than 429: the request itself is at fault and fails on every model"""
+    return isinstance(exc, APIStatusError) and 400 <= exc.status_code < 500 and exc.status_code != 429
+
+def is_upstream_failure(exc_type, exc_value) -> bool:
+    """Quota rejections are handled by admission control and a rejected request
+    says nothing about the model, neither counts against the breaker"""
+    return (issubclass(exc_type, Exception)
+            and not issubclass(exc_type, RateLimitError)
+            and not is_client_error(exc_value))
+
+# Circuit breaker configuration, one breaker per model
+model_circuit_breakers: Dict[str, AsyncCircuitBreaker] = {}
+
+def get_model_breaker(model: str) -> AsyncCircuitBreaker:
+    """Circuit breaker guarding calls to one model"""
+    breaker = model_circuit_breakers.get(model)
+    if breaker is None:
+        breaker = AsyncCircuitBreaker(
+            failure_threshold=CIRCUIT_FAILURE_THRESHOLD,
+            recovery_timeout=CIRCUIT_RECOVERY_TIMEOUT,
+            name=f"groq_api:{model}",
+            expected_exception=is_upstream_failure
+        )
+        model_circuit_breakers[model] = breaker
+    return breaker
+
+groq_call_semaphore = asyncio.Semaphore(GROQ_MAX_CONCURRENCY)
+
+# Per-model admission control against Groq request/token quotas
+class TokenBucket:
+    """Continuously refilled token bucket"""
+    
+    def __init__(self, capacity: float, refill_per_second: float):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.level = capacity
+        self.updated = time.monotonic()
+    
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.refill_per_second)
+        self.updated = now
+    
+    def wait_time(self, amount: float) -> float:
+        """Seconds until ``amount`` can be taken"""
+        self._refill()
+        deficit = min(amount, self.capacity) - self.level
+        return max(0.0, deficit / self.refill_per_second)
+    
+    def take(self, amount: float):
+        self._refill()
+        self.level -= min(amount, self.capacity)
+    
+    def adjust(self, delta: float):
+        self._refill()
+        self.level = min(self.capacity, self.level + delta)
+    
+    def drain(self):
+        self._refill()
+        self.level = min(self.level, 0.0)
+
+class ModelAdmissionController:
+    """Admit LLM calls through per-model RPM/TPM token buckets.
+    
+    Calls over quota wait in a FIFO queue per model; the router uses
+    wait_time() to send work to a fallback model with spare quota instead.
+    """
+    
+    def __init__(self, limits: Dict[str, Dict[str, int]], max_wait: float):
+        self.max_wait = max_wait
+        self._buckets = {
+            model: (
+                TokenBucket(limit["rpm"], limit["rpm"] / 60.0),
+                TokenBucket(limit["tpm"], limit["tpm"] / 60.0)
+            )
+            for model, limit in limits.items()
+        }
+        self._queues: Dict[str, asyncio.Lock] = {}
+    
+    def wait_time(self, model: str, tokens: int) -> float:
+        """Seconds until a call of ``tokens`` to ``model`` would be admitted"""
+        buckets = self._buckets.get(model)
+        if not buckets:
+            return 0.0
+        requests_bucket, tokens_bucket = buckets
+        return max(requests_bucket.wait_time(1), tokens_bucket.wait_time(tokens))
+    
+    def _take(self, model: str, tokens: int):
+        buckets = self._buckets.get(model)
+        if buckets:
+            buckets[0].take(1)
+            buckets[1].take(tokens)
+    
+    async def acquire(self, model: str, tokens: int):
+        """Wait until the model has quota for the call"""
+        if model not in self._buckets:
+            return
+        
+        queue = self._queues.setdefault(model, asyncio.Lock())
+        start = time.monotonic()
+        ADMISSION_QUEUE_DEPTH.labels(model=model).inc()
+        try:
+            # asyncio.Lock wakes waiters in FIFO order
+            async with queue:
+                while True:
+                    wait = self.wait_time(model, tokens)
+                    remaining = self.max_wait - (time.monotonic() - start)
+                    if wait <= 0:
+                        break
+                    if remaining <= 0:
+                        logger.warning(f"Admission wait for {model} exceeded {self.max_wait}s, sending anyway")
+                        break
+                    await asyncio.sleep(min(wait, remaining))
+                self._take(model, tokens)
+        finally:
+            ADMISSION_QUEUE_DEPTH.labels(model=model).dec()
+            ADMISSION_WAIT.labels(model=model).observe(time.monotonic() - start)
+    
+    def reconcile(self, model: str, estimated_tokens: int, actual_tokens: Optional[int]):
+        """Correct the token bucket once the real usage is known"""
+        buckets = self._buckets.get(model)
+        if buckets and actual_tokens is not None:
+            buckets[1].adjust(estimated_tokens - actual_tokens)
+    
+    def penalize(self, model: str):
+        """Back off after an upstream 429"""
+        buckets = self._buckets.get(model)
+        if buckets:
+            buckets[0].drain()
+            buckets[1].drain()
+
+def estimate_request_tokens(messages: List[Dict], model: str, max_tokens: Optional[int], prompt_tokens: Optional[int] = None) -> int:
+    """Prompt tokens plus the completion allowance, as charged for admission"""
+    if prompt_tokens is None:
+        prompt_tokens = count_message_tokens(messages, model)
+    return prompt_tokens + (max_tokens or 0)
+
+model_admission = ModelAdmissionController(GROQ_MODEL_LIMITS, ADMISSION_MAX_WAIT)
+
+async def groq_api_call(client, messages, model, prompt_tokens: Optional[int] = None, purpose: str = "internal", **kwargs):
+    """Non-blocking Groq API call behind admission control and the model's circuit breaker.
+    
+    Callers that already counted the prompt pass ``prompt_tokens`` to skip recounting.
+    """
+    response, _ = await timed_groq_api_call(client, messages, model, prompt_tokens, purpose, **kwargs)
+    return response
+
+async def timed_groq_api_call(client, messages, model, prompt_tokens: Optional[int] = None, purpose: str = "internal", **kwargs) -> tuple[Any, float]:
+    """groq_api_call also returning the call's own latency, admission and concurrency waits excluded"""
+    estimated_tokens = estimate_request_tokens(messages, model, kwargs.get("max_tokens"), prompt_tokens)
+    await model_admission.acquire(model, estimated_tokens)
+    async with groq_call_semaphore:
+        start_time = time.monotonic()
+        try:
+            async with get_model_breaker(model):
+                try:
+                    response = await asyncio.wait_for(
+                        client.chat.completions.create(
+                            messages=messages,
+                            model=model,
+                            **kwargs
+                        ),
+                        timeout=GROQ_REQUEST_TIMEOUT
+                    )
+                except asyncio.TimeoutError:
+                    # Censored at the upstream timeout, the real latency was at least that
+                    if purpose == "task":
+                        latency_tracker.record(model, time.monotonic() - start_time)
+                    raise
+        except RateLimitError:
+            model_admission.penalize(model)
+            raise
+        latency = time.monotonic() - start_time
+    
+    # Hedge delays follow task completions only, 1-token health probes would drag the p95 down
+    if purpose == "task":
+        latency_tracker.record(model, latency)
+    LLM_CALL_LATENCY.labels(model=model, purpose=purpose).observe(latency)
+    usage = usage_tokens(response)
+    model_admission.reconcile(model, estimated_tokens, usage["total_tokens"] if usage else None)
+    return response, latency
+
+# Tail-latency hedging
+class LatencyTracker:
+    """Rolling window of recent task completion latencies per model.
+    
+    Calls cut short (timed out, or cancelled after losing to a hedge) are
+    recorded at their elapsed time, a lower bound of their latency. Leaving
+    them out would bias the percentiles toward the calls fast enough to finish.
+    """
+    
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._samples: Dict[str, deque] = {}
+    
+    def record(self, model: str, latency: float):
+        self._samples.setdefault(model, deque(maxlen=self.window)).append(latency)
+    
+    def percentile(self, model: str, quantile: float, min_samples: int = 1) -> Optional[float]:
+        samples = self._samples.get(model)
+        if not samples or len(samples) < min_samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(quantile * len(ordered)))]
+
+class HedgeBudget:
+    """Caps hedged requests to a fraction of primary calls"""
+    
+    def __init__(self, ratio: float, burst: float = 10.0):
+        self.ratio = ratio
+        self.burst = burst
+        self.credit = burst
+    
+    def record_call(self):
+        self.credit = min(self.burst, self.credit + self.ratio)
+    
+    def try_spend(self) -> bool:
+        if self.credit >= 1.0:
+            self.credit -= 1.0
+            return True
+        return False
+
+latency_tracker = LatencyTracker()
+hedge_budget = HedgeBudget(HEDGE_BUDGET_RATIO)
+
+def hedge_policy(task_type: Optional[str]) -> Dict[str, Any]:
+    """Hedging policy configured for a task type"""
+    return HEDGE_POLICIES.get(task_type or "default", HEDGE_POLICIES["default"])
+
+def hedge_target(model: str, estimated_tokens: int, use_sibling: bool) -> Optional[str]:
+    """Model for a hedge that can be sent right away, if any"""
+    candidates = model_candidates(model)[1:] + [model] if use_sibling else [model]
+    for candidate in candidates:
+        if not get_model_breaker(candidate).opened and model_admission.wait_time(candidate, estimated_tokens) == 0:
+            return candidate
+    return None
+
+async def hedged_groq_api_call(client, messages, model, policy: Dict[str, Any], prompt_tokens: Optional[int] = None, **kwargs) -> tuple[Any, str, bool, float]:
+    """groq_api_call that sends a backup request once the primary runs past the model's p95.
+    
+    Returns the response, the model that produced it, whether a hedge was sent
+    and the latency of the call that produced it.
+    """
+    hedge_budget.record_call()
+    if prompt_tokens is None:
+        prompt_tokens = count_message_tokens(messages, model)
+    primary_started = time.monotonic()
+    primary = asyncio.ensure_future(timed_groq_api_call(client, messages, model, prompt_tokens=prompt_tokens, **kwargs))
+    delay = latency_tracker.percentile(model, 0.95, min_samples=HEDGE_MIN_SAMPLES)
+    if not policy.get("enabled") or delay is None:
+        response, latency = await primary
+        return response, model, False, latency
+    
+    pending = {primary}
+    try:
+        done, _ = await asyncio.wait(pending, timeout=delay)
+        if done:
+            response, latency = primary.result()
+            return response, model, False, latency
+        
+        estimated_tokens = estimate_request_tokens(messages, model, kwargs.get("max_tokens"), prompt_tokens)
+        target = hedge_target(model, estimated_tokens, policy.get("sibling", False))
+        if target is None or not hedge_budget.try_spend():
+            response, latency = await primary
+            return response, model, False, latency
+        
+        HEDGED_REQUESTS.labels(model=model).inc()
+        hedge = asyncio.ensure_future(timed_groq_api_call(client, messages, target, prompt_tokens=prompt_tokens, **kwargs))
+        launched = {primary: (model, primary_started), hedge: (target, time.monotonic())}
+        pending = {primary, hedge}
+        first_error: Optional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for finished in done:
+                if finished.exception() is None:
+                    if finished is hedge:
+                        HEDGE_WINS.labels(model=model).inc()
+                    # The loser is cancelled below, record how long it had run as a censored sample
+                    if kwargs.get("purpose") == "task":
+                        for loser in pending:
+                            loser_model, started = launched[loser]
+                            latency_tracker.record(loser_model, time.monotonic() - started)
+                    response, latency = finished.result()
+                    return response, launched[finished][0], True, latency
+                first_error = first_error or finished.exception()
+        raise first_error
+    finally:
+        # Cancel the slower request, or both if our caller went away
+        for task in pending:
+            task.cancel()
+
+def model_candidates(model: str) -> List[str]:
+    """The requested model followed by its fallback chain"""
+    return [model] + [fallback for fallback in MODEL_FALLBACK_CHAINS.get(model, []) if fallback != model]
+
+def first_available_model(model: str) -> tuple[str, Optional[str]]:
+    """First model of the chain whose circuit is not open, with the reason for skipping"""
+    for candidate in model_candidates(model):
+        if not get_model_breaker(candidate).opened:
+            return candidate, None if candidate == model else "circuit_open"
+    return model, None
+
+async def routed_groq_api_call(client, messages, model, task_type: Optional[str] = None, prompt_tokens: Optional[int] = None, **kwargs) -> tuple[Any, Dict[str, Any]]:
+    """groq_api_call walking the model's fallback chain.
+    
+    Models with an open circuit are skipped, a model whose quota wait is long
+    is passed over when a later model has quota now, and failed calls move on
+    to the next model, except for rejected requests (4xx other than 429).
+    Slow calls are hedged per the task type's policy.
+    Returns the response and a record of the routing, with the latency of
+    the call that served it alone, failed attempts and waits excluded.
+    """
+    policy = hedge_policy(task_type)
+    candidates = model_candidates(model)
+    # Counted once for the whole chain, the fallback models share a tokenizer family
+    if prompt_tokens is None:
+        prompt_tokens = count_message_tokens(messages, model)
+    estimated_tokens = estimate_request_tokens(messages, model, kwargs.get("max_tokens"), prompt_tokens)
+    attempts = []
+    last_error: Optional[Exception] = None
+    
+    for index, candidate in enumerate(candidates):
+        if get_model_breaker(candidate).opened:
+            attempts.append({"model": candidate, "outcome": "circuit_open"})
+            continue
+        
+        later = [m for m in candidates[index + 1:] if not get_model_breaker(m).opened]
+        if (model_admission.wait_time(candidate, estimated_tokens) > ADMISSION_REROUTE_AFTER
+                and any(model_admission.wait_time(m, estimated_tokens) == 0 for m in later)):
+            attempts.append({"model": candidate, "outcome": "quota_exhausted"})
+            continue
+        
+        try:
+            response, served_by, hedged, latency = await hedged_groq_api_call(client, messages, candidate, policy, prompt_tokens, **kwargs)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if is_client_error(e):
+                raise
+            attempts.append({"model": candidate, "outcome": "error", "error": str(e)[:200]})
+            last_error = e
+            continue
+        
+        if served_by != candidate:
+            attempts.append({"model": candidate, "outcome": "slow_response"})
+        attempts.append({"model": served_by, "outcome": "served", "hedged": hedged})
+        candidate = served_by
+        reason = attempts[0]["outcome"] if candidate != model else None
+        if reason:
+            MODEL_FALLBACKS.labels(from_model=model, to_model=candidate, reason=reason).inc()
+        return response, {
+            "requested_model": model,
+            "served_model": candidate,
+            "fallback_reason": reason,
+            "attempts": attempts,
+            "latency": latency
+        }
+    
+    if last_error is not None:
+        raise last_error
+    raise CircuitBreakerError(get_model_breaker(model))
+
+async def groq_api_stream(client, messages, model, timeout: Optional[float] = None, prompt_tokens: Optional[int] = None,
+                          timing: Optional[Dict[str, float]] = None, **kwargs):
+    """Stream completion tokens from Groq behind admission control and the model's circuit breaker.
+    
+    A ``timing`` dict receives the stream's ``latency``, admission and concurrency waits excluded.
+    """
+    chunk_timeout = timeout or GROQ_REQUEST_TIMEOUT
+    if prompt_tokens is None:
+        prompt_tokens = count_message_tokens(messages, model)
+    estimated_tokens = estimate_request_tokens(messages, model, kwargs.get("max_tokens"), prompt_tokens)
+    await model_admission.acquire(model, estimated_tokens)
+    streamed = []
+    async with groq_call_semaphore:
+        start_time = time.monotonic()
+        try:
+            async with get_model_breaker(model):
+                stream = await asyncio.wait_for(
+                    client.chat.completions.create(
+                        messages=messages,
+                        model=model,
+                        stream=True,
+                        **kwargs
+                    ),
+                    timeout=chunk_timeout
+                )
+                try:
+                    while True:
+                        try:
+                            chunk = await asyncio.wait_for(stream.__anext__(), timeout=chunk_timeout)
+                        except StopAsyncIteration:
+                            break
+                        if chunk.choices and chunk.choices[0].delta.content:
+                            streamed.append(chunk.choices[0].delta.content)
+                            yield chunk.choices[0].delta.content
+                finally:
+                    await stream.response.aclose()
+        except RateLimitError:
+            model_admission.penalize(model)
+            raise
+        if timing is not None:
+            timing["latency"] = time.monotonic() - start_time
+    
+    model_admission.reconcile(
+        model, estimated_tokens, prompt_tokens + count_tokens("".join(streamed), model)
     )
 
+async def replay_completion(content: str):
+    """Replay an already complete response as a single token"""
+    yield content
+
+def ndjson_event(payload: Dict[str, Any]) -> str:
+    """Serialize one NDJSON stream event"""
+    return json.dumps(payload, default=str) + "\n"
+
+async def ndjson_export(records, compress: bool = False, chunk_records: int = 500):
+    """Encode records as NDJSON chunks, gzip-compressed on the fly when asked"""
+    compressor = zlib.compressobj(wbits=31) if compress else None  # wbits=31 writes a gzip container
+    buffer = []
+    
+    def encode(final: bool = False) -> bytes:
+        chunk = "".join(buffer).encode()
+        buffer.clear()
+        if not compressor:
+            return chunk
+        # Sync-flush each chunk so clients can decode while the export runs
+        return compressor.compress(chunk) + compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+    
+    async for record in records:
+        buffer.append(ndjson_event(record))
+        if len(buffer) >= chunk_records:
+            yield encode()
+    yield encode(final=True)
+
+def export_response(records, filename: str, compress: bool = False) -> StreamingResponse:
+    """Stream records from a cursor as an NDJSON download, a .gz file itself when compressed"""
+    headers = {
+        "Content-Disposition": f'attachment; filename="{filename}"',
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    }
+    # Not Content-Encoding: clients would decompress it and save plain NDJSON under the .gz name
+    media_type = "application/gzip" if compress else "application/x-ndjson"
+    return StreamingResponse(ndjson_export(records, compress), media_type=media_type, headers=headers)
+
 # Enhanced lifespan manager
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     await init_database()
+    for model in sorted(GROQ_MODEL_LIMITS):
+        logger.info(f"Token counting for {model}: {active_counter(model)}")
+    await bootstrap_model_router()
     await download_nltk_data()
     await warm_up_services()
+    await task_worker_pool.start()
+    await rolling_summarizer.start()
+    await agent_cache.start()
+    await agent_metrics.start()
+    await intelligence_scorer.start()
+    if ARCHIVE_ENABLED:
+        await archival_job.start()
     yield
     # Shutdown
+    await archival_job.stop()
+    await intelligence_scorer.stop()
+    await agent_metrics.stop()
+    await agent_cache.stop()
+    await rolling_summarizer.stop()
+    await task_worker_pool.stop()
     await cleanup_resources()
 
 app = FastAPI(
@@ -108,6 +650,17 @@ client = AsyncIOMotorClient(
 )
 db = client.agentic_ai
 
+# Write concern per collection for task lifecycle writes, e.g. {"tasks": {"w": 1, "j": false}}
+COLLECTION_WRITE_CONCERNS = {
+    name: WriteConcern(**concern)
+    for name, concern in json.loads(os.getenv("MONGO_WRITE_CONCERNS", "{}")).items()
+}
+
+def write_collection(name: str):
+    """Collection handle carrying the configured write concern of ``name``"""
+    concern = COLLECTION_WRITE_CONCERNS.get(name)
+    return db.get_collection(name, write_concern=concern) if concern else db[name]
+
 # Enhanced Redis configuration
 redis_client = None
 redis_cluster_clients = []
@@ -131,10 +684,18 @@ async def get_redis():
             redis_client = None
     return redis_client
 
-# Enhanced Groq client with retry logic
-groq_client = Groq(
+# Async Groq client with its own connection pool
+groq_http_client = httpx.AsyncClient(
+    limits=httpx.Limits(
+        max_connections=GROQ_MAX_CONNECTIONS,
+        max_keepalive_connections=GROQ_MAX_KEEPALIVE
+    ),
+    timeout=httpx.Timeout(GROQ_REQUEST_TIMEOUT, connect=GROQ_CONNECT_TIMEOUT)
+)
+groq_client = AsyncGroq(
     api_key=os.getenv("GROQ_API_KEY"),
-    base_url=os.getenv("GROQ_BASE_URL", "https://api.groq.com")
+    base_url=os.getenv("GROQ_BASE_URL", "https://api.groq.com"),
+    http_client=groq_http_client
 )
 
 # Advanced Model Selection Configuration for 2025
@@ -151,6 +712,108 @@ MODEL_SELECTION_CONFIG = {
     "default": "llama-3.1-8b-instant"
 }
 
+# Feedback routing: MODEL_SELECTION_CONFIG is the prior until the router has
+# evidence that a cheaper model meets the task type's SLO
+ROUTER_ENABLED = os.getenv("ROUTER_ENABLED", "true").lower() == "true"
+# Blended USD per million tokens, override with a JSON env var
+MODEL_COSTS = json.loads(os.getenv("MODEL_COSTS", "null")) or {
+    "llama-3.1-8b-instant": 0.065,
+    "llama3-70b-8192": 0.69,
+    "llama-3.3-70b-versatile": 0.69
+}
+# Per task type quality and latency targets, "default" applies to all
+ROUTER_SLOS = json.loads(os.getenv("ROUTER_SLOS", "null")) or {
+    "default": {"min_score": 0.5, "p95_latency": 15.0, "max_error_rate": 0.05},
+    "conversation": {"p95_latency": 5.0},
+    "fast_responses": {"p95_latency": 5.0},
+    "reasoning": {"min_score": 0.6}
+}
+ROUTER_WINDOW = int(os.getenv("ROUTER_WINDOW", "200"))  # Recent outcomes kept per model and task type
+ROUTER_MIN_SAMPLES = int(os.getenv("ROUTER_MIN_SAMPLES", "20"))
+ROUTER_EXPLORE_RATE = float(os.getenv("ROUTER_EXPLORE_RATE", "0.05"))
+ROUTER_BOOTSTRAP_LIMIT = int(os.getenv("ROUTER_BOOTSTRAP_LIMIT", "5000"))  # Recent tasks replayed on startup
+
+# Context windows (tokens) per model and the prompt budget actually spent on history
+MODEL_CONTEXT_WINDOWS = json.loads(os.getenv("MODEL_CONTEXT_WINDOWS", "null")) or {
+    "llama3-70b-8192": 8192,
+    "llama-3.3-70b-versatile": 131072,
+    "llama-3.1-8b-instant": 131072
+}
+DEFAULT_CONTEXT_WINDOW = int(os.getenv("DEFAULT_CONTEXT_WINDOW", "8192"))
+CONTEXT_TOKEN_BUDGET_CAP = int(os.getenv("CONTEXT_TOKEN_BUDGET_CAP", "16384"))
+
+# Completion cache TTLs (seconds) per task type, 0 disables caching
+COMPLETION_CACHE_ENABLED = os.getenv("COMPLETION_CACHE_ENABLED", "true").lower() == "true"
+COMPLETION_CACHE_LRU_SIZE = int(os.getenv("COMPLETION_CACHE_LRU_SIZE", "1024"))
+COMPLETION_CACHE_TTLS = {
+    "creative_tasks": 0,  # Varied output is the point of creative prompts
+    "analysis_tasks": 3600,
+    "fast_responses": 1800,
+    "coding_tasks": 3600,
+    "conversation": 1800,
+    "web_scraping": 600,
+    "data_analysis": 1800,
+    "multimodal": 0,
+    "reasoning": 3600,
+    "default": 900
+}
+
+# Conversation messages are stored in fixed-size bucket documents
+CONVERSATION_BUCKET_SIZE = int(os.getenv("CONVERSATION_BUCKET_SIZE", "100"))
+CONVERSATION_PAGE_SIZE = int(os.getenv("CONVERSATION_PAGE_SIZE", "50"))
+
+# Rolling summaries folded in the background by a small model
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", "llama-3.1-8b-instant")
+SUMMARY_MAX_TOKENS = int(os.getenv("SUMMARY_MAX_TOKENS", "400"))
+CONVERSATION_SUMMARY_TRIGGER = int(os.getenv("CONVERSATION_SUMMARY_TRIGGER", "40"))  # Unsummarized messages
+CONVERSATION_SUMMARY_KEEP = int(os.getenv("CONVERSATION_SUMMARY_KEEP", "20"))  # Recent messages kept verbatim
+CONVERSATION_SUMMARY_CHUNK = int(os.getenv("CONVERSATION_SUMMARY_CHUNK", "40"))  # Messages folded per call
+AGENT_MEMORY_SUMMARY_TRIGGER = int(os.getenv("AGENT_MEMORY_SUMMARY_TRIGGER", "5"))  # Unsummarized interactions
+
+# In-process agent config cache, invalidated across workers through Redis pub/sub
+AGENT_CACHE_SIZE = int(os.getenv("AGENT_CACHE_SIZE", "1024"))
+AGENT_CACHE_TTL = int(os.getenv("AGENT_CACHE_TTL", "300"))  # Upper bound on staleness if an invalidation is missed
+AGENT_INVALIDATION_CHANNEL = "agent_invalidations"
+
+# Write-behind agent metrics, flushed every interval or once this many tasks are buffered
+AGENT_METRICS_FLUSH_INTERVAL_MS = int(os.getenv("AGENT_METRICS_FLUSH_INTERVAL_MS", "250"))
+AGENT_METRICS_FLUSH_MAX_TASKS = int(os.getenv("AGENT_METRICS_FLUSH_MAX_TASKS", "100"))
+AGENT_MEMORY_LENGTH = 15  # Interactions kept in Agent.conversation_memory
+INTELLIGENCE_SCORE_WORKERS = int(os.getenv("INTELLIGENCE_SCORE_WORKERS", "2"))  # Scoring processes, 0 scores in a thread
+INTELLIGENCE_SCORE_QUEUE_SIZE = int(os.getenv("INTELLIGENCE_SCORE_QUEUE_SIZE", "10000"))
+
+# Semantic recall of an agent's past tasks
+VECTOR_MEMORY_ENABLED = os.getenv("VECTOR_MEMORY_ENABLED", "true").lower() == "true"
+VECTOR_MEMORY_TOP_K = int(os.getenv("VECTOR_MEMORY_TOP_K", "3"))
+VECTOR_MEMORY_MIN_SCORE = float(os.getenv("VECTOR_MEMORY_MIN_SCORE", "0.15"))
+VECTOR_MEMORY_BOOTSTRAP_LIMIT = int(os.getenv("VECTOR_MEMORY_BOOTSTRAP_LIMIT", "5000"))  # Past tasks indexed on first use
+
+# Streaming exports
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))  # Documents per cursor batch
+
+# Compaction and cold archival of old tasks and summarized conversation turns
+ARCHIVE_ENABLED = os.getenv("ARCHIVE_ENABLED", "false").lower() == "true"
+ARCHIVE_INTERVAL_HOURS = float(os.getenv("ARCHIVE_INTERVAL_HOURS", "6"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "5000"))
+TASK_RETENTION_DAYS = int(os.getenv("TASK_RETENTION_DAYS", "90"))
+CONVERSATION_RETENTION_DAYS = int(os.getenv("CONVERSATION_RETENTION_DAYS", "30"))
+ARCHIVED_COLLECTIONS = ("tasks", "conversation_messages")
+
+# Synchronous tasks are only inserted once finished, skipping the "processing" write
+TASK_DEFER_INSERT = os.getenv("TASK_DEFER_INSERT", "false").lower() == "true"
+CLASSIFY_BATCH_MAX_PROMPTS = int(os.getenv("CLASSIFY_BATCH_MAX_PROMPTS", "50000"))
+TASK_MODEL_ENABLED = os.getenv("TASK_MODEL_ENABLED", "true").lower() == "true"
+TASK_MODEL_MIN_CONFIDENCE = float(os.getenv("TASK_MODEL_MIN_CONFIDENCE", "0.6"))  # Below this keywords decide
+
+# In-flight deduplication of identical task executions
+SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() == "true"
+SINGLE_FLIGHT_DISTRIBUTED = os.getenv("SINGLE_FLIGHT_DISTRIBUTED", "true").lower() == "true"
+
+# Background task execution
+TASK_WORKER_CONCURRENCY = int(os.getenv("TASK_WORKER_CONCURRENCY", "8"))
+TASK_WORKER_POLL_INTERVAL = float(os.getenv("TASK_WORKER_POLL_INTERVAL", "1.0"))
+TASK_WORKER_SWEEP_INTERVAL = float(os.getenv("TASK_WORKER_SWEEP_INTERVAL", "60"))  # Seconds between stale lease sweeps
+
 # Enhanced Task Classification with ML approach
 TASK_KEYWORDS = {
     "creative_tasks": ["write", "create", "generate", "compose", "design", "brainstorm", "story", "content", "marketing", "blog", "creative", "imagine", "invent"],
@@ -165,38 +828,81 @@ TASK_KEYWORDS = {
 
 # Advanced context management
 class ConversationMemoryManager:
-    def __init__(self, max_context_length: int = 8000):
-        self.max_context_length = max_context_length
-        
-    async def optimize_conversation_context(self, messages: List[Dict], agent_memory: List[Dict]) -> List[Dict]:
-        """Intelligently manage conversation context"""
-        # Calculate context length
-        total_length = sum(len(str(msg.get('content', ''))) for msg in messages)
-        
-        if total_length <= self.max_context_length:
-            return messages
-        
-        # Prioritize recent messages and important context
-        optimized_messages = []
-        system_msg = messages[0] if messages and messages[0].get('role') == 'system' else None
-        
-        if system_msg:
-            optimized_messages.append(system_msg)
-        
-        # Add recent agent memory for context continuity
-        if agent_memory:
-            recent_memory = agent_memory[-3:]  # Last 3 interactions
-            memory_summary = self._create_memory_summary(recent_memory)
-            optimized_messages.append({
-                "role": "system", 
+    def __init__(self, context_windows: Dict[str, int] = MODEL_CONTEXT_WINDOWS, budget_cap: int = CONTEXT_TOKEN_BUDGET_CAP):
+        self.context_windows = context_windows
+        self.budget_cap = budget_cap
+    
+    def token_budget(self, model: Optional[str], max_tokens: int = 0) -> int:
+        """Prompt tokens available to a request once the completion is reserved"""
+        window = self.context_windows.get(model, DEFAULT_CONTEXT_WINDOW)
+        return max(0, min(window - max_tokens, self.budget_cap))
+    
+    def pack_conversation_context(self, messages: List[Dict], memory_summary: Optional[str], model: Optional[str] = None,
+                                  max_tokens: int = 0, reserved_tokens: int = 0,
+                                  conversation_summary: Optional[str] = None,
+                                  recalled: Optional[List[Dict]] = None) -> tuple[List[Dict], Dict[str, Any]]:
+        """Fill the model's token budget with the newest messages that fit"""
+        budget = self.token_budget(model, max_tokens) - reserved_tokens - TOKENS_PER_REQUEST
+        
+        # System instructions are always kept
+        head = 1 if messages and messages[0].get('role') == 'system' else 0
+        packed = list(messages[:head])
+        if conversation_summary:
+            # Stands in for the turns already folded out of the history
+            packed.append({"role": "system", "content": f"Summary of the earlier conversation: {conversation_summary}"})
+        used = sum(message_tokens(msg, model) for msg in packed)
+        history = messages[head:]
+        
+        # Relevant past tasks rank below nothing but the instructions, when they fit
+        if recalled:
+            recall_msg = {
+                "role": "system",
+                "content": f"Relevant past tasks: {self._create_memory_summary(recalled)}"
+            }
+            recall_tokens = message_tokens(recall_msg, model)
+            if used + recall_tokens <= budget:
+                packed.append(recall_msg)
+                used += recall_tokens
+        
+        # Single newest-first pass, stopping at the first message that no longer fits
+        kept: List[Dict] = []
+        for msg in reversed(history):
+            tokens = message_tokens(msg, model)
+            if used + tokens > budget:
+                break
+            kept.append(msg)
+            used += tokens
+        kept.reverse()
+        dropped = history[:len(history) - len(kept)]
+        
+        # Summarize recent agent memory in place of the dropped turns when it fits
+        if dropped and memory_summary:
+            memory_msg = {
+                "role": "system",
                 "content": f"Context from recent interactions: {memory_summary}"
-            })
-        
-        # Add most recent messages
-        recent_messages = messages[-6:] if len(messages) > 6 else messages[1:]
-        optimized_messages.extend(recent_messages)
-        
-        return optimized_messages
+            }
+            memory_tokens = message_tokens(memory_msg, model)
+            while kept and used + memory_tokens > budget:
+                used -= message_tokens(kept[0], model)
+                dropped.append(kept.pop(0))
+            if used + memory_tokens <= budget:
+                packed.append(memory_msg)
+                used += memory_tokens
+        
+        packed.extend(kept)
+        stats = {
+            "budget_tokens": budget + reserved_tokens + TOKENS_PER_REQUEST,
+            "kept_messages": len(packed),
+            "kept_tokens": used,
+            "dropped_messages": len(dropped),
+            "dropped_tokens": sum(message_tokens(msg, model) for msg in dropped),
+            "recalled_tasks": [item.get("task_id") for item in recalled or []]
+        }
+        return packed, stats
+    
+    def agent_memory_summary(self, agent: Dict[str, Any]) -> Optional[str]:
+        """Precomputed agent memory summary; the latest tasks reach prompts through recall"""
+        return agent.get("memory_summary")
     
     def _create_memory_summary(self, memory_items: List[Dict]) -> str:
         """Create intelligent summary of conversation memory"""
@@ -211,80 +917,33 @@ class ConversationMemoryManager:
         return " | ".join(summaries)
 
 # Enhanced task classification with ML scoring
-def classify_task_type_advanced(prompt: str) -> tuple[str, float]:
-    """Advanced task classification with confidence scoring"""
-    prompt_lower = prompt.lower()
-    scores = {task_type: 0 for task_type in TASK_KEYWORDS}
-    
-    # Weighted keyword matching
-    for task_type, keywords in TASK_KEYWORDS.items():
-        for keyword in keywords:
-            if keyword in prompt_lower:
-                # Weight based on keyword importance and position
-                weight = 2 if prompt_lower.startswith(keyword) else 1
-                scores[task_type] += weight
-    
-    # Context analysis
-    prompt_length = len(prompt.split())
-    if prompt_length > 50:
-        scores["analysis_tasks"] += 1
-        scores["reasoning"] += 1
-    
-    # Special patterns
-    if re.search(r'https?://', prompt):
-        scores["web_scraping"] += 3
-    if re.search(r'\d+.*\d+', prompt):
-        scores["data_analysis"] += 2
-    if any(word in prompt_lower for word in ["how", "why", "what", "explain"]):
-        scores["conversation"] += 1
-    
-    max_score_type = max(scores, key=scores.get)
-    max_score = scores[max_score_type]
-    confidence = max_score / max(1, sum(scores.values()))
-    
-    return (max_score_type if max_score > 0 else "fast_responses", confidence)
-
-def calculate_intelligence_score(response: str, task_type: str) -> float:
-    """Calculate AI response intelligence score"""
-    score = 0.0
-    
-    # Length and structure scoring
-    word_count = len(response.split())
-    if 50 <= word_count <= 300:
-        score += 0.3
-    elif word_count > 300:
-        score += 0.2
-    
-    # Readability score
-    try:
-        readability = flesch_reading_ease(response)
-        if 60 <= readability <= 80:  # Good readability
-            score += 0.2
-        elif readability > 40:
-            score += 0.1
-    except:
-        pass
-    
-    # Content quality indicators
-    if task_type == "creative_tasks":
-        if any(word in response.lower() for word in ["creative", "innovative", "unique", "original"]):
-            score += 0.3
-    elif task_type == "analysis_tasks":
-        if any(word in response.lower() for word in ["analysis", "conclusion", "insight", "recommendation"]):
-            score += 0.3
-    elif task_type == "coding_tasks":
-        if "```" in response or any(word in response for word in ["function", "class", "import"]):
-            score += 0.3
-    
-    # Completeness score
-    if response.strip().endswith(('.', '!', '?')):
-        score += 0.1
-    
-    # Structure scoring
-    if '\n' in response:  # Multi-line structure
-        score += 0.1
-    
-    return min(score, 1.0)  # Cap at 1.0
+keyword_classifier = KeywordClassifier(TASK_KEYWORDS)
+# Learned classifier from train_task_model.py, keyword matching when absent or unsure
+task_model = NaiveBayesTaskModel.load() if TASK_MODEL_ENABLED else None
+
+def classify_task_type_advanced(prompt: str) -> tuple[str, float, str]:
+    """Advanced task classification with confidence scoring and the classifier that decided"""
+    if task_model is not None:
+        prediction = task_model.predict(prompt)
+        if prediction and prediction[1] >= TASK_MODEL_MIN_CONFIDENCE:
+            TASK_CLASSIFICATIONS.labels(source="model").inc()
+            return (*prediction, "model")
+    TASK_CLASSIFICATIONS.labels(source="keywords").inc()
+    return (*keyword_classifier.classify(prompt), "keywords")
+
+def classify_task_types(prompts: List[str]) -> List[tuple[str, float, str]]:
+    """``classify_task_type_advanced`` for a batch of prompts"""
+    results: List[Optional[tuple[str, float, str]]] = [None] * len(prompts)
+    if task_model is not None:
+        for i, prediction in enumerate(task_model.predict_batch(prompts)):
+            if prediction and prediction[1] >= TASK_MODEL_MIN_CONFIDENCE:
+                results[i] = (*prediction, "model")
+    unsure = [i for i, result in enumerate(results) if result is None]
+    for i, result in zip(unsure, keyword_classifier.classify_batch([prompts[i] for i in unsure])):
+        results[i] = (*result, "keywords")
+    TASK_CLASSIFICATIONS.labels(source="model").inc(len(prompts) - len(unsure))
+    TASK_CLASSIFICATIONS.labels(source="keywords").inc(len(unsure))
+    return results
 
 # Multi-modal processing capabilities
 class MultiModalProcessor:
@@ -369,6 +1028,14 @@ class Agent(BaseModel):
     intelligence_score: float = 0.0
     memory_efficiency: float = 1.0
 
+class Conversation(BaseModel):
+    id: str
+    agent_id: str
+    message_count: int = 0  # Next message sequence number
+    created_at: datetime
+    updated_at: datetime
+    status: str = "active"
+
 class Task(BaseModel):
     id: str
     agent_id: str
@@ -383,6 +1050,7 @@ class Task(BaseModel):
     metadata: Dict[str, Any] = {}
     performance_data: Dict[str, Any] = {}
     intelligence_score: float = 0.0
+    intelligence_score_provisional: bool = False  # Final score still being computed in the background
     context_optimization: bool = False
 
 class EnhancedCreateTaskRequest(BaseModel):
@@ -395,6 +1063,28 @@ class EnhancedCreateTaskRequest(BaseModel):
     file_ids: List[str] = []
     context_optimization: bool = True
     reasoning_mode: bool = False
+    use_cache: bool = True
+    async_mode: bool = False
+
+class WebScrapingRequest(BaseModel):
+    url: str
+    agent_id: str
+    prompt: str
+
+class ModelComparisonRequest(BaseModel):
+    prompt: str
+    models: List[str]
+    agent_id: str
+    timeout: float = Field(30.0, gt=0, le=120)  # Per-model deadline in seconds, admission wait included
+
+class TaskTypeCorrection(BaseModel):
+    task_type: str
+
+class ClassifyBatchRequest(BaseModel):
+    prompts: List[str]
+    agent_id: Optional[str] = None  # Route with this agent's model settings, "auto" otherwise
+    reasoning_mode: bool = False
+    enable_multimodal: bool = False
 
 # Initialize advanced components
 memory_manager = ConversationMemoryManager()
@@ -420,105 +1110,955 @@ async def advanced_cache_set(key: str, value: str, expire: int = 300):
     except Exception as e:
         logger.warning(f"Cache set failed for {key}: {e}")
 
-# Database initialization with enhanced indexes
-async def init_database():
-    """Enhanced database initialization"""
-    try:
-        # Agents collection indexes
-        await db.agents.create_index([("id", 1)], unique=True)
-        await db.agents.create_index([("status", 1)])
-        await db.agents.create_index([("specialization", 1)])
-        await db.agents.create_index([("created_at", -1)])
-        await db.agents.create_index([("intelligence_score", -1)])  # New index
-        
-        # Tasks collection indexes
-        await db.tasks.create_index([("id", 1)], unique=True)
-        await db.tasks.create_index([("agent_id", 1)])
-        await db.tasks.create_index([("status", 1)])
-        await db.tasks.create_index([("created_at", -1)])
-        await db.tasks.create_index([("agent_id", 1), ("status", 1)])
-        await db.tasks.create_index([("task_type", 1)])
-        await db.tasks.create_index([("intelligence_score", -1)])  # New index
-        
-        # Conversations collection indexes
-        await db.conversations.create_index([("id", 1)], unique=True)
-        await db.conversations.create_index([("agent_id", 1)])
-        await db.conversations.create_index([("updated_at", -1)])
-        
-        # New collections for enhanced features
-        await db.multimodal_files.create_index([("file_id", 1)], unique=True)
-        await db.multimodal_files.create_index([("created_at", -1)])
-        
-        logger.info("Enhanced database indexes created successfully")
-    except Exception as e:
-        logger.error(f"Error creating indexes: {e}")
-        ERROR_RATE.labels(type="database", endpoint="init").inc()
+# LLM completion cache
+class CompletionCache:
+    """Two-tier completion cache: in-process LRU in front of Redis"""
+    
+    def __init__(self, max_entries: int = 1024, ttls: Optional[Dict[str, int]] = None):
+        self.max_entries = max_entries
+        self.ttls = ttls if ttls is not None else COMPLETION_CACHE_TTLS
+        self._entries: "OrderedDict[str, tuple[float, str]]" = OrderedDict()
+    
+    def ttl_for(self, task_type: str) -> int:
+        """Cache TTL in seconds for a task type, 0 when caching is disabled"""
+        if not COMPLETION_CACHE_ENABLED:
+            return 0
+        return self.ttls.get(task_type, self.ttls["default"])
+    
+    @staticmethod
+    def make_key(messages: List[Dict], model: str, temperature: Optional[float], max_tokens: Optional[int]) -> str:
+        """Hash the normalized request into a cache key"""
+        normalized = {
+            "model": model,
+            "messages": [
+                [msg.get("role", ""), str(msg.get("content", "")).replace("\r\n", "\n").strip()]
+                for msg in messages
+            ],
+            "temperature": round(temperature, 2) if temperature is not None else None,
+            "max_tokens": max_tokens
+        }
+        digest = hashlib.sha256(json.dumps(normalized, sort_keys=True).encode("utf-8")).hexdigest()
+        return f"llm_completion_{digest}"
+    
+    async def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry:
+            expires_at, value = entry
+            if expires_at > time.time():
+                self._entries.move_to_end(key)
+                COMPLETION_CACHE_HITS.labels(tier="memory").inc()
+                return value
+            del self._entries[key]
+        
+        value = await advanced_cache_get(key)
+        if value:
+            COMPLETION_CACHE_HITS.labels(tier="redis").inc()
+            # Redis does not tell us the remaining TTL cheaply; keep it briefly in memory
+            self._remember(key, value, min(60, self.ttls["default"]))
+            return value
+        
+        COMPLETION_CACHE_MISSES.inc()
+        return None
+    
+    async def set(self, key: str, value: str, ttl: int):
+        self._remember(key, value, ttl)
+        await advanced_cache_set(key, value, expire=ttl)
+    
+    def _remember(self, key: str, value: str, ttl: int):
+        self._entries[key] = (time.time() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
 
-async def download_nltk_data():
-    """Download required NLTK data"""
-    try:
-        import nltk
-        nltk.download('punkt', quiet=True)
-        nltk.download('stopwords', quiet=True)
-        logger.info("NLTK data downloaded successfully")
-    except Exception as e:
-        logger.warning(f"NLTK download failed: {e}")
+completion_cache = CompletionCache(max_entries=COMPLETION_CACHE_LRU_SIZE)
 
-async def warm_up_services():
-    """Warm up external services"""
+def build_chat_completion(content: str, model: str) -> ChatCompletion:
+    """Wrap a completion text in a ChatCompletion, e.g. for streamed results"""
+    return ChatCompletion(
+        choices=[ChatCompletionChoice(
+            finish_reason="stop",
+            index=0,
+            logprobs=ChoiceLogprobs(),
+            message=ChoiceMessage(content=content, role="assistant")
+        )],
+        model=model,
+        object="chat.completion"
+    )
+
+async def cached_groq_api_call(client, messages, model, task_type: str = "default", use_cache: bool = True, **kwargs) -> tuple[ChatCompletion, bool, Optional[Dict[str, Any]]]:
+    """Routed Groq call behind the completion cache, returns (response, cache_hit, routing)"""
+    ttl = completion_cache.ttl_for(task_type) if use_cache else 0
+    if not ttl:
+        response, routing = await routed_groq_api_call(client, messages, model, task_type=task_type, **kwargs)
+        return response, False, routing
+    
+    key = CompletionCache.make_key(messages, model, kwargs.get("temperature"), kwargs.get("max_tokens"))
+    cached = await completion_cache.get(key)
+    if cached:
+        return ChatCompletion.model_validate_json(cached), True, None
+    
+    response, routing = await routed_groq_api_call(client, messages, model, task_type=task_type, **kwargs)
+    # A fallback or hedge answer must not be served as the requested model's once it recovers
+    if routing["served_model"] == model:
+        await completion_cache.set(key, response.model_dump_json(), ttl)
+    return response, False, routing
+
+async def acquire_job_lease(lease_id: str, owner: str, ttl: float) -> bool:
+    """Take or renew a lease in ``job_leases`` so only one worker runs a job"""
+    now = datetime.utcnow()
     try:
-        # Warm up Redis
-        redis_conn = await get_redis()
-        if redis_conn:
-            await redis_conn.ping()
-        
-        # Warm up Groq API
-        await groq_api_call(
-            groq_client,
-            [{"role": "user", "content": "warmup"}],
-            "llama-3.1-8b-instant",
-            max_tokens=1
+        await db.job_leases.find_one_and_update(
+            {"_id": lease_id, "$or": [{"expires_at": {"$lt": now}}, {"owner": owner}]},
+            {"$set": {"owner": owner, "expires_at": now + timedelta(seconds=ttl)}},
+            upsert=True
         )
-        
-        logger.info("Services warmed up successfully")
-    except Exception as e:
-        logger.warning(f"Service warmup failed: {e}")
+        return True
+    except DuplicateKeyError:
+        return False  # Held by another worker
 
-async def cleanup_resources():
-    """Cleanup resources on shutdown"""
-    global redis_client
-    if redis_client:
-        await redis_client.close()
+async def release_job_lease(lease_id: str, owner: str):
+    await db.job_leases.update_one(
+        {"_id": lease_id, "owner": owner}, {"$set": {"expires_at": datetime.utcnow()}}
+    )
 
-async def scrape_website(url: str) -> str:
-    """Scrape website content"""
-    try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.get(url)
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            # Remove script and style elements
-            for script in soup(["script", "style"]):
-                script.extract()
-            
-            # Get text and clean it
-            text = soup.get_text()
-            lines = (line.strip() for line in text.splitlines())
-            chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-            text = ' '.join(chunk for chunk in chunks if chunk)
-            
-            return text[:5000]  # Limit to 5000 characters
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Failed to scrape website: {str(e)}")
+# Conversation history storage
+class ConversationStore:
+    """Conversation messages in fixed-size bucket documents keyed by (conversation_id, bucket).
+    
+    Each message gets a sequence number reserved on the conversation document,
+    message ``seq`` lives in bucket ``seq // bucket_size``. Readers fetch buckets
+    newest-first and stop as soon as they have what they need.
+    """
+    
+    def __init__(self, bucket_size: int = CONVERSATION_BUCKET_SIZE):
+        self.bucket_size = bucket_size
+    
+    async def append(self, conversation_id: str, messages: List[Dict[str, Any]]) -> Optional[int]:
+        """Append messages to a conversation, returns the seq of the first one"""
+        now = datetime.utcnow()
+        conversation = await write_collection("conversations").find_one_and_update(
+            {"id": conversation_id},
+            {"$inc": {"message_count": len(messages)}, "$set": {"updated_at": now}},
+            projection={"message_count": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        if not conversation:
+            return None
+        
+        first_seq = conversation["message_count"] - len(messages)
+        buckets: Dict[int, List[Dict[str, Any]]] = {}
+        for offset, message in enumerate(messages):
+            seq = first_seq + offset
+            buckets.setdefault(seq // self.bucket_size, []).append({**message, "seq": seq, "created_at": now})
+        
+        for bucket, items in buckets.items():
+            await self._push(conversation_id, bucket, items, now)
+        return first_seq
+    
+    async def _push(self, conversation_id: str, bucket: int, items: List[Dict[str, Any]], now: datetime, once: bool = False):
+        """Add items to a bucket; with ``once`` a retry after the items landed is a no-op"""
+        query: Dict[str, Any] = {"conversation_id": conversation_id, "bucket": bucket}
+        if once:
+            # A bucket update is atomic, so the first item being there means all of them are
+            query["messages.seq"] = {"$ne": items[0]["seq"]}
+        update = {
+            # Concurrent appends may land out of order, keep buckets sorted by seq
+            "$push": {"messages": {"$each": items, "$sort": {"seq": 1}}},
+            "$inc": {"count": len(items)},
+            "$set": {"updated_at": now},
+            "$setOnInsert": {"created_at": now}
+        }
+        buckets = write_collection("conversation_buckets")
+        try:
+            await buckets.update_one(query, update, upsert=True)
+        except DuplicateKeyError:
+            # Lost an upsert race for a new bucket (or, with ``once``, the items are already in it)
+            await buckets.update_one(query, update)
+    
+    async def recent_messages(self, conversation_id: str, token_budget: int, model: Optional[str] = None, since: int = 0) -> List[Dict[str, str]]:
+        """Newest messages from seq ``since`` on, just enough to fill ``token_budget``"""
+        messages: List[Dict[str, str]] = []
+        tokens = 0
+        cursor = db.conversation_buckets.find(
+            {"conversation_id": conversation_id, "bucket": {"$gte": since // self.bucket_size}}, {"messages": 1}
+        ).sort("bucket", -1).batch_size(2)
+        async for bucket in cursor:
+            for message in reversed(bucket.get("messages", [])):
+                if message["seq"] < since:
+                    break
+                messages.append({"role": message["role"], "content": message["content"]})
+                tokens += message_tokens(message, model)
+            if tokens > token_budget:
+                break
+        messages.reverse()
+        return messages
+    
+    async def context(self, conversation_id: str, token_budget: int, model: Optional[str] = None) -> tuple[Optional[str], List[Dict[str, str]]]:
+        """Rolling summary and the unsummarized recent messages of a conversation"""
+        conversation = await db.conversations.find_one(
+            {"id": conversation_id}, {"summary": 1, "summarized_through": 1}
+        ) or {}
+        # Turns folded into the summary are not read again
+        messages = await self.recent_messages(
+            conversation_id, token_budget, model, since=conversation.get("summarized_through", 0)
+        )
+        return conversation.get("summary"), messages
+    
+    async def messages_between(self, conversation_id: str, start: int, end: int) -> List[Dict[str, Any]]:
+        """Messages with ``start <= seq < end``, oldest first"""
+        messages: List[Dict[str, Any]] = []
+        cursor = db.conversation_buckets.find(
+            {
+                "conversation_id": conversation_id,
+                "bucket": {"$gte": start // self.bucket_size, "$lte": (end - 1) // self.bucket_size}
+            },
+            {"messages": 1}
+        ).sort("bucket", 1)
+        async for bucket in cursor:
+            messages.extend(m for m in bucket.get("messages", []) if start <= m["seq"] < end)
+        return messages
+    
+    async def page(self, conversation_id: str, before: Optional[int] = None, limit: int = CONVERSATION_PAGE_SIZE) -> tuple[List[Dict[str, Any]], Optional[int]]:
+        """Messages preceding seq ``before`` (default: the end), oldest first, with the next cursor"""
+        query: Dict[str, Any] = {"conversation_id": conversation_id}
+        if before is not None:
+            query["bucket"] = {"$lte": (before - 1) // self.bucket_size}
+        
+        messages: List[Dict[str, Any]] = []
+        cursor = db.conversation_buckets.find(query, {"_id": 0, "messages": 1}).sort("bucket", -1)
+        async for bucket in cursor:
+            for message in reversed(bucket.get("messages", [])):
+                if before is None or message["seq"] < before:
+                    messages.append(message)
+            if len(messages) > limit:
+                break
+        
+        has_more = len(messages) > limit
+        messages = messages[:limit]
+        messages.reverse()
+        return messages, (messages[0]["seq"] if has_more else None)
+    
+    async def migrate_embedded_messages(self):
+        """Move messages still embedded in conversation documents into buckets.
+        
+        Safe to interrupt and rerun: the seq range is reserved once per
+        conversation, bucket writes are idempotent, and the embedded array is
+        only removed after its buckets are written. One worker migrates at a time.
+        """
+        owner = str(uuid.uuid4())
+        if not await acquire_job_lease("conversation_migration", owner, ttl=3600):
+            return
+        migrated = 0
+        try:
+            async for conversation in db.conversations.find({"messages.0": {"$exists": True}}, {"id": 1}):
+                migrated += await self._migrate_conversation(conversation["id"])
+        finally:
+            await release_job_lease("conversation_migration", owner)
+        if migrated:
+            logger.info(f"Migrated {migrated} conversations to bucketed message storage")
+    
+    async def _migrate_conversation(self, conversation_id: str) -> int:
+        while True:
+            conversation = await db.conversations.find_one(
+                {"id": conversation_id}, {"messages": 1, "message_count": 1, "messages_migration": 1}
+            )
+            legacy = (conversation or {}).get("messages")
+            if not legacy:
+                return 0
+            migration = conversation.get("messages_migration")
+            if migration:
+                break
+            # Reserve seqs after any messages appended to buckets meanwhile, retried when an append races us
+            count = conversation.get("message_count")
+            migration = {"first_seq": count or 0, "count": len(legacy)}
+            reserved = await write_collection("conversations").update_one(
+                {"id": conversation_id, "messages_migration": {"$exists": False},
+                 "message_count": count if count is not None else {"$exists": False}},
+                {"$set": {"messages_migration": migration, "message_count": (count or 0) + len(legacy)}}
+            )
+            if reserved.modified_count:
+                break
+        
+        if len(legacy) != migration["count"]:
+            logger.warning(f"Conversation {conversation_id} changed during its migration, left embedded")
+            return 0
+        now = datetime.utcnow()
+        buckets: Dict[int, List[Dict[str, Any]]] = {}
+        for offset, message in enumerate(legacy):
+            seq = migration["first_seq"] + offset
+            buckets.setdefault(seq // self.bucket_size, []).append({**message, "seq": seq, "created_at": message.get("created_at", now)})
+        for bucket, items in buckets.items():
+            await self._push(conversation_id, bucket, items, now, once=True)
+        
+        # Only the array that was copied is removed
+        await write_collection("conversations").update_one(
+            {"id": conversation_id, "messages": legacy},
+            {"$unset": {"messages": "", "messages_migration": ""}}
+        )
+        return 1
 
-# Enhanced middleware
-@app.middleware("http")
-async def enhanced_process_time_header(request: Request, call_next):
-    start_time = time.time()
-    REQUEST_COUNT.labels(method=request.method, endpoint=request.url.path).inc()
+conversation_store = ConversationStore()
+
+class AgentConfigCache:
+    """LRU of agent configs without the heavy, per-task fields.
     
-    try:
-        response = await call_next(request)
+    Every write to a cached field must call ``invalidate``, which also tells
+    the other workers through Redis pub/sub. The TTL bounds staleness when a
+    message is missed, e.g. while the subscriber reconnects.
+    """
+    
+    # Everything the request path reads; conversation memory and metrics stay in Mongo
+    FIELDS = {
+        "_id": 0, "id": 1, "name": 1, "description": 1, "system_prompt": 1, "model": 1, "status": 1,
+        "specialization": 1, "settings": 1, "memory_summary": 1, "memory_summarized_at": 1
+    }
+    
+    def __init__(self, max_entries: int = 1024, ttl: int = 300, channel: str = AGENT_INVALIDATION_CHANNEL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.channel = channel
+        self._entries: "OrderedDict[str, tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._listener: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+    
+    async def get(self, agent_id: str) -> Optional[Dict[str, Any]]:
+        """Agent config, from memory when possible; callers must not mutate it"""
+        entry = self._entries.get(agent_id)
+        if entry and entry[0] > time.time():
+            self._entries.move_to_end(agent_id)
+            self.hits += 1
+            AGENT_CACHE_HITS.inc()
+            return entry[1]
+        
+        self.misses += 1
+        AGENT_CACHE_MISSES.inc()
+        agent = await db.agents.find_one({"id": agent_id}, self.FIELDS)
+        if agent:
+            self._entries[agent_id] = (time.time() + self.ttl, agent)
+            self._entries.move_to_end(agent_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return agent
+    
+    async def invalidate(self, agent_id: str):
+        """Drop an agent locally and on every other worker"""
+        self._entries.pop(agent_id, None)
+        try:
+            redis_conn = await get_redis()
+            if redis_conn:
+                await redis_conn.publish(self.channel, agent_id)
+        except Exception as e:
+            logger.warning(f"Agent invalidation broadcast failed: {e}")
+    
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {"size": len(self._entries), "hit_rate": self.hits / lookups if lookups else 0.0}
+    
+    async def start(self):
+        self._listener = asyncio.create_task(self._listen())
+    
+    async def stop(self):
+        if self._listener:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+            self._listener = None
+    
+    async def _listen(self):
+        while True:
+            redis_conn = await get_redis()
+            if not redis_conn:
+                await asyncio.sleep(self.ttl)
+                continue
+            pubsub = redis_conn.pubsub()
+            try:
+                await pubsub.subscribe(self.channel)
+                # Invalidations may have been missed while unsubscribed
+                self._entries.clear()
+                while True:
+                    # Poll with a timeout, a blocking read would trip the client's socket timeout
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    if message and message["type"] == "message":
+                        self._entries.pop(message["data"], None)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Agent invalidation listener failed: {e}")
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+
+agent_cache = AgentConfigCache(max_entries=AGENT_CACHE_SIZE, ttl=AGENT_CACHE_TTL)
+
+class AgentMetricsAggregator:
+    """Write-behind buffer of per-agent metric deltas.
+    
+    Completed tasks only add to in-memory counters. A background flusher
+    applies every buffered agent in one unordered bulk_write, with one atomic
+    pipeline update per agent that adds the summed deltas and derives the
+    averages from the totals. Concurrent tasks and workers therefore never
+    overwrite each other's updates.
+    """
+    
+    def __init__(self, flush_interval_ms: int = 250, max_pending_tasks: int = 100):
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_pending_tasks = max_pending_tasks
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._pending_tasks = 0
+        self._flush_now = asyncio.Event()
+        self._flusher: Optional[asyncio.Task] = None
+    
+    def _delta(self, agent_id: str) -> Dict[str, Any]:
+        return self._pending.setdefault(agent_id, {"tasks": 0, "response_time": 0.0, "intelligence": 0.0, "memory": []})
+    
+    def record(self, agent_id: str, processing_time: float, intelligence_score: float, memory_item: Dict[str, Any]):
+        """Buffer the metrics of one completed task"""
+        delta = self._delta(agent_id)
+        delta["tasks"] += 1
+        delta["response_time"] += processing_time
+        delta["intelligence"] += intelligence_score
+        delta["memory"] = (delta["memory"] + [memory_item])[-AGENT_MEMORY_LENGTH:]
+        self._pending_tasks += 1
+        if self._pending_tasks >= self.max_pending_tasks:
+            self._flush_now.set()
+    
+    def adjust_intelligence(self, agent_id: str, correction: float):
+        """Correct the intelligence total of an already recorded task, e.g. once its final score is known"""
+        self._delta(agent_id)["intelligence"] += correction
+    
+    @staticmethod
+    def _update(delta: Dict[str, Any]) -> List[Dict[str, Any]]:
+        def total(field: str, seed: Any) -> Dict[str, Any]:
+            # Agents written before counters existed start from their average times count
+            return {"$ifNull": [f"$performance_metrics.{field}", seed]}
+        
+        legacy_tasks = {"$ifNull": ["$performance_metrics.total_tasks", 0]}
+        return [
+            {"$set": {
+                "tasks_completed": {"$add": [{"$ifNull": ["$tasks_completed", 0]}, delta["tasks"]]},
+                "performance_metrics.total_tasks": {"$add": [legacy_tasks, delta["tasks"]]},
+                "performance_metrics.total_response_time": {"$add": [
+                    total("total_response_time", {"$multiply": [{"$ifNull": ["$performance_metrics.avg_response_time", 0]}, legacy_tasks]}),
+                    delta["response_time"]
+                ]},
+                "performance_metrics.total_intelligence_score": {"$add": [
+                    total("total_intelligence_score", {"$multiply": [{"$ifNull": ["$intelligence_score", 0]}, legacy_tasks]}),
+                    delta["intelligence"]
+                ]},
+                "conversation_memory": {"$slice": [
+                    {"$concatArrays": [{"$ifNull": ["$conversation_memory", []]}, {"$literal": delta["memory"]}]},
+                    -AGENT_MEMORY_LENGTH
+                ]}
+            }},
+            {"$set": {
+                "performance_metrics.avg_response_time": {"$divide": [
+                    "$performance_metrics.total_response_time", {"$max": [1, "$performance_metrics.total_tasks"]}
+                ]},
+                "intelligence_score": {"$divide": [
+                    "$performance_metrics.total_intelligence_score", {"$max": [1, "$performance_metrics.total_tasks"]}
+                ]},
+                "memory_efficiency": {"$min": [1.0, {"$divide": [10, {"$max": [1, {"$size": "$conversation_memory"}]}]}]}
+            }}
+        ]
+    
+    async def flush(self):
+        """Apply all buffered deltas"""
+        pending, self._pending, self._pending_tasks = self._pending, {}, 0
+        if not pending:
+            return
+        
+        AGENT_METRICS_FLUSH_SIZE.observe(sum(delta["tasks"] for delta in pending.values()))
+        try:
+            await write_collection("agents").bulk_write(
+                [UpdateOne({"id": agent_id}, self._update(delta)) for agent_id, delta in pending.items()],
+                ordered=False
+            )
+        except Exception as e:
+            # The driver already retried transient failures, re-applying could double count
+            logger.error(f"Agent metrics flush for {len(pending)} agents failed: {e}")
+            ERROR_RATE.labels(type="database", endpoint="agent_metrics").inc()
+            return
+        
+        for agent_id in pending:
+            rolling_summarizer.schedule("agent", agent_id)
+    
+    async def start(self):
+        self._flusher = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        if self._flusher:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        await self.flush()
+    
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_now.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_now.clear()
+            await self.flush()
+
+agent_metrics = AgentMetricsAggregator(
+    flush_interval_ms=AGENT_METRICS_FLUSH_INTERVAL_MS,
+    max_pending_tasks=AGENT_METRICS_FLUSH_MAX_TASKS
+)
+
+def build_model_router(live: bool = True) -> ModelRouter:
+    """Router with the configured costs and SLOs, ``live`` ones also consult the LLM latency histogram"""
+    return ModelRouter(
+        MODEL_COSTS, MODEL_SELECTION_CONFIG, ROUTER_SLOS,
+        window=ROUTER_WINDOW, min_samples=ROUTER_MIN_SAMPLES, explore=ROUTER_EXPLORE_RATE,
+        latency_prior=(lambda model: histogram_quantile(LLM_CALL_LATENCY, 0.95, model=model, purpose="task")) if live else None
+    )
+
+model_router = build_model_router()
+
+async def routing_history(limit: int, since: Optional[datetime] = None) -> List[Dict[str, Any]]:
+    """The newest finished tasks, oldest first, with just the fields routing learns from"""
+    query: Dict[str, Any] = {"status": {"$in": ["completed", "failed"]}}
+    if since:
+        query["created_at"] = {"$gte": since}
+    projection = {
+        "_id": 0, "model_used": 1, "task_type": 1, "status": 1, "intelligence_score": 1,
+        "intelligence_score_provisional": 1, "performance_data.llm_latency": 1,
+        "performance_data.cache_hit": 1, "performance_data.coalesced": 1
+    }
+    tasks = await db.tasks.find(query, projection).sort("created_at", -1).limit(limit).to_list(limit)
+    tasks.reverse()
+    return tasks
+
+async def bootstrap_model_router():
+    """Warm the router with recent task outcomes so routing survives restarts"""
+    try:
+        for task in await routing_history(ROUTER_BOOTSTRAP_LIMIT):
+            model_router.record_task(task)
+    except Exception as e:
+        logger.warning(f"Model router bootstrap failed: {e}")
+
+class IntelligenceScorer:
+    """Computes final intelligence scores off the request path.
+    
+    Completed tasks are queued with their provisional score. Consumers score
+    them in a process pool, so syllable counting on long responses neither
+    blocks the event loop nor holds the GIL, then update the task document and
+    correct the agent's intelligence total by the difference. Tasks whose
+    scoring is lost, e.g. on restart, keep ``intelligence_score_provisional``.
+    """
+    
+    def __init__(self, workers: int = 2, queue_size: int = 10000):
+        self.workers = workers
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._consumers: List[asyncio.Task] = []
+    
+    def submit(self, task_id: str, agent_id: str, response: str, task_type: str, provisional: float, model: str):
+        """Queue a completed task for its final score"""
+        try:
+            self._queue.put_nowait((task_id, agent_id, response, task_type, provisional, model, time.time()))
+        except asyncio.QueueFull:
+            logger.warning(f"Intelligence scoring queue full, task {task_id} keeps its provisional score")
+            ERROR_RATE.labels(type="queue_full", endpoint="intelligence_scoring").inc()
+    
+    async def start(self):
+        if self.workers > 0:
+            # Spawned, not forked: workers start clean instead of inheriting the loop, sockets and threads
+            self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        self._consumers = [asyncio.create_task(self._run()) for _ in range(max(1, self.workers))]
+    
+    async def stop(self):
+        for consumer in self._consumers:
+            consumer.cancel()
+        await asyncio.gather(*self._consumers, return_exceptions=True)
+        self._consumers = []
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+    
+    async def score(self, response: str, task_type: str) -> float:
+        if self._executor:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, calculate_intelligence_score, response, task_type)
+        return await asyncio.to_thread(calculate_intelligence_score, response, task_type)
+    
+    async def _run(self):
+        while True:
+            task_id, agent_id, response, task_type, provisional, model, completed_at = await self._queue.get()
+            try:
+                score = await self.score(response, task_type)
+                await write_collection("tasks").update_one(
+                    {"id": task_id},
+                    {"$set": {"intelligence_score": score, "intelligence_score_provisional": False, "score_version": SCORE_VERSION}}
+                )
+                agent_metrics.adjust_intelligence(agent_id, score - provisional)
+                model_router.record(model, task_type, score=score)
+                AI_INTELLIGENCE_SCORE.observe(score)
+                INTELLIGENCE_SCORING_LAG.observe(time.time() - completed_at)
+            except Exception as e:
+                logger.warning(f"Scoring task {task_id} failed: {e}")
+                ERROR_RATE.labels(type="scoring", endpoint="intelligence_scoring").inc()
+
+intelligence_scorer = IntelligenceScorer(workers=INTELLIGENCE_SCORE_WORKERS, queue_size=INTELLIGENCE_SCORE_QUEUE_SIZE)
+
+class RollingSummarizer:
+    """Background folding of old conversation turns and agent memory into persisted summaries.
+    
+    Summaries are updated incrementally: each fold merges the previous summary
+    with the turns since its watermark, so a request only ever reads one small
+    precomputed field.
+    """
+    
+    def __init__(self, model: str = SUMMARY_MODEL, max_tokens: int = SUMMARY_MAX_TOKENS):
+        self.model = model
+        self.max_tokens = max_tokens
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._scheduled: set = set()
+        self._worker: Optional[asyncio.Task] = None
+    
+    async def start(self):
+        self._worker = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        if self._worker:
+            self._worker.cancel()
+            await asyncio.gather(self._worker, return_exceptions=True)
+            self._worker = None
+    
+    def schedule(self, kind: str, target_id: str):
+        """Queue a conversation or agent for a summary check, at most once at a time"""
+        if (kind, target_id) not in self._scheduled:
+            self._scheduled.add((kind, target_id))
+            self._queue.put_nowait((kind, target_id))
+    
+    async def _run(self):
+        while True:
+            kind, target_id = await self._queue.get()
+            self._scheduled.discard((kind, target_id))
+            try:
+                if kind == "conversation":
+                    await self.fold_conversation(target_id)
+                else:
+                    await self.fold_agent_memory(target_id)
+            except Exception as e:
+                logger.warning(f"Summarizing {kind} {target_id} failed: {e}")
+                ERROR_RATE.labels(type="summary", endpoint=kind).inc()
+    
+    async def summarize(self, summary: Optional[str], turns: List[str]) -> str:
+        """Merge new turns into a running summary with the summary model"""
+        response = await groq_api_call(
+            groq_client,
+            [
+                {
+                    "role": "system",
+                    "content": "You maintain a running summary of an assistant's interactions. Merge the new "
+                               "turns into the existing summary, keeping facts, decisions, user preferences and "
+                               "open questions. Reply with the updated summary only."
+                },
+                {
+                    "role": "user",
+                    "content": f"Existing summary:\n{summary or '(none)'}\n\nNew turns:\n" + "\n".join(turns)
+                }
+            ],
+            self.model,
+            max_tokens=self.max_tokens,
+            temperature=0.2
+        )
+        return response.choices[0].message.content.strip()
+    
+    async def fold_conversation(self, conversation_id: str):
+        """Fold turns older than the recent window into the conversation summary"""
+        conversation = await db.conversations.find_one(
+            {"id": conversation_id}, {"summary": 1, "summarized_through": 1, "message_count": 1}
+        )
+        if not conversation:
+            return
+        summary = conversation.get("summary")
+        summarized_through = conversation.get("summarized_through", 0)
+        message_count = conversation.get("message_count", 0)
+        if message_count - summarized_through < CONVERSATION_SUMMARY_TRIGGER:
+            return
+        
+        fold_until = message_count - CONVERSATION_SUMMARY_KEEP
+        
+        while summarized_through < fold_until:
+            end = min(fold_until, summarized_through + CONVERSATION_SUMMARY_CHUNK)
+            turns = await conversation_store.messages_between(conversation_id, summarized_through, end)
+            new_summary = await self.summarize(summary, [f"{m['role']}: {m['content'][:2000]}" for m in turns])
+            # Only advance from the watermark we read, another instance may have folded already
+            watermark = summarized_through or {"$in": [0, None]}
+            result = await db.conversations.update_one(
+                {"id": conversation_id, "summarized_through": watermark},
+                {"$set": {"summary": new_summary, "summarized_through": end, "summary_updated_at": datetime.utcnow()}}
+            )
+            if not result.modified_count:
+                return
+            summary, summarized_through = new_summary, end
+    
+    async def fold_agent_memory(self, agent_id: str):
+        """Fold interactions newer than the watermark into the agent memory summary"""
+        agent = await db.agents.find_one(
+            {"id": agent_id}, {"conversation_memory": 1, "memory_summary": 1, "memory_summarized_at": 1}
+        )
+        if not agent:
+            return
+        summarized_at = agent.get("memory_summarized_at")
+        pending = [
+            item for item in agent.get("conversation_memory", [])
+            if item.get("timestamp") and (not summarized_at or item["timestamp"] > summarized_at)
+        ]
+        if len(pending) < AGENT_MEMORY_SUMMARY_TRIGGER:
+            return
+        
+        new_summary = await self.summarize(
+            agent.get("memory_summary"),
+            [f"Task: {item.get('prompt', '')}\nResult: {item.get('response', '')}" for item in pending]
+        )
+        result = await db.agents.update_one(
+            {"id": agent_id, "memory_summarized_at": summarized_at},
+            {"$set": {"memory_summary": new_summary, "memory_summarized_at": pending[-1]["timestamp"]}}
+        )
+        if result.modified_count:
+            await agent_cache.invalidate(agent_id)
+
+rolling_summarizer = RollingSummarizer()
+
+agent_memory_index = VectorMemoryIndex()
+_memory_index_bootstraps: set = set()
+_memory_index_bootstrap_tasks: Set[asyncio.Task] = set()  # The loop keeps only weak references to tasks
+
+def memory_index_entry(task_id: str, prompt: str, response: str, task_type: str, created_at: Any) -> tuple[str, Dict[str, Any]]:
+    """Indexed text and stored metadata of a completed task"""
+    entry = {
+        "task_id": task_id,
+        "prompt": prompt[:300],
+        "response": response[:300],
+        "task_type": task_type,
+        "created_at": created_at
+    }
+    return f"{prompt}\n{response[:1000]}", entry
+
+async def bootstrap_agent_memory_index(agent_id: str):
+    """Build an agent's index from its stored tasks the first time it is needed"""
+    try:
+        cursor = db.tasks.find(
+            {"agent_id": agent_id, "status": "completed"},
+            {"id": 1, "prompt": 1, "response": 1, "task_type": 1, "created_at": 1}
+        ).sort("created_at", -1).limit(VECTOR_MEMORY_BOOTSTRAP_LIMIT)
+        items = [
+            memory_index_entry(t["id"], t.get("prompt", ""), t.get("response") or "", t.get("task_type", "general"), t.get("created_at"))
+            async for t in cursor
+        ]
+        items.reverse()
+        await asyncio.to_thread(agent_memory_index.rebuild, agent_id, items, replace=False)
+    except Exception as e:
+        logger.warning(f"Building memory index for agent {agent_id} failed: {e}")
+        _memory_index_bootstraps.discard(agent_id)
+
+def ensure_agent_memory_index(agent_id: str) -> bool:
+    """Whether an agent's index exists, starting a bootstrap in the background if not"""
+    if agent_memory_index.exists(agent_id):
+        return True
+    if agent_id not in _memory_index_bootstraps:
+        _memory_index_bootstraps.add(agent_id)
+        task = asyncio.create_task(bootstrap_agent_memory_index(agent_id))
+        _memory_index_bootstrap_tasks.add(task)
+        task.add_done_callback(_memory_index_bootstrap_tasks.discard)
+    return False
+
+async def recall_agent_memory(agent_id: str, prompt: str) -> List[Dict[str, Any]]:
+    """Past tasks of an agent most relevant to a prompt"""
+    if not VECTOR_MEMORY_ENABLED or not ensure_agent_memory_index(agent_id):
+        return []
+    
+    with MEMORY_RECALL_LATENCY.time():
+        try:
+            return await asyncio.to_thread(
+                agent_memory_index.search, agent_id, prompt, VECTOR_MEMORY_TOP_K, VECTOR_MEMORY_MIN_SCORE
+            )
+        except Exception as e:
+            logger.warning(f"Memory recall for agent {agent_id} failed: {e}")
+            return []
+
+# In-flight deduplication of identical executions
+class SingleFlight:
+    """Coalesce concurrent executions sharing a key onto one shared future.
+    
+    Within a worker, callers await the same asyncio task. Across workers a
+    Redis lock elects one executor and the others poll for its result.
+    """
+    
+    def __init__(self, result_model: type, lock_ttl: int = 90, result_ttl: int = 30, poll_interval: float = 0.1):
+        self.result_model = result_model
+        self.lock_ttl = lock_ttl
+        self.result_ttl = result_ttl
+        self.poll_interval = poll_interval
+        self._inflight: Dict[str, asyncio.Task] = {}
+    
+    async def run(self, key: str, factory) -> tuple[Any, bool]:
+        """Run factory() once per key in flight, returns (result, coalesced)"""
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            SINGLE_FLIGHT_COALESCED.labels(scope="local").inc()
+            result, _ = await asyncio.shield(inflight)
+            return result, True
+        
+        inflight = asyncio.ensure_future(self._execute(key, factory))
+        self._inflight[key] = inflight
+        inflight.add_done_callback(lambda done: self._forget(key, done))
+        # Shield so one caller going away does not cancel the shared work
+        return await asyncio.shield(inflight)
+    
+    def _forget(self, key: str, done: asyncio.Task):
+        if self._inflight.get(key) is done:
+            del self._inflight[key]
+        if not done.cancelled():
+            done.exception()  # Mark retrieved even if every caller went away
+    
+    async def _execute(self, key: str, factory) -> tuple[Any, bool]:
+        redis_conn = await get_redis() if SINGLE_FLIGHT_DISTRIBUTED else None
+        if not redis_conn:
+            return await factory(), False
+        
+        lock_key = f"singleflight_lock_{key}"
+        result_key = f"singleflight_result_{key}"
+        try:
+            acquired = await redis_conn.set(lock_key, "1", nx=True, ex=self.lock_ttl)
+        except Exception as e:
+            logger.warning(f"Single-flight lock failed for {key}: {e}")
+            return await factory(), False
+        
+        if acquired:
+            try:
+                result = await factory()
+                await advanced_cache_set(result_key, result.model_dump_json(), expire=self.result_ttl)
+                return result, False
+            finally:
+                try:
+                    await redis_conn.delete(lock_key)
+                except Exception:
+                    pass
+        
+        # Another worker owns the execution; wait for its result while the lock lives
+        deadline = time.time() + self.lock_ttl
+        while time.time() < deadline:
+            await asyncio.sleep(self.poll_interval)
+            cached = await advanced_cache_get(result_key)
+            if cached:
+                SINGLE_FLIGHT_COALESCED.labels(scope="redis").inc()
+                return self.result_model.model_validate_json(cached), True
+            try:
+                if not await redis_conn.exists(lock_key):
+                    break  # Owner failed without publishing a result
+            except Exception:
+                break
+        return await factory(), False
+
+# Database initialization with enhanced indexes
+async def init_database():
+    """Enhanced database initialization"""
+    try:
+        # Agents collection indexes
+        await db.agents.create_index([("id", 1)], unique=True)
+        await db.agents.create_index([("status", 1)])
+        await db.agents.create_index([("specialization", 1)])
+        await db.agents.create_index([("created_at", -1)])
+        await db.agents.create_index([("intelligence_score", -1)])  # New index
+        
+        # Tasks collection indexes
+        await db.tasks.create_index([("id", 1)], unique=True)
+        await db.tasks.create_index([("agent_id", 1)])
+        await db.tasks.create_index([("status", 1)])
+        await db.tasks.create_index([("created_at", -1)])
+        await db.tasks.create_index([("agent_id", 1), ("status", 1)])
+        await db.tasks.create_index([("task_type", 1)])
+        await db.tasks.create_index([("intelligence_score", -1)])  # New index
+        await db.tasks.create_index([("status", 1), ("created_at", 1)])  # Task queue claims
+        await db.tasks.create_index([("agent_id", 1), ("created_at", 1)])  # Per-agent exports
+        
+        # Conversations collection indexes
+        await db.conversations.create_index([("id", 1)], unique=True)
+        await db.conversations.create_index([("agent_id", 1)])
+        await db.conversations.create_index([("updated_at", -1)])
+        await db.conversation_buckets.create_index([("conversation_id", 1), ("bucket", -1)], unique=True)
+        await db.conversation_buckets.create_index([("updated_at", 1)])
+        await conversation_store.migrate_embedded_messages()
+        
+        # New collections for enhanced features
+        await db.multimodal_files.create_index([("file_id", 1)], unique=True)
+        await db.multimodal_files.create_index([("created_at", -1)])
+        
+        logger.info("Enhanced database indexes created successfully")
+    except Exception as e:
+        logger.error(f"Error creating indexes: {e}")
+        ERROR_RATE.labels(type="database", endpoint="init").inc()
+
+async def download_nltk_data():
+    """Download required NLTK data"""
+    try:
+        import nltk
+        nltk.download('punkt', quiet=True)
+        nltk.download('stopwords', quiet=True)
+        logger.info("NLTK data downloaded successfully")
+    except Exception as e:
+        logger.warning(f"NLTK download failed: {e}")
+
+async def warm_up_services():
+    """Warm up external services"""
+    try:
+        # Warm up Redis
+        redis_conn = await get_redis()
+        if redis_conn:
+            await redis_conn.ping()
+        
+        # Warm up Groq API
+        await groq_api_call(
+            groq_client,
+            [{"role": "user", "content": "warmup"}],
+            "llama-3.1-8b-instant",
+            max_tokens=1
+        )
+        
+        logger.info("Services warmed up successfully")
+    except Exception as e:
+        logger.warning(f"Service warmup failed: {e}")
+
+async def cleanup_resources():
+    """Cleanup resources on shutdown"""
+    global redis_client
+    if redis_client:
+        await redis_client.close()
+    await groq_client.close()
+
+async def scrape_website(url: str) -> str:
+    """Scrape website content"""
+    try:
+        async with httpx.AsyncClient(timeout=10.0) as client:
+            response = await client.get(url)
+            soup = BeautifulSoup(response.text, 'html.parser')
+            
+            # Remove script and style elements
+            for script in soup(["script", "style"]):
+                script.extract()
+            
+            # Get text and clean it
+            text = soup.get_text()
+            lines = (line.strip() for line in text.splitlines())
+            chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
+            text = ' '.join(chunk for chunk in chunks if chunk)
+            
+            return text[:5000]  # Limit to 5000 characters
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Failed to scrape website: {str(e)}")
+
+# Enhanced middleware
+@app.middleware("http")
+async def enhanced_process_time_header(request: Request, call_next):
+    start_time = time.time()
+    REQUEST_COUNT.labels(method=request.method, endpoint=request.url.path).inc()
+    
+    try:
+        response = await call_next(request)
         process_time = time.time() - start_time
         REQUEST_DURATION.observe(process_time)
         response.headers["X-Process-Time"] = str(process_time)
@@ -544,266 +2084,1231 @@ async def root():
         ]
     }
 
+class TaskExecutionContext(BaseModel):
+    """State carried between the phases of an enhanced task execution"""
+    agent: Dict[str, Any]
+    task: Task
+    task_request: EnhancedCreateTaskRequest
+    messages: List[Dict[str, Any]] = []
+    selected_model: str
+    task_type: str
+    confidence: float
+    temperature: float
+    max_tokens: int = 2048
+    prompt_tokens: Optional[int] = None  # Counted once per request, reused by admission and accounting
+    llm_latency: Optional[float] = None  # Seconds of the call that served the task alone, what routing learns from
+    multimodal_results: List[Dict[str, Any]] = []
+    urls: List[str] = []
+    cache_hit: bool = False
+    coalesced: bool = False
+    persisted: bool = True  # Whether the task document exists yet
+    start_time: float
+
+class TaskExecutionResult(BaseModel):
+    """Shareable outcome of the expensive part of an enhanced task"""
+    response: str
+    model_used: Optional[str] = None
+    routing: Optional[Dict[str, Any]] = None
+    token_usage: Dict[str, Any] = {}
+    multimodal_results: List[Dict[str, Any]] = []
+    urls: List[str] = []
+    context_packing: Optional[Dict[str, Any]] = None
+    cache_hit: bool = False
+    llm_latency: Optional[float] = None
+
+task_single_flight = SingleFlight(TaskExecutionResult, lock_ttl=int(GROQ_REQUEST_TIMEOUT) + 30)
+
+def task_temperature(task_type: str) -> float:
+    """Sampling temperature for a task type"""
+    return 0.7 if task_type == "creative_tasks" else 0.3
+
+def route_enhanced_model(agent: Dict[str, Any], task_request: EnhancedCreateTaskRequest, task_type: str,
+                         explore: Optional[float] = None) -> Tuple[str, Optional[Dict[str, Any]]]:
+    """Pick the model for an enhanced task and the router's explanation, if it decided"""
+    if agent.get("model") == "auto":
+        if task_request.reasoning_mode:
+            return MODEL_SELECTION_CONFIG["reasoning"], None
+        if task_request.enable_multimodal:
+            return MODEL_SELECTION_CONFIG["multimodal"], None
+        if ROUTER_ENABLED:
+            return model_router.select(task_type, explore)
+        return MODEL_SELECTION_CONFIG.get(task_type, MODEL_SELECTION_CONFIG["default"]), None
+    return agent.get("model", "llama3-8b-8192"), None
+
+def select_enhanced_model(agent: Dict[str, Any], task_request: EnhancedCreateTaskRequest, task_type: str,
+                          explore: Optional[float] = None) -> str:
+    """Pick the model for an enhanced task"""
+    return route_enhanced_model(agent, task_request, task_type, explore)[0]
+
+async def prepare_enhanced_task(agent_id: str, task_request: EnhancedCreateTaskRequest, start_time: float, status: str = "processing", persist: bool = True) -> TaskExecutionContext:
+    """Load the agent, classify the prompt and record the task"""
+    # Get agent with error handling
+    agent = await agent_cache.get(agent_id)
+    if not agent:
+        ERROR_RATE.labels(type="not_found", endpoint="tasks").inc()
+        raise HTTPException(status_code=404, detail="Agent not found")
+    
+    # Advanced task classification
+    task_type, confidence, classification_source = classify_task_type_advanced(task_request.prompt)
+    complexity_score = len(task_request.prompt.split()) // 10
+    
+    # Enhanced model selection
+    selected_model, routing_decision = route_enhanced_model(agent, task_request, task_type)
+    
+    # Create enhanced task
+    task = Task(
+        id=str(uuid.uuid4()),
+        agent_id=agent_id,
+        prompt=task_request.prompt,
+        status=status,
+        task_type=task_type,
+        model_used=selected_model,
+        conversation_id=task_request.conversation_id,
+        created_at=datetime.utcnow(),
+        context_optimization=task_request.context_optimization,
+        metadata={
+            "complexity_score": complexity_score,
+            "classification_confidence": confidence,
+            # Only keyword and manual labels train the learned classifier, never its own predictions
+            "classification_source": classification_source,
+            "auto_selected": agent.get("model") == "auto",
+            "web_scraping_enabled": task_request.enable_web_scraping,
+            "visualization_enabled": task_request.enable_visualization,
+            "multimodal_enabled": task_request.enable_multimodal,
+            "reasoning_mode": task_request.reasoning_mode,
+            "file_count": len(task_request.file_ids)
+        }
+    )
+    if routing_decision:
+        # The candidate stats are live at GET /api/router/stats, every task needn't carry a copy
+        task.metadata["model_selection"] = {"model": routing_decision["model"], "reason": routing_decision["reason"]}
+    
+    task_doc = task.dict()
+    if status == "pending":
+        # Queued tasks carry their request so a worker can replay it
+        task_doc["execution_request"] = task_request.dict()
+    if persist:
+        await write_collection("tasks").insert_one(task_doc)
+    
+    context = TaskExecutionContext(
+        agent=agent,
+        task=task,
+        task_request=task_request,
+        selected_model=selected_model,
+        task_type=task_type,
+        confidence=confidence,
+        temperature=task_temperature(task_type),
+        persisted=persist,
+        start_time=start_time
+    )
+    return context
+
+def task_execution_key(context: TaskExecutionContext) -> str:
+    """Key identifying executions that would produce the same result"""
+    task_request = context.task_request
+    payload = {
+        "agent_id": context.task.agent_id,
+        "prompt": task_request.prompt,
+        "conversation_id": task_request.conversation_id,
+        "model": context.selected_model,
+        "temperature": context.temperature,
+        "max_tokens": context.max_tokens,
+        "enable_web_scraping": task_request.enable_web_scraping,
+        "enable_multimodal": task_request.enable_multimodal,
+        "file_ids": task_request.file_ids,
+        "context_optimization": task_request.context_optimization,
+        "reasoning_mode": task_request.reasoning_mode,
+        "use_cache": task_request.use_cache
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+def count_task_tokens(messages: List[Dict], task_response: str, model: str, response: Any = None, prompt_tokens: Optional[int] = None) -> Dict[str, Any]:
+    """Token usage of a task, from the completion's usage field when present"""
+    usage = usage_tokens(response) if response is not None else None
+    if usage:
+        return {**usage, "source": "usage"}
+    if prompt_tokens is None:
+        prompt_tokens = count_message_tokens(messages, model)
+    completion_tokens = count_tokens(task_response, model)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "source": "tokenizer"
+    }
+
+async def execute_enhanced_task(context: TaskExecutionContext) -> TaskExecutionResult:
+    """Build the prompt, run the LLM call and score the response"""
+    context.messages = await build_task_messages(context)
+    context.prompt_tokens = count_message_tokens(context.messages, context.selected_model)
+    
+    # Enhanced AI execution with circuit breaker
+    try:
+        response, cache_hit, routing = await cached_groq_api_call(
+            groq_client,
+            context.messages,
+            context.selected_model,
+            task_type=context.task_type,
+            use_cache=context.task_request.use_cache,
+            prompt_tokens=context.prompt_tokens,
+            purpose="task",
+            temperature=context.temperature,
+            max_tokens=context.max_tokens
+        )
+    except Exception as e:
+        logger.error(f"AI execution failed: {e}")
+        ERROR_RATE.labels(type="ai_execution", endpoint="tasks").inc()
+        raise HTTPException(status_code=500, detail=f"AI execution failed: {str(e)}")
+    
+    task_response = response.choices[0].message.content
+    served_model = routing["served_model"] if routing else (response.model or context.selected_model)
+    return TaskExecutionResult(
+        response=task_response,
+        model_used=served_model,
+        routing=routing,
+        token_usage=count_task_tokens(context.messages, task_response, served_model, response, context.prompt_tokens),
+        multimodal_results=context.multimodal_results,
+        urls=context.urls,
+        context_packing=context.task.metadata.get("context_packing"),
+        cache_hit=cache_hit,
+        llm_latency=routing["latency"] if routing else None
+    )
+
+async def build_task_messages(context: TaskExecutionContext) -> List[Dict[str, Any]]:
+    """Build the conversation context and enhanced prompt for a task"""
+    agent = context.agent
+    task_request = context.task_request
+    
+    # Multi-modal file processing
+    enhanced_prompt = task_request.prompt
+    
+    if task_request.enable_multimodal and task_request.file_ids:
+        for file_id in task_request.file_ids:
+            file_info_str = await advanced_cache_get(f"file_{file_id}")
+            if file_info_str:
+                file_info = json.loads(file_info_str)
+                file_path = file_info.get("path")
+                
+                if file_path and os.path.exists(file_path):
+                    with open(file_path, "rb") as f:
+                        file_data = f.read()
+                    
+                    if file_info.get("content_type", "").startswith("image/"):
+                        result = await multimodal_processor.process_image(
+                            file_data, task_request.prompt
+                        )
+                    else:
+                        result = await multimodal_processor.process_document(
+                            file_data, file_info.get("filename", ""), task_request.prompt
+                        )
+                    
+                    context.multimodal_results.append(result)
+                    enhanced_prompt += f"\n\nFile Analysis: {result.get('response', 'File processed')}"
+    
+    # Web scraping enhancement
+    if task_request.enable_web_scraping:
+        context.urls = re.findall(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+', task_request.prompt)
+        for url in context.urls[:3]:  # Limit to 3 URLs
+            try:
+                content = await scrape_website(url)
+                enhanced_prompt += f"\n\nScraped content from {url}:\n{content[:1000]}"
+            except:
+                enhanced_prompt += f"\n\nNote: Could not scrape content from {url}"
+    
+    # Reasoning mode enhancement
+    if task_request.reasoning_mode:
+        enhanced_prompt = f"""Think step by step about this task. Use chain-of-thought reasoning.
+
+Task: {enhanced_prompt}
+
+Please provide a detailed, logical response with clear reasoning steps."""
+    
+    user_msg = {"role": "user", "content": enhanced_prompt}
+    
+    # Enhanced conversation context management
+    messages = [{"role": "system", "content": agent["system_prompt"]}]
+    
+    if task_request.context_optimization:
+        # Pack history into the model's token budget, reserving the prompt and completion
+        conversation_summary, conversation_context = None, []
+        recall = recall_agent_memory(agent["id"], task_request.prompt)
+        if task_request.conversation_id:
+            (conversation_summary, conversation_context), recalled = await asyncio.gather(
+                conversation_store.context(
+                    task_request.conversation_id,
+                    memory_manager.token_budget(context.selected_model, context.max_tokens),
+                    context.selected_model
+                ),
+                recall
+            )
+        else:
+            recalled = await recall
+        messages, packing = memory_manager.pack_conversation_context(
+            messages + conversation_context, memory_manager.agent_memory_summary(agent), context.selected_model,
+            max_tokens=context.max_tokens, reserved_tokens=message_tokens(user_msg, context.selected_model),
+            conversation_summary=conversation_summary, recalled=recalled
+        )
+        context.task.metadata["context_packing"] = packing
+    
+    messages.append(user_msg)
+    return messages
+
+async def index_completed_task(task: Task, task_response: str, task_type: str):
+    """Append a completed task to its agent's memory index"""
+    try:
+        text, entry = memory_index_entry(task.id, task.prompt, task_response, task_type, task.created_at)
+        await asyncio.to_thread(agent_memory_index.add, task.agent_id, text, entry)
+    except Exception as e:
+        logger.warning(f"Indexing task {task.id} failed: {e}")
+
+async def finalize_enhanced_task(context: TaskExecutionContext, task_response: str, token_usage: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Persist a finished task and update conversation and agent state"""
+    task = context.task
+    task_request = context.task_request
+    selected_model = context.selected_model
+    processing_time = time.time() - context.start_time
+    
+    if token_usage is None:
+        token_usage = count_task_tokens(context.messages, task_response, selected_model, prompt_tokens=context.prompt_tokens)
+    
+    # Provisional intelligence score, the background scorer adds readability
+    intelligence_score = provisional_intelligence_score(task_response, context.task_type)
+    
+    # Enhanced task completion
+    completion_data = {
+        "response": task_response,
+        "status": "completed",
+        "model_used": selected_model,
+        "metadata": task.metadata,
+        "completed_at": datetime.utcnow(),
+        "intelligence_score": intelligence_score,
+        "intelligence_score_provisional": True,
+        "performance_data": {
+            "processing_time": processing_time,
+            "model_used": selected_model,
+            "tokens_used": token_usage["total_tokens"],
+            "prompt_tokens": token_usage["prompt_tokens"],
+            "completion_tokens": token_usage["completion_tokens"],
+            "token_count_source": token_usage["source"],
+            "classification_confidence": context.confidence,
+            "context_optimized": task_request.context_optimization,
+            "llm_latency": context.llm_latency,
+            "cache_hit": context.cache_hit,
+            "coalesced": context.coalesced
+        },
+        "multimodal_results": context.multimodal_results
+    }
+    
+    # Task, conversation and memory index writes are independent, run them together
+    if context.persisted:
+        writes = [write_collection("tasks").update_one({"id": task.id}, {"$set": completion_data})]
+    else:
+        writes = [write_collection("tasks").insert_one({**task.dict(), **completion_data})]
+    
+    # Enhanced conversation update
+    if task_request.conversation_id:
+        writes.append(conversation_store.append(task_request.conversation_id, [
+            {"role": "user", "content": task_request.prompt},
+            {"role": "assistant", "content": task_response}
+        ]))
+    
+    # Make the task recallable for the agent's future prompts, a bootstrap picks it up from Mongo
+    if VECTOR_MEMORY_ENABLED and ensure_agent_memory_index(task.agent_id):
+        writes.append(index_completed_task(task, task_response, context.task_type))
+    
+    await asyncio.gather(*writes)
+    if task_request.conversation_id:
+        rolling_summarizer.schedule("conversation", task_request.conversation_id)
+    intelligence_scorer.submit(task.id, task.agent_id, task_response, context.task_type, intelligence_score, selected_model)
+    # Cache hits and coalesced followers never reached a model, they are no evidence of
+    # its errors or latency. Only the serving call's own latency is the model's, not
+    # scraping, queueing or failed attempts before it
+    if not context.cache_hit and not context.coalesced:
+        model_router.record(selected_model, context.task_type, error=False, latency=context.llm_latency)
+    
+    # Enhanced agent metrics update, written behind in batches
+    agent_metrics.record(task.agent_id, processing_time, intelligence_score, {
+        "task_id": task.id,
+        "prompt": task_request.prompt,
+        "response": task_response[:200],  # Store truncated for efficiency
+        "timestamp": datetime.utcnow(),
+        "processing_time": processing_time,
+        "intelligence_score": intelligence_score
+    })
+    
+    # Update task object for response
+    task.response = task_response
+    task.model_used = selected_model
+    task.status = "completed"
+    task.completed_at = datetime.utcnow()
+    task.intelligence_score = intelligence_score
+    task.intelligence_score_provisional = True
+    task.performance_data = completion_data["performance_data"]
+    
+    TASK_COUNT.labels(status="completed", model=selected_model).inc()
+    
+    return {
+        **task.dict(),
+        "multimodal_results": context.multimodal_results,
+        "enhanced_features_used": {
+            "context_optimization": task_request.context_optimization,
+            "multimodal_processing": len(context.multimodal_results) > 0,
+            "web_scraping": task_request.enable_web_scraping and len(context.urls) > 0,
+            "reasoning_mode": task_request.reasoning_mode,
+            "intelligence_score": intelligence_score
+        }
+    }
+
+async def mark_task_failed(task_id: str, error: Exception, start_time: float, status: str = "failed", response: Optional[str] = None, task: Optional[Task] = None):
+    """Record a failed task execution, inserting ``task`` if it was never persisted"""
+    failure = {
+        "response": response if response is not None else f"System Error: {str(error)}",
+        "status": status,
+        "completed_at": datetime.utcnow(),
+        "performance_data": {
+            "processing_time": time.time() - start_time,
+            "error": str(error)
+        }
+    }
+    update = {"$set": failure}
+    if task:
+        update["$setOnInsert"] = {k: v for k, v in task.dict().items() if k not in failure}
+    try:
+        stored = await write_collection("tasks").find_one_and_update(
+            {"id": task_id}, update, upsert=task is not None,
+            projection={"_id": 0, "model_used": 1, "task_type": 1},
+            return_document=ReturnDocument.AFTER
+        )
+    except Exception as e:
+        logger.warning(f"Failed to record task failure for {task_id}: {e}")
+        return
+    if status == "failed" and stored and stored.get("model_used") and stored.get("task_type"):
+        model_router.record(stored["model_used"], stored["task_type"], error=True)
+
+async def run_enhanced_task(context: TaskExecutionContext) -> Dict[str, Any]:
+    """Execute a prepared task and persist its outcome"""
+    # Identical concurrent requests share one execution, each keeps its own task
+    if SINGLE_FLIGHT_ENABLED:
+        result, context.coalesced = await task_single_flight.run(
+            task_execution_key(context), lambda: execute_enhanced_task(context)
+        )
+    else:
+        result = await execute_enhanced_task(context)
+    
+    context.multimodal_results = result.multimodal_results
+    context.urls = result.urls
+    context.cache_hit = result.cache_hit
+    context.llm_latency = result.llm_latency
+    if result.context_packing:
+        context.task.metadata["context_packing"] = result.context_packing
+    if result.routing and (result.routing["fallback_reason"] or result.routing["attempts"][-1].get("hedged")):
+        # Record which model actually served the task and why
+        context.task.metadata["routing"] = result.routing
+    if result.model_used:
+        context.selected_model = result.model_used
+    return await finalize_enhanced_task(context, result.response, result.token_usage)
+
+async def load_task_context(task_doc: Dict[str, Any], start_time: float) -> TaskExecutionContext:
+    """Rebuild the execution context of a queued task"""
+    agent = await agent_cache.get(task_doc["agent_id"])
+    if not agent:
+        raise HTTPException(status_code=404, detail="Agent not found")
+    
+    task = Task(**{field: task_doc[field] for field in Task.model_fields if field in task_doc})
+    return TaskExecutionContext(
+        agent=agent,
+        task=task,
+        task_request=EnhancedCreateTaskRequest(**task_doc["execution_request"]),
+        selected_model=task.model_used,
+        task_type=task.task_type,
+        confidence=task.metadata.get("classification_confidence", 0.0),
+        temperature=task_temperature(task.task_type),
+        start_time=start_time
+    )
+
+# Background execution of queued tasks
+class TaskWorkerPool:
+    """Bounded pool of asyncio workers draining pending tasks from Mongo.
+    
+    Tasks are claimed atomically with find_one_and_update, so any number of
+    API workers can share the queue.
+    """
+    
+    def __init__(self, concurrency: int = 8, poll_interval: float = 1.0, stale_after: int = 600, sweep_interval: float = 60.0):
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self.sweep_interval = sweep_interval
+        self._wakeup = asyncio.Event()
+        self._workers: List[asyncio.Task] = []
+        self._task_events: Dict[str, asyncio.Event] = {}
+        self._subscribers: Dict[str, int] = {}
+    
+    async def start(self):
+        await self.requeue_stale()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+        self._workers.append(asyncio.create_task(self._sweeper()))
+        logger.info(f"Task worker pool started with {self.concurrency} workers")
+    
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+    
+    def notify(self):
+        """Wake idle workers after a task was enqueued"""
+        self._wakeup.set()
+    
+    async def requeue_stale(self):
+        """Return tasks orphaned by a crashed worker to the queue"""
+        try:
+            result = await db.tasks.update_many(
+                {
+                    "status": "processing",
+                    "execution_request": {"$exists": True},
+                    "started_at": {"$lt": datetime.utcnow() - timedelta(seconds=self.stale_after)}
+                },
+                {"$set": {"status": "pending"}}
+            )
+            if result.modified_count:
+                logger.info(f"Requeued {result.modified_count} stale tasks")
+                self.notify()
+        except Exception as e:
+            logger.warning(f"Requeueing stale tasks failed: {e}")
+    
+    async def _sweeper(self):
+        # Leases of workers that died in another process expire while this one runs
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            await self.requeue_stale()
+    
+    async def wait_for_update(self, task_id: str, timeout: float):
+        """Wait until a task handled by this worker changes state, or timeout"""
+        event = self._task_events.setdefault(task_id, asyncio.Event())
+        self._subscribers[task_id] = self._subscribers.get(task_id, 0) + 1
+        try:
+            await asyncio.wait_for(event.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            # Tasks finished by another process never fire the event, drop it with its last subscriber
+            self._subscribers[task_id] -= 1
+            if not self._subscribers[task_id]:
+                self._subscribers.pop(task_id)
+                self._task_events.pop(task_id, None)
+            elif event.is_set() and self._task_events.get(task_id) is event:
+                self._task_events.pop(task_id)
+    
+    def _publish(self, task_id: str):
+        event = self._task_events.get(task_id)
+        if event:
+            event.set()
+    
+    async def _claim(self) -> Optional[Dict[str, Any]]:
+        return await db.tasks.find_one_and_update(
+            {"status": "pending", "execution_request": {"$exists": True}},
+            {"$set": {"status": "processing", "started_at": datetime.utcnow()}},
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+    
+    async def _worker(self):
+        while True:
+            try:
+                task_doc = await self._claim()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Task claim failed: {e}")
+                task_doc = None
+            
+            if not task_doc:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            
+            await self._execute(task_doc)
+    
+    async def _execute(self, task_doc: Dict[str, Any]):
+        start_time = time.time()
+        TASK_QUEUE_WAIT.observe((task_doc["started_at"] - task_doc["created_at"]).total_seconds())
+        self._publish(task_doc["id"])
+        context = None
+        try:
+            context = await load_task_context(task_doc, start_time)
+            await run_enhanced_task(context)
+        except asyncio.CancelledError:
+            # Leave the task for requeue_stale on the next start
+            raise
+        except Exception as e:
+            detail = e.detail if isinstance(e, HTTPException) else str(e)
+            logger.error(f"Queued task {task_doc['id']} failed: {detail}")
+            ERROR_RATE.labels(type="system", endpoint="task_worker").inc()
+            await mark_task_failed(task_doc["id"], Exception(detail), start_time)
+            TASK_COUNT.labels(status="failed", model=context.selected_model if context else "unknown").inc()
+        finally:
+            self._publish(task_doc["id"])
+
+task_worker_pool = TaskWorkerPool(
+    concurrency=TASK_WORKER_CONCURRENCY,
+    poll_interval=TASK_WORKER_POLL_INTERVAL,
+    stale_after=int(GROQ_REQUEST_TIMEOUT) * 10,
+    sweep_interval=TASK_WORKER_SWEEP_INTERVAL
+)
+
 @app.post("/api/agents/{agent_id}/tasks/enhanced")
 @limiter.limit("50/minute")
-async def create_enhanced_task(request: Request, agent_id: str, task_request: EnhancedCreateTaskRequest):
+async def create_enhanced_task(request: Request, response: Response, agent_id: str, task_request: EnhancedCreateTaskRequest):
     """Enhanced task creation with advanced AI capabilities"""
     start_time = time.time()
+    context = None
     
     try:
-        # Get agent with error handling
-        agent = await db.agents.find_one({"id": agent_id})
-        if not agent:
-            ERROR_RATE.labels(type="not_found", endpoint="tasks").inc()
-            raise HTTPException(status_code=404, detail="Agent not found")
-        
-        # Advanced task classification
-        task_type, confidence = classify_task_type_advanced(task_request.prompt)
-        complexity_score = len(task_request.prompt.split()) // 10
-        
-        # Enhanced model selection
-        if agent.get("model") == "auto":
-            if task_request.reasoning_mode:
-                selected_model = MODEL_SELECTION_CONFIG["reasoning"]
-            elif task_request.enable_multimodal:
-                selected_model = MODEL_SELECTION_CONFIG["multimodal"]  
-            else:
-                selected_model = MODEL_SELECTION_CONFIG.get(task_type, MODEL_SELECTION_CONFIG["default"])
-        else:
-            selected_model = agent.get("model", "llama3-8b-8192")
-        
-        # Create enhanced task
-        task = Task(
-            id=str(uuid.uuid4()),
-            agent_id=agent_id,
-            prompt=task_request.prompt,
-            status="processing",
-            task_type=task_type,
-            model_used=selected_model,
-            conversation_id=task_request.conversation_id,
-            created_at=datetime.utcnow(),
-            context_optimization=task_request.context_optimization,
-            metadata={
-                "complexity_score": complexity_score,
-                "classification_confidence": confidence,
-                "auto_selected": agent.get("model") == "auto",
-                "web_scraping_enabled": task_request.enable_web_scraping,
-                "visualization_enabled": task_request.enable_visualization,
-                "multimodal_enabled": task_request.enable_multimodal,
-                "reasoning_mode": task_request.reasoning_mode,
-                "file_count": len(task_request.file_ids)
+        if task_request.async_mode:
+            context = await prepare_enhanced_task(agent_id, task_request, start_time, status="pending")
+            task_worker_pool.notify()
+            response.status_code = 202
+            return {
+                **context.task.dict(),
+                "status_url": f"/api/tasks/{context.task.id}",
+                "events_url": f"/api/tasks/{context.task.id}/events"
             }
-        )
         
-        await db.tasks.insert_one(task.dict())
+        context = await prepare_enhanced_task(agent_id, task_request, start_time, persist=not TASK_DEFER_INSERT)
+        return await run_enhanced_task(context)
         
-        # Enhanced conversation context management
-        messages = [{"role": "system", "content": agent["system_prompt"]}]
-        
-        if task_request.context_optimization:
-            # Use advanced memory management
-            conversation_context = []
-            if task_request.conversation_id:
-                conversation = await db.conversations.find_one({"id": task_request.conversation_id})
-                if conversation and conversation.get("messages"):
-                    conversation_context = conversation["messages"]
-            
-            agent_memory = agent.get("conversation_memory", [])
-            messages = await memory_manager.optimize_conversation_context(
-                messages + conversation_context, agent_memory
-            )
-        
-        # Multi-modal file processing
-        enhanced_prompt = task_request.prompt
-        multimodal_results = []
+    except HTTPException as e:
+        if context:
+            # Execution errors must not leave the task processing, or unrecorded when deferred
+            await mark_task_failed(context.task.id, Exception(e.detail), start_time, task=None if context.persisted else context.task)
+            TASK_COUNT.labels(status="failed", model=context.selected_model).inc()
+        raise
+    except Exception as e:
+        logger.error(f"Enhanced task creation failed: {e}")
+        ERROR_RATE.labels(type="system", endpoint="tasks").inc()
         
-        if task_request.enable_multimodal and task_request.file_ids:
-            for file_id in task_request.file_ids:
-                file_info_str = await advanced_cache_get(f"file_{file_id}")
-                if file_info_str:
-                    file_info = json.loads(file_info_str)
-                    file_path = file_info.get("path")
-                    
-                    if file_path and os.path.exists(file_path):
-                        with open(file_path, "rb") as f:
-                            file_data = f.read()
-                        
-                        if file_info.get("content_type", "").startswith("image/"):
-                            result = await multimodal_processor.process_image(
-                                file_data, task_request.prompt
-                            )
-                        else:
-                            result = await multimodal_processor.process_document(
-                                file_data, file_info.get("filename", ""), task_request.prompt
-                            )
-                        
-                        multimodal_results.append(result)
-                        enhanced_prompt += f"\n\nFile Analysis: {result.get('response', 'File processed')}"
-        
-        # Web scraping enhancement
-        if task_request.enable_web_scraping:
-            urls = re.findall(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+', task_request.prompt)
-            for url in urls[:3]:  # Limit to 3 URLs
-                try:
-                    content = await scrape_website(url)
-                    enhanced_prompt += f"\n\nScraped content from {url}:\n{content[:1000]}"
-                except:
-                    enhanced_prompt += f"\n\nNote: Could not scrape content from {url}"
+        # Update task with error
+        if context:
+            await mark_task_failed(context.task.id, e, start_time, task=None if context.persisted else context.task)
         
-        # Reasoning mode enhancement
-        if task_request.reasoning_mode:
-            enhanced_prompt = f"""Think step by step about this task. Use chain-of-thought reasoning.
-
-Task: {enhanced_prompt}
+        TASK_COUNT.labels(status="failed", model=context.selected_model if context else "unknown").inc()
+        raise HTTPException(status_code=500, detail=f"Enhanced task execution failed: {str(e)}")
 
-Please provide a detailed, logical response with clear reasoning steps."""
-        
-        messages.append({"role": "user", "content": enhanced_prompt})
-        
-        # Enhanced AI execution with circuit breaker
+@app.post("/api/agents/{agent_id}/tasks/enhanced/stream")
+@limiter.limit("50/minute")
+async def create_enhanced_task_stream(request: Request, agent_id: str, task_request: EnhancedCreateTaskRequest):
+    """Enhanced task creation streaming tokens as NDJSON"""
+    start_time = time.time()
+    
+    # Resolve the agent before the stream opens so lookup errors still
+    # surface as regular HTTP errors
+    try:
+        context = await prepare_enhanced_task(agent_id, task_request, start_time)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Streaming task preparation failed: {e}")
+        ERROR_RATE.labels(type="system", endpoint="tasks_stream").inc()
+        raise HTTPException(status_code=500, detail=f"Enhanced task execution failed: {str(e)}")
+    
+    # Streams cannot switch models mid-way, so skip open circuits up front
+    available_model, fallback_reason = first_available_model(context.selected_model)
+    if fallback_reason:
+        context.task.metadata["routing"] = {
+            "requested_model": context.selected_model,
+            "served_model": available_model,
+            "fallback_reason": fallback_reason
+        }
+        MODEL_FALLBACKS.labels(from_model=context.selected_model, to_model=available_model, reason=fallback_reason).inc()
+        context.selected_model = available_model
+    
+    async def event_stream():
+        chunks = []
         try:
-            response = await groq_api_call(
-                groq_client,
-                messages,
-                selected_model,
-                temperature=0.7 if task_type == "creative_tasks" else 0.3,
-                max_tokens=2048
+            yield ndjson_event({
+                "type": "task",
+                "task_id": context.task.id,
+                "model_used": context.selected_model,
+                "task_type": context.task_type
+            })
+            context.messages = await build_task_messages(context)
+            context.prompt_tokens = count_message_tokens(context.messages, context.selected_model)
+            
+            cache_ttl = completion_cache.ttl_for(context.task_type) if task_request.use_cache else 0
+            cache_key = CompletionCache.make_key(
+                context.messages, context.selected_model, context.temperature, context.max_tokens
             )
+            cached = await completion_cache.get(cache_key) if cache_ttl else None
+            
+            timing: Dict[str, float] = {}
+            if cached:
+                context.cache_hit = True
+                tokens = replay_completion(ChatCompletion.model_validate_json(cached).choices[0].message.content)
+            else:
+                tokens = groq_api_stream(
+                    groq_client,
+                    context.messages,
+                    context.selected_model,
+                    prompt_tokens=context.prompt_tokens,
+                    timing=timing,
+                    temperature=context.temperature,
+                    max_tokens=context.max_tokens
+                )
             
-            task_response = response.choices[0].message.content
-            processing_time = time.time() - start_time
+            async for token in tokens:
+                if not chunks:
+                    TIME_TO_FIRST_TOKEN.labels(model=context.selected_model).observe(time.time() - start_time)
+                chunks.append(token)
+                yield ndjson_event({"type": "token", "content": token})
+            context.llm_latency = timing.get("latency")
             
-            # Calculate intelligence score
-            intelligence_score = calculate_intelligence_score(task_response, task_type)
-            AI_INTELLIGENCE_SCORE.observe(intelligence_score)
+            task_response = "".join(chunks)
+            if cache_ttl and not cached:
+                await completion_cache.set(
+                    cache_key, build_chat_completion(task_response, context.selected_model).model_dump_json(), cache_ttl
+                )
             
+            result = await finalize_enhanced_task(context, task_response)
+            yield ndjson_event({"type": "done", "task": result})
+            
+        except (asyncio.CancelledError, GeneratorExit):
+            # Client went away; keep whatever was generated so far
+            await asyncio.shield(mark_task_failed(
+                context.task.id, Exception("Client disconnected"), start_time,
+                status="cancelled", response="".join(chunks)
+            ))
+            TASK_COUNT.labels(status="cancelled", model=context.selected_model).inc()
+            raise
         except Exception as e:
-            logger.error(f"AI execution failed: {e}")
-            ERROR_RATE.labels(type="ai_execution", endpoint="tasks").inc()
-            raise HTTPException(status_code=500, detail=f"AI execution failed: {str(e)}")
-        
-        # Enhanced task completion
-        completion_data = {
-            "response": task_response,
-            "status": "completed",
-            "completed_at": datetime.utcnow(),
-            "intelligence_score": intelligence_score,
-            "performance_data": {
-                "processing_time": processing_time,
-                "model_used": selected_model,
-                "tokens_used": len(task_response.split()) * 1.3,
-                "classification_confidence": confidence,
-                "context_optimized": task_request.context_optimization
-            },
-            "multimodal_results": multimodal_results
-        }
+            logger.error(f"Streaming task execution failed: {e}")
+            ERROR_RATE.labels(type="ai_execution", endpoint="tasks_stream").inc()
+            await mark_task_failed(context.task.id, e, start_time)
+            TASK_COUNT.labels(status="failed", model=context.selected_model).inc()
+            yield ndjson_event({"type": "error", "task_id": context.task.id, "detail": f"AI execution failed: {str(e)}"})
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/api/conversations")
+@limiter.limit("20/minute")
+async def create_conversation(request: Request, agent_id: str):
+    """Create a new conversation"""
+    agent = await db.agents.find_one({"id": agent_id}, {"id": 1})
+    if not agent:
+        raise HTTPException(status_code=404, detail="Agent not found")
+    
+    conversation = Conversation(
+        id=str(uuid.uuid4()),
+        agent_id=agent_id,
+        created_at=datetime.utcnow(),
+        updated_at=datetime.utcnow()
+    )
+    
+    await db.conversations.insert_one(conversation.dict())
+    return conversation
+
+@app.get("/api/conversations/{conversation_id}")
+@limiter.limit("100/minute")
+async def get_conversation(request: Request, conversation_id: str, before: Optional[int] = None, limit: int = CONVERSATION_PAGE_SIZE):
+    """Get a page of conversation history, newest page first; pass ``next_before`` back as ``before``"""
+    conversation = await db.conversations.find_one({"id": conversation_id}, {"messages": 0})
+    if not conversation:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    
+    messages, next_before = await conversation_store.page(conversation_id, before, max(1, min(limit, 500)))
+    conversation["_id"] = str(conversation["_id"])
+    conversation["messages"] = messages
+    conversation["next_before"] = next_before
+    return conversation
+
+@app.get("/api/conversations/{conversation_id}/export")
+@limiter.limit("10/minute")
+async def export_conversation(request: Request, conversation_id: str, since: Optional[datetime] = None, until: Optional[datetime] = None, compress: bool = False):
+    """Stream a conversation's messages as NDJSON, oldest first"""
+    conversation = await db.conversations.find_one({"id": conversation_id}, {"id": 1})
+    if not conversation:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    # Stored timestamps are naive UTC, an aware bound would fail mid-stream after the headers went out
+    since = naive_utc(since) if since else None
+    until = naive_utc(until) if until else None
+    
+    # Buckets are append-only, their timestamps bound the messages they hold
+    query: Dict[str, Any] = {"conversation_id": conversation_id}
+    if since:
+        query["updated_at"] = {"$gte": since}
+    if until:
+        query["created_at"] = {"$lte": until}
+    
+    async def records():
+        cursor = db.conversation_buckets.find(query, {"_id": 0, "messages": 1}).sort("bucket", 1).batch_size(10)
+        async for bucket in cursor:
+            for message in bucket.get("messages", []):
+                if (since and message["created_at"] < since) or (until and message["created_at"] > until):
+                    continue
+                yield {"conversation_id": conversation_id, **message}
+    
+    suffix = ".ndjson.gz" if compress else ".ndjson"
+    return export_response(records(), f"conversation_{conversation_id}{suffix}", compress)
+
+TERMINAL_TASK_STATUSES = {"completed", "failed", "cancelled"}
+
+class ArchivalJob:
+    """Periodic compaction of the hot collections into the cold archive.
+    
+    Finished tasks past TASK_RETENTION_DAYS, and conversation buckets that are
+    fully folded into the rolling summary and idle past
+    CONVERSATION_RETENTION_DAYS, are written to archive files and then removed
+    from MongoDB. A lease in ``job_leases`` keeps concurrent workers from
+    running it twice; ARCHIVE_DIR should be shared storage when several hosts
+    run the API.
+    """
+    
+    LEASE_ID = "archival"
+    
+    def __init__(self, interval_hours: float = 6, batch_size: int = 5000):
+        self.interval = interval_hours * 3600
+        self.batch_size = batch_size
+        self.owner = str(uuid.uuid4())
+        self._runner: Optional[asyncio.Task] = None
+    
+    async def start(self):
+        self._runner = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        if self._runner:
+            self._runner.cancel()
+            await asyncio.gather(self._runner, return_exceptions=True)
+            self._runner = None
+    
+    async def _run(self):
+        while True:
+            try:
+                await self.run()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Archival run failed: {e}")
+                ERROR_RATE.labels(type="archive", endpoint="job").inc()
+            await asyncio.sleep(self.interval)
+    
+    async def run(self) -> Dict[str, Any]:
+        """Compact conversations and archive old tasks once"""
+        if not await acquire_job_lease(self.LEASE_ID, self.owner, ttl=max(self.interval, 3600)):
+            return {"skipped": "another worker holds the archival lease"}
+        try:
+            return {
+                "tasks": await self.archive_tasks(datetime.utcnow() - timedelta(days=TASK_RETENTION_DAYS)),
+                "conversation_messages": await self.compact_conversations(
+                    datetime.utcnow() - timedelta(days=CONVERSATION_RETENTION_DAYS)
+                )
+            }
+        finally:
+            await release_job_lease(self.LEASE_ID, self.owner)
+    
+    async def archive_tasks(self, cutoff: datetime) -> int:
+        """Move finished tasks created before ``cutoff`` to the archive"""
+        archived = 0
+        query = {"created_at": {"$lt": cutoff}, "status": {"$in": list(TERMINAL_TASK_STATUSES)}}
+        while True:
+            batch = await db.tasks.find(query, {"_id": 0, "execution_request": 0}).sort("created_at", 1).to_list(self.batch_size)
+            if not batch:
+                return archived
+            # Written before deleting: a crash in between archives a batch twice but never loses it
+            await asyncio.to_thread(write_archive, "tasks", batch)
+            await db.tasks.delete_many({"id": {"$in": [task["id"] for task in batch]}})
+            archived += len(batch)
+            ARCHIVED_RECORDS.labels(collection="tasks").inc(len(batch))
+    
+    async def compact_conversations(self, cutoff: datetime) -> int:
+        """Fold idle conversations into their summaries and archive the folded buckets"""
+        archived = 0
+        idle = db.conversations.find({
+            "updated_at": {"$lt": cutoff},
+            "$expr": {"$gte": [
+                {"$subtract": ["$message_count", {"$ifNull": ["$summarized_through", 0]}]}, CONVERSATION_SUMMARY_TRIGGER
+            ]}
+        }, {"id": 1})
+        async for conversation in idle:
+            await rolling_summarizer.fold_conversation(conversation["id"])
+        
+        folded = db.conversations.find(
+            {"summarized_through": {"$gte": conversation_store.bucket_size}}, {"id": 1, "summarized_through": 1}
+        )
+        async for conversation in folded:
+            # Only buckets whose every message is already part of the summary
+            query = {
+                "conversation_id": conversation["id"],
+                "bucket": {"$lt": conversation["summarized_through"] // conversation_store.bucket_size},
+                "updated_at": {"$lt": cutoff}
+            }
+            buckets = await db.conversation_buckets.find(query, {"_id": 0}).to_list(None)
+            if not buckets:
+                continue
+            messages = [
+                {"conversation_id": conversation["id"], **message}
+                for bucket in buckets for message in bucket.get("messages", [])
+            ]
+            await asyncio.to_thread(write_archive, "conversation_messages", messages)
+            await db.conversation_buckets.delete_many(
+                {"conversation_id": conversation["id"], "bucket": {"$in": [bucket["bucket"] for bucket in buckets]}}
+            )
+            archived += len(messages)
+            ARCHIVED_RECORDS.labels(collection="conversation_messages").inc(len(messages))
+        return archived
+
+archival_job = ArchivalJob(interval_hours=ARCHIVE_INTERVAL_HOURS, batch_size=ARCHIVE_BATCH_SIZE)
+
+async def iterate_in_thread(iterator, batch_size: int = 500):
+    """Drain a blocking iterator in worker threads, one batch at a time"""
+    while True:
+        batch = await asyncio.to_thread(lambda: list(islice(iterator, batch_size)))
+        if not batch:
+            return
+        for item in batch:
+            yield item
+
+@app.get("/api/archive/{collection}")
+@limiter.limit("10/minute")
+async def query_archive(request: Request, collection: str, id: Optional[str] = None, agent_id: Optional[str] = None, conversation_id: Optional[str] = None,
+                        since: Optional[datetime] = None, until: Optional[datetime] = None, limit: Optional[int] = None, compress: bool = False):
+    """Stream archived tasks or conversation messages as NDJSON"""
+    if collection not in ARCHIVED_COLLECTIONS:
+        raise HTTPException(status_code=404, detail=f"Unknown archive: {collection}")
+    
+    records = read_archive(collection, {"id": id, "agent_id": agent_id, "conversation_id": conversation_id}, since, until)
+    if limit:
+        records = islice(records, limit)
+    suffix = ".ndjson.gz" if compress else ".ndjson"
+    return export_response(iterate_in_thread(records), f"archive_{collection}{suffix}", compress)
+
+@app.post("/api/archive/run")
+@limiter.limit("2/minute")
+async def run_archival(request: Request):
+    """Run compaction and archival now"""
+    return await archival_job.run()
+
+@app.post("/api/classify/batch")
+@limiter.limit("30/minute")
+async def classify_batch(request: Request, batch: ClassifyBatchRequest):
+    """Classify many prompts at once without creating tasks"""
+    if len(batch.prompts) > CLASSIFY_BATCH_MAX_PROMPTS:
+        raise HTTPException(status_code=413, detail=f"At most {CLASSIFY_BATCH_MAX_PROMPTS} prompts per batch")
+    agent = {"model": "auto"}
+    if batch.agent_id:
+        agent = await agent_cache.get(batch.agent_id)
+        if not agent:
+            raise HTTPException(status_code=404, detail="Agent not found")
+    
+    start_time = time.time()
+    classified = await asyncio.to_thread(classify_task_types, batch.prompts)
+    # Without exploration, a preview should show what routing settles on
+    models = {task_type: select_enhanced_model(agent, batch, task_type, explore=0.0) for task_type in {task_type for task_type, _, _ in classified}}
+    return {
+        "results": [
+            {"task_type": task_type, "confidence": confidence, "source": source, "selected_model": models[task_type]}
+            for task_type, confidence, source in classified
+        ],
+        "count": len(classified),
+        "processing_time": time.time() - start_time
+    }
+
+@app.get("/api/router/stats")
+@limiter.limit("30/minute")
+async def router_stats(request: Request):
+    """Live per model and task type outcomes behind model routing and the current decisions"""
+    return {"enabled": ROUTER_ENABLED, "costs": MODEL_COSTS, "task_types": model_router.snapshot()}
+
+@app.get("/api/router/simulate")
+@limiter.limit("5/minute")
+async def router_simulate(request: Request, limit: int = 5000, since: Optional[datetime] = None):
+    """Replay recent tasks through a fresh router to see how it would have routed them"""
+    history = await routing_history(min(max(limit, 1), 100000), naive_utc(since) if since else None)
+    return await asyncio.to_thread(simulate, build_model_router(live=False), history)
+
+@app.get("/api/tasks/export")
+@limiter.limit("10/minute")
+async def export_tasks(request: Request, agent_id: Optional[str] = None, status: Optional[str] = None, since: Optional[datetime] = None, until: Optional[datetime] = None, fields: Optional[str] = None, compress: bool = False):
+    """Stream task history as NDJSON straight from a cursor, oldest first
+    
+    ``fields`` is a comma separated projection, e.g. ``id,prompt,response,created_at``.
+    """
+    projection: Dict[str, Any] = {"_id": 0, "execution_request": 0}
+    if fields:
+        requested = [field.strip() for field in fields.split(",") if field.strip()]
+        unknown = [field for field in requested if field.split(".")[0] not in Task.model_fields]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown task fields: {', '.join(unknown)}")
+        projection = {"_id": 0, **{field: 1 for field in requested}}
+    
+    query: Dict[str, Any] = {}
+    if agent_id:
+        query["agent_id"] = agent_id
+    if status:
+        query["status"] = status
+    since = naive_utc(since) if since else None
+    until = naive_utc(until) if until else None
+    if since or until:
+        query["created_at"] = {**({"$gte": since} if since else {}), **({"$lte": until} if until else {})}
+    
+    async def records():
+        cursor = db.tasks.find(query, projection).sort("created_at", 1).batch_size(EXPORT_BATCH_SIZE)
+        async for task in cursor:
+            yield task
+    
+    suffix = ".ndjson.gz" if compress else ".ndjson"
+    return export_response(records(), f"tasks_{agent_id or 'all'}{suffix}", compress)
+
+@app.get("/api/tasks/{task_id}")
+@limiter.limit("300/minute")
+async def get_task(request: Request, task_id: str):
+    """Get a task, e.g. to poll an asynchronously executed task"""
+    task = await db.tasks.find_one({"id": task_id}, {"execution_request": 0})
+    if not task:
+        raise HTTPException(status_code=404, detail="Task not found")
+    task["_id"] = str(task["_id"])
+    return task
+
+@app.put("/api/tasks/{task_id}/task_type")
+@limiter.limit("60/minute")
+async def correct_task_type(request: Request, task_id: str, correction: TaskTypeCorrection):
+    """Correct a task's classification, making it a training label for the learned classifier"""
+    if correction.task_type not in keyword_classifier.task_types and correction.task_type != FALLBACK_TASK_TYPE:
+        raise HTTPException(status_code=422, detail=f"Unknown task type: {correction.task_type}")
+    # Completion rewrites the metadata, so only finished tasks can be corrected
+    task = await db.tasks.find_one_and_update(
+        {"id": task_id, "status": {"$in": ["completed", "failed"]}},
+        {"$set": {
+            "task_type": correction.task_type,
+            "metadata.classification_source": "manual"
+        }},
+        projection={"_id": 0, "id": 1, "task_type": 1, "metadata.classification_source": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if not task:
+        if await db.tasks.count_documents({"id": task_id}, limit=1):
+            raise HTTPException(status_code=409, detail="Task is still running")
+        raise HTTPException(status_code=404, detail="Task not found")
+    return task
+
+@app.get("/api/tasks/{task_id}/events")
+@limiter.limit("60/minute")
+async def subscribe_task(request: Request, task_id: str, timeout: float = 300.0):
+    """Stream task status changes as NDJSON until the task finishes"""
+    task = await db.tasks.find_one({"id": task_id}, {"execution_request": 0})
+    if not task:
+        raise HTTPException(status_code=404, detail="Task not found")
+    
+    async def event_stream():
+        current = task
+        last_status = None
+        deadline = time.time() + min(timeout, 900.0)
+        while True:
+            if current["status"] != last_status:
+                last_status = current["status"]
+                current["_id"] = str(current["_id"])
+                yield ndjson_event({"type": "status", "task": current})
+            if last_status in TERMINAL_TASK_STATUSES:
+                return
+            if time.time() >= deadline:
+                yield ndjson_event({"type": "timeout", "task_id": task_id, "status": last_status})
+                return
+            
+            await task_worker_pool.wait_for_update(task_id, timeout=TASK_WORKER_POLL_INTERVAL)
+            current = await db.tasks.find_one({"id": task_id}, {"execution_request": 0})
+            if not current:
+                yield ndjson_event({"type": "error", "task_id": task_id, "detail": "Task not found"})
+                return
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/api/web-scraping")
+@limiter.limit("10/minute")
+async def scrape_and_analyze(request: Request, scraping_request: WebScrapingRequest):
+    """Scrape website and analyze with AI"""
+    start_time = time.time()
+    
+    try:
+        # Scrape website
+        content = await scrape_website(scraping_request.url)
         
-        await db.tasks.update_one({"id": task.id}, {"$set": completion_data})
+        # Get agent
+        agent = await agent_cache.get(scraping_request.agent_id)
+        if not agent:
+            raise HTTPException(status_code=404, detail="Agent not found")
         
-        # Enhanced conversation update
-        if task_request.conversation_id:
-            await db.conversations.update_one(
-                {"id": task_request.conversation_id},
-                {
-                    "$push": {
-                        "messages": {
-                            "$each": [
-                                {"role": "user", "content": task_request.prompt},
-                                {"role": "assistant", "content": task_response}
-                            ]
-                        }
-                    },
-                    "$set": {"updated_at": datetime.utcnow()}
-                }
-            )
+        # Prepare prompt with scraped content
+        enhanced_prompt = f"""
+        Analyze the following web content from {scraping_request.url}:
         
-        # Enhanced agent metrics update
-        current_metrics = agent.get("performance_metrics", {})
-        current_avg = current_metrics.get("avg_response_time", 0)
-        total_tasks = agent.get("tasks_completed", 0)
-        new_avg = ((current_avg * total_tasks) + processing_time) / (total_tasks + 1)
+        Content: {content}
         
-        # Calculate memory efficiency
-        memory_efficiency = min(1.0, 10.0 / len(agent.get("conversation_memory", []))) if agent.get("conversation_memory") else 1.0
-        MEMORY_EFFICIENCY.observe(memory_efficiency)
+        Task: {scraping_request.prompt}
+        """
         
-        await db.agents.update_one(
-            {"id": agent_id},
-            {
-                "$inc": {"tasks_completed": 1},
-                "$set": {
-                    "performance_metrics.avg_response_time": new_avg,
-                    "performance_metrics.total_tasks": total_tasks + 1,
-                    "intelligence_score": (agent.get("intelligence_score", 0) + intelligence_score) / 2,
-                    "memory_efficiency": memory_efficiency
-                },
-                "$push": {
-                    "conversation_memory": {
-                        "$each": [{
-                            "task_id": task.id,
-                            "prompt": task_request.prompt,
-                            "response": task_response[:200],  # Store truncated for efficiency
-                            "timestamp": datetime.utcnow(),
-                            "processing_time": processing_time,
-                            "intelligence_score": intelligence_score
-                        }],
-                        "$slice": -15  # Keep last 15 interactions
-                    }
-                }
-            }
-        )
+        messages = [
+            {"role": "system", "content": agent["system_prompt"]},
+            {"role": "user", "content": enhanced_prompt}
+        ]
         
-        # Cache invalidation
-        await advanced_cache_set(f"agent_{agent_id}", "", expire=1)  # Quick invalidation
+        selected_model = MODEL_SELECTION_CONFIG["web_scraping"]
+        response, _, routing = await cached_groq_api_call(
+            groq_client,
+            messages,
+            selected_model,
+            task_type="web_scraping",
+            purpose="task",
+            temperature=0.7,
+            max_tokens=2048
+        )
+        if routing:
+            selected_model = routing["served_model"]
         
-        # Update task object for response
-        task.response = task_response
-        task.status = "completed"
-        task.completed_at = datetime.utcnow()
-        task.intelligence_score = intelligence_score
-        task.performance_data = completion_data["performance_data"]
+        result = {
+            "url": scraping_request.url,
+            "scraped_content": content[:500] + "..." if len(content) > 500 else content,
+            "analysis": response.choices[0].message.content,
+            "model_used": selected_model,
+            "processing_time": time.time() - start_time
+        }
         
         TASK_COUNT.labels(status="completed", model=selected_model).inc()
+        return result
         
+    except HTTPException:
+        raise
+    except Exception as e:
+        ERROR_RATE.labels(type="ai_execution", endpoint="web_scraping").inc()
+        TASK_COUNT.labels(status="failed", model=MODEL_SELECTION_CONFIG["web_scraping"]).inc()
+        raise HTTPException(status_code=500, detail=f"Web scraping failed: {str(e)}")
+
+async def compare_single_model(messages: List[Dict], model: str, timeout: float) -> Dict[str, Any]:
+    """Run one model of a comparison with its own deadline"""
+    start_time = time.time()
+    try:
+        # The deadline covers the admission and concurrency waits too, and stays
+        # outside the breaker: a caller giving up is not an upstream failure
+        response = await asyncio.wait_for(
+            groq_api_call(
+                groq_client,
+                messages,
+                model,
+                purpose="comparison",
+                temperature=0.7,
+                max_tokens=1024
+            ),
+            timeout=timeout
+        )
+        latency = time.time() - start_time
+        content = response.choices[0].message.content
+        token_usage = count_task_tokens(messages, content, model, response)
+        TASK_COUNT.labels(status="completed", model=model).inc()
         return {
-            **task.dict(),
-            "multimodal_results": multimodal_results,
-            "enhanced_features_used": {
-                "context_optimization": task_request.context_optimization,
-                "multimodal_processing": len(multimodal_results) > 0,
-                "web_scraping": task_request.enable_web_scraping and len(urls) > 0,
-                "reasoning_mode": task_request.reasoning_mode,
-                "intelligence_score": intelligence_score
-            }
+            "response": content,
+            "status": "success",
+            "latency": latency,
+            "prompt_tokens": token_usage["prompt_tokens"],
+            "completion_tokens": token_usage["completion_tokens"],
+            "total_tokens": token_usage["total_tokens"],
+            "tokens_per_second": round(token_usage["completion_tokens"] / latency, 2) if latency > 0 else None
+        }
+    except asyncio.TimeoutError:
+        TASK_COUNT.labels(status="timeout", model=model).inc()
+        return {
+            "response": f"Error: no response within {timeout}s",
+            "status": "timeout",
+            "latency": time.time() - start_time
+        }
+    except Exception as e:
+        TASK_COUNT.labels(status="failed", model=model).inc()
+        return {
+            "response": f"Error: {str(e)}",
+            "status": "failed",
+            "latency": time.time() - start_time
+        }
+
+async def prepare_model_comparison(comparison_request: ModelComparisonRequest) -> List[Dict]:
+    """Build the shared messages of a model comparison"""
+    agent = await agent_cache.get(comparison_request.agent_id)
+    if not agent:
+        raise HTTPException(status_code=404, detail="Agent not found")
+    
+    return [
+        {"role": "system", "content": agent["system_prompt"]},
+        {"role": "user", "content": comparison_request.prompt}
+    ]
+
+@app.post("/api/model-comparison")
+@limiter.limit("5/minute")
+async def compare_models(request: Request, comparison_request: ModelComparisonRequest):
+    """Compare responses from different models, querying all of them concurrently"""
+    start_time = time.time()
+    
+    try:
+        messages = await prepare_model_comparison(comparison_request)
+        models = list(dict.fromkeys(comparison_request.models))
+        
+        # Every model gets its own deadline, so one slow model only loses its own result
+        outcomes = await asyncio.gather(*[
+            compare_single_model(messages, model, comparison_request.timeout) for model in models
+        ])
+        results = dict(zip(models, outcomes))
+        
+        return {
+            "prompt": comparison_request.prompt,
+            "results": results,
+            "processing_time": time.time() - start_time,
+            "timestamp": datetime.utcnow()
         }
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Enhanced task creation failed: {e}")
-        ERROR_RATE.labels(type="system", endpoint="tasks").inc()
-        
-        # Update task with error
+        ERROR_RATE.labels(type="system", endpoint="model_comparison").inc()
+        raise HTTPException(status_code=500, detail=f"Model comparison failed: {str(e)}")
+
+@app.post("/api/model-comparison/stream")
+@limiter.limit("5/minute")
+async def compare_models_stream(request: Request, comparison_request: ModelComparisonRequest):
+    """Compare models, streaming each model's result as NDJSON as soon as it finishes"""
+    start_time = time.time()
+    messages = await prepare_model_comparison(comparison_request)
+    models = list(dict.fromkeys(comparison_request.models))
+    
+    async def run(model: str):
+        return model, await compare_single_model(messages, model, comparison_request.timeout)
+    
+    async def event_stream():
+        pending = [asyncio.create_task(run(model)) for model in models]
         try:
-            await db.tasks.update_one(
-                {"id": task.id if 'task' in locals() else "unknown"},
-                {
-                    "$set": {
-                        "response": f"System Error: {str(e)}",
-                        "status": "failed",
-                        "completed_at": datetime.utcnow(),
-                        "performance_data": {
-                            "processing_time": time.time() - start_time,
-                            "error": str(e)
-                        }
-                    }
-                }
-            )
-        except:
-            pass
-        
-        TASK_COUNT.labels(status="failed", model=selected_model if 'selected_model' in locals() else "unknown").inc()
-        raise HTTPException(status_code=500, detail=f"Enhanced task execution failed: {str(e)}")
+            for finished in asyncio.as_completed(pending):
+                model, result = await finished
+                yield ndjson_event({"type": "result", "model": model, **result})
+            yield ndjson_event({
+                "type": "done",
+                "models": models,
+                "processing_time": time.time() - start_time,
+                "timestamp": datetime.utcnow()
+            })
+        finally:
+            for task in pending:
+                task.cancel()
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 # Enhanced file upload with multi-modal support
 @app.post("/api/upload/multimodal")
@@ -935,6 +3440,27 @@ async def get_enhanced_analytics(request: Request):
                 "avg_confidence": stat.get("avg_confidence", 0)
             }
         
+        # Token usage per model
+        token_pipeline = [
+            {"$match": {"status": "completed", "performance_data.tokens_used": {"$exists": True}}},
+            {"$group": {
+                "_id": "$model_used",
+                "total_tokens": {"$sum": "$performance_data.tokens_used"},
+                "prompt_tokens": {"$sum": "$performance_data.prompt_tokens"},
+                "completion_tokens": {"$sum": "$performance_data.completion_tokens"},
+                "avg_tokens_per_task": {"$avg": "$performance_data.tokens_used"}
+            }}
+        ]
+        
+        token_usage_stats = {}
+        async for stat in db.tasks.aggregate(token_pipeline):
+            token_usage_stats[stat["_id"]] = {
+                "total_tokens": stat["total_tokens"],
+                "prompt_tokens": stat["prompt_tokens"],
+                "completion_tokens": stat["completion_tokens"],
+                "avg_tokens_per_task": round(stat.get("avg_tokens_per_task") or 0, 1)
+            }
+        
         # Multi-modal usage
         multimodal_count = await db.multimodal_files.count_documents({})
         
@@ -955,6 +3481,7 @@ async def get_enhanced_analytics(request: Request):
                 "optimal_agents": memory_stats.get("agents_with_optimal_memory", 0)
             },
             "task_intelligence": task_type_stats,
+            "token_usage": token_usage_stats,
             "multimodal_usage": {
                 "total_files_processed": multimodal_count
             },
@@ -1020,6 +3547,14 @@ async def enhanced_health_check():
             health_data["services"]["groq_api"] = f"unhealthy: {str(e)}"
             health_data["status"] = "degraded"
         
+        health_data["services"]["agent_cache"] = agent_cache.stats()
+        
+        # Per-model circuit breakers
+        health_data["services"]["circuit_breakers"] = {
+            model: {"state": breaker.state, "failure_count": breaker.failure_count}
+            for model, breaker in model_circuit_breakers.items()
+        }
+        
         # System performance
         cpu_percent = psutil.cpu_percent()
         memory = psutil.virtual_memory()
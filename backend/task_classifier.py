@@ -0,0 +1,154 @@
+"""Keyword based task-type classification.
+
+The keyword table is compiled once into an Aho-Corasick automaton that finds
+every keyword of the prompt in a single scan, so the cost no longer grows with
+the number of keywords. Without ``pyahocorasick`` each keyword is searched for
+in turn with a precompiled pattern. Keywords only count where they start a
+word: they still match as word prefixes ("chart" in "charts") but no longer
+inside other words ("fix" in "prefix").
+"""
+import re
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+try:
+    import ahocorasick
+except ImportError:  # Optional: fall back to one search per keyword
+    ahocorasick = None
+
+FALLBACK_TASK_TYPE = "fast_responses"
+
+# Scoring rules besides the keyword table
+CONVERSATION_HINTS = ("how", "why", "what", "explain")
+LONG_PROMPT_WORDS = 50
+FEATURE_BONUSES = {
+    "long": {"analysis_tasks": 1, "reasoning": 1},
+    "url": {"web_scraping": 3},
+    "numbers": {"data_analysis": 2},
+    "question": {"conversation": 1},
+}
+
+_URL = re.compile(r"https?://")
+_DIGIT_PAIR = re.compile(r"\d.*\d")  # Two digits on one line
+
+
+def _is_word_char(char: str) -> bool:
+    return char.isalnum() or char == "_"
+
+
+class KeywordClassifier:
+    """Single-pass scorer for a ``{task_type: [keyword, ...]}`` table"""
+
+    def __init__(self, keywords: Dict[str, List[str]]):
+        self.task_types = list(keywords)
+        self.keyword_types: Dict[str, List[str]] = {}
+        for task_type, words in keywords.items():
+            for word in words:
+                self.keyword_types.setdefault(word.lower(), []).append(task_type)
+        self.terms = frozenset(self.keyword_types) | frozenset(CONVERSATION_HINTS)
+
+        # Keyword -> task type and feature -> task type weight matrices for batches
+        self._keyword_index = {keyword: i for i, keyword in enumerate(self.keyword_types)}
+        type_index = {task_type: i for i, task_type in enumerate(self.task_types)}
+        self._keyword_weights = np.zeros((len(self._keyword_index), len(self.task_types)), dtype=np.int32)
+        for keyword, task_types in self.keyword_types.items():
+            for task_type in task_types:
+                self._keyword_weights[self._keyword_index[keyword], type_index[task_type]] += 1
+        self._feature_weights = np.zeros((len(FEATURE_BONUSES), len(self.task_types)), dtype=np.int32)
+        for i, bonuses in enumerate(FEATURE_BONUSES.values()):
+            for task_type, bonus in bonuses.items():
+                self._feature_weights[i, type_index[task_type]] = bonus
+
+        self._automaton = None
+        self._patterns: Dict[str, "re.Pattern[str]"] = {}
+        if ahocorasick is not None:
+            self._automaton = ahocorasick.Automaton()
+            for term in self.terms:
+                self._automaton.add_word(term, term)
+            self._automaton.make_automaton()
+        else:
+            self._patterns = {term: re.compile(rf"(?<!\w){re.escape(term)}") for term in self.terms}
+
+    def _occurrences(self, prompt_lower: str) -> Dict[str, int]:
+        """Start of the first occurrence of every term in the prompt that starts a word"""
+        if self._automaton is None:
+            found = ((term, pattern.search(prompt_lower)) for term, pattern in self._patterns.items())
+            return {term: match.start() for term, match in found if match}
+        first: Dict[str, int] = {}
+        # Matches come in order of their end, the first accepted one per term is its earliest
+        for end, term in self._automaton.iter(prompt_lower):
+            if term in first:
+                continue
+            start = end - len(term) + 1
+            if start > 0 and _is_word_char(prompt_lower[start - 1]):
+                continue
+            first[term] = start
+        return first
+
+    def matches(self, prompt: str) -> Tuple[Dict[str, int], bool]:
+        """Matched keywords with their weight, and whether a conversation hint occurs"""
+        weights: Dict[str, int] = {}
+        hint = False
+        for term, start in self._occurrences(prompt.lower()).items():
+            if term in self.keyword_types:
+                # Keywords count once, double when the prompt starts with them
+                weights[term] = 2 if start == 0 else 1
+            if term in CONVERSATION_HINTS:
+                hint = True
+        return weights, hint
+
+    def features(self, prompt: str) -> Tuple[Dict[str, int], Dict[str, bool]]:
+        """Matched keyword weights and the prompt features of ``FEATURE_BONUSES``"""
+        weights, hint = self.matches(prompt)
+        return weights, {
+            # Stops splitting once the prompt is known to be long
+            "long": len(prompt.split(maxsplit=LONG_PROMPT_WORDS)) > LONG_PROMPT_WORDS,
+            "url": _URL.search(prompt) is not None,
+            "numbers": _DIGIT_PAIR.search(prompt) is not None,
+            "question": hint,
+        }
+
+    def scores(self, prompt: str) -> Dict[str, int]:
+        """Score of every task type for a prompt"""
+        scores = dict.fromkeys(self.task_types, 0)
+        weights, features = self.features(prompt)
+        for keyword, weight in weights.items():
+            for task_type in self.keyword_types[keyword]:
+                scores[task_type] += weight
+        for feature, present in features.items():
+            if present:
+                for task_type, bonus in FEATURE_BONUSES[feature].items():
+                    scores[task_type] += bonus
+        return scores
+
+    def classify(self, prompt: str) -> Tuple[str, float]:
+        """Best task type and its share of the total score"""
+        scores = self.scores(prompt)
+        best = max(scores, key=scores.get)
+        confidence = scores[best] / max(1, sum(scores.values()))
+        return (best if scores[best] > 0 else FALLBACK_TASK_TYPE, confidence)
+
+    def classify_batch(self, prompts: List[str]) -> List[Tuple[str, float]]:
+        """``classify`` for many prompts, scoring them together as matrix products"""
+        rows, columns, values = [], [], []
+        flags = np.zeros((len(prompts), len(FEATURE_BONUSES)), dtype=np.int32)
+        for row, prompt in enumerate(prompts):
+            weights, features = self.features(prompt)
+            for keyword, weight in weights.items():
+                rows.append(row)
+                columns.append(self._keyword_index[keyword])
+                values.append(weight)
+            flags[row] = [features[feature] for feature in FEATURE_BONUSES]
+
+        counts = np.zeros((len(prompts), len(self._keyword_index)), dtype=np.int32)
+        counts[rows, columns] = values
+        scores = counts @ self._keyword_weights + flags @ self._feature_weights
+
+        best = scores.argmax(axis=1)  # First maximum, like max() over the dict
+        top = scores[np.arange(len(prompts)), best]
+        confidence = top / np.maximum(1, scores.sum(axis=1))
+        return [
+            (self.task_types[index] if score > 0 else FALLBACK_TASK_TYPE, float(share))
+            for index, score, share in zip(best.tolist(), top.tolist(), confidence.tolist())
+        ]
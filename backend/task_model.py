@@ -0,0 +1,152 @@
+"""Learned task-type classifier.
+
+A multinomial naive Bayes model over hashed word and word-bigram counts,
+trained offline from completed tasks (``train_task_model.py``). The artifact
+in ``TASK_MODEL_DIR`` is
+
+* ``log_likelihood.npy`` - float32 ``(dim, classes)`` log P(feature | class)
+* ``meta.json`` - class names, log priors and training details
+
+The likelihood matrix is memory-mapped, so loading is instant and worker
+processes share one copy through the OS page cache.
+"""
+import json
+import os
+import re
+import zlib
+from datetime import datetime
+from itertools import islice
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+TASK_MODEL_DIR = os.getenv("TASK_MODEL_DIR", os.path.join(os.path.dirname(__file__), "task_model"))
+TASK_MODEL_DIM = int(os.getenv("TASK_MODEL_DIM", str(2 ** 18)))
+TASK_MODEL_MAX_WORDS = 256  # Routing is decided by the start of a prompt, bounds inference time
+
+_WORD = re.compile(r"\w+")
+
+
+def hashed_features(text: str, dim: int = TASK_MODEL_DIM) -> np.ndarray:
+    """Hashed word and word-bigram indices of ``text``, repeated per occurrence"""
+    words = [match.group().lower() for match in islice(_WORD.finditer(text), TASK_MODEL_MAX_WORDS)]
+    features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    # crc32 is stable across processes, unlike the salted built-in hash
+    return np.fromiter((zlib.crc32(f.encode()) % dim for f in features), dtype=np.int64, count=len(features))
+
+
+class NaiveBayesTaskModel:
+    """Multinomial naive Bayes over hashed prompt features"""
+
+    def __init__(self, classes: List[str], log_prior: np.ndarray, log_likelihood: np.ndarray, meta: Dict[str, Any]):
+        self.classes = classes
+        self.log_prior = log_prior
+        self.log_likelihood = log_likelihood
+        self.dim = log_likelihood.shape[0]
+        self.meta = meta
+
+    @classmethod
+    def train(cls, samples: Iterable[Tuple[str, str, float]], dim: int = TASK_MODEL_DIM, alpha: float = 0.1,
+              chunk_size: int = 1000) -> "NaiveBayesTaskModel":
+        """Fit on ``(prompt, task_type, weight)`` samples, streamed in chunks"""
+        class_index: Dict[str, int] = {}
+        counts = np.zeros((dim, 0), dtype=np.float64)
+        class_weights: List[float] = []
+        rows: List[np.ndarray] = []
+        columns: List[np.ndarray] = []
+        weights: List[np.ndarray] = []
+        total = 0
+
+        def flush():
+            if rows:
+                np.add.at(counts, (np.concatenate(rows), np.concatenate(columns)), np.concatenate(weights))
+                rows.clear()
+                columns.clear()
+                weights.clear()
+
+        for prompt, task_type, weight in samples:
+            if task_type not in class_index:
+                flush()
+                class_index[task_type] = len(class_index)
+                counts = np.hstack([counts, np.zeros((dim, 1))])
+                class_weights.append(0.0)
+            features = hashed_features(prompt, dim)
+            column = class_index[task_type]
+            class_weights[column] += weight
+            rows.append(features)
+            columns.append(np.full(len(features), column))
+            weights.append(np.full(len(features), weight))
+            total += 1
+            if len(rows) >= chunk_size:
+                flush()
+        flush()
+        if not class_index:
+            raise ValueError("No training samples")
+
+        prior = np.asarray(class_weights)
+        log_prior = np.log(prior / prior.sum()).astype(np.float32)
+        log_likelihood = np.log((counts + alpha) / (counts.sum(axis=0) + alpha * dim)).astype(np.float32)
+        meta = {
+            "classes": list(class_index),
+            "log_prior": log_prior.tolist(),
+            "dim": dim,
+            "alpha": alpha,
+            "samples": total,
+            "trained_at": datetime.utcnow().isoformat()
+        }
+        return cls(list(class_index), log_prior, log_likelihood, meta)
+
+    def save(self, path: str = TASK_MODEL_DIR):
+        """Write the artifact, matrix first so a reader never pairs new meta with an old matrix"""
+        os.makedirs(path, exist_ok=True)
+        for name, write in (("log_likelihood.npy", lambda f: np.save(f, self.log_likelihood)),
+                            ("meta.json", lambda f: f.write(json.dumps(self.meta).encode()))):
+            target = os.path.join(path, name)
+            with open(target + ".tmp", "wb") as f:
+                write(f)
+            os.replace(target + ".tmp", target)
+
+    @classmethod
+    def load(cls, path: str = TASK_MODEL_DIR) -> Optional["NaiveBayesTaskModel"]:
+        """Memory-map a saved model, None when there is none"""
+        meta_path = os.path.join(path, "meta.json")
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path) as f:
+            meta = json.load(f)
+        log_likelihood = np.load(os.path.join(path, "log_likelihood.npy"), mmap_mode="r")
+        return cls(meta["classes"], np.asarray(meta["log_prior"], dtype=np.float32), log_likelihood, meta)
+
+    def _posterior(self, log_joint: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        log_joint = log_joint - log_joint.max(axis=-1, keepdims=True)
+        probabilities = np.exp(log_joint)
+        probabilities /= probabilities.sum(axis=-1, keepdims=True)
+        return probabilities.argmax(axis=-1), probabilities.max(axis=-1)
+
+    def predict(self, prompt: str) -> Optional[Tuple[str, float]]:
+        """Most likely task type and its posterior probability, None for a prompt without words"""
+        features = hashed_features(prompt, self.dim)
+        if not len(features):
+            return None
+        indices, counts = np.unique(features, return_counts=True)
+        best, probability = self._posterior(self.log_prior + counts.astype(np.float32) @ self.log_likelihood[indices])
+        return self.classes[int(best)], float(probability)
+
+    def predict_batch(self, prompts: List[str], chunk_size: int = 256) -> List[Optional[Tuple[str, float]]]:
+        """``predict`` for many prompts, one gather over the likelihood matrix per chunk.
+
+        Chunking bounds the gathered ``(features, classes)`` block to a few MB
+        however large the batch is.
+        """
+        results: List[Optional[Tuple[str, float]]] = []
+        for start in range(0, len(prompts), chunk_size):
+            features = [hashed_features(prompt, self.dim) for prompt in prompts[start:start + chunk_size]]
+            rows = np.repeat(np.arange(len(features)), [len(f) for f in features])
+            log_joint = np.tile(self.log_prior, (len(features), 1))
+            np.add.at(log_joint, rows, self.log_likelihood[np.concatenate(features)])
+            best, probability = self._posterior(log_joint)
+            results.extend(
+                (self.classes[int(b)], float(p)) if len(f) else None
+                for b, p, f in zip(best.tolist(), probability.tolist(), features)
+            )
+        return results
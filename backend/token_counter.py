@@ -0,0 +1,134 @@
+"""Token accounting for Groq-hosted models.
+
+Counts come from a local Hugging Face tokenizer when one is available for the
+model family (``TOKENIZER_DIR/<family>/tokenizer.json``, never downloaded at
+runtime, provisioned with ``fetch_tokenizers.py``). Without it a
+pre-tokenizer based estimate is used, which tracks Llama 3 BPE counts far
+better than word or character heuristics.
+"""
+import math
+import os
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+import regex
+
+try:
+    from tokenizers import Tokenizer
+except ImportError:  # Optional: fall back to the estimator
+    Tokenizer = None
+
+TOKENIZER_DIR = os.getenv("TOKENIZER_DIR", os.path.join(os.path.dirname(__file__), "tokenizers"))
+
+# Model name prefixes mapped to the tokenizer family they share
+MODEL_FAMILIES = {
+    "llama-3": "llama3",
+    "llama3": "llama3",
+    "llama2": "llama2",
+    "mixtral": "mistral",
+    "gemma": "gemma",
+}
+DEFAULT_FAMILY = "llama3"
+
+# Chat template overhead: header tokens around the role plus end-of-turn
+TOKENS_PER_MESSAGE = 5
+TOKENS_PER_REQUEST = 1
+
+# Llama 3 / cl100k style pre-tokenizer split
+_PRETOKENIZE = regex.compile(
+    r"(?i:'s|'t|'re|'ve|'m|'ll|'d)|[^\r\n\p{L}\p{N}]?\p{L}+|\p{N}{1,3}| ?[^\s\p{L}\p{N}]+[\r\n]*|\s*[\r\n]+|\s+(?!\S)|\s+"
+)
+
+
+def model_family(model: Optional[str]) -> str:
+    """Tokenizer family for a model name"""
+    name = (model or "").lower()
+    for prefix, family in MODEL_FAMILIES.items():
+        if name.startswith(prefix):
+            return family
+    return DEFAULT_FAMILY
+
+
+@lru_cache(maxsize=None)
+def load_tokenizer(family: str):
+    """Load the local tokenizer of a family once, None when unavailable"""
+    if Tokenizer is None:
+        return None
+    path = os.path.join(TOKENIZER_DIR, family, "tokenizer.json")
+    if not os.path.exists(path):
+        return None
+    try:
+        return Tokenizer.from_file(path)
+    except Exception:
+        return None
+
+
+def active_counter(model: Optional[str] = None) -> str:
+    """Which counter serves a model: its tokenizer file or the estimator"""
+    family = model_family(model)
+    if load_tokenizer(family) is not None:
+        return f"tokenizer ({os.path.join(TOKENIZER_DIR, family, 'tokenizer.json')})"
+    if Tokenizer is None:
+        return "estimate (tokenizers not installed)"
+    return f"estimate (no {family} tokenizer in {TOKENIZER_DIR}, run fetch_tokenizers.py)"
+
+
+def _estimate(text: str) -> int:
+    tokens = 0
+    for piece in _PRETOKENIZE.findall(text):
+        # Common words are one BPE token, rarer long words split in ~4 char chunks
+        length = len(piece.strip()) or 1
+        tokens += 1 if length <= 8 else math.ceil(length / 4)
+    return tokens
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    """Number of tokens ``text`` encodes to for ``model``"""
+    if not text:
+        return 0
+    tokenizer = load_tokenizer(model_family(model))
+    if tokenizer is not None:
+        return len(tokenizer.encode(text, add_special_tokens=False).ids)
+    return _estimate(text)
+
+
+def count_tokens_batch(texts: List[str], model: Optional[str] = None) -> List[int]:
+    """Token counts for many texts, encoded in one batch when possible"""
+    tokenizer = load_tokenizer(model_family(model))
+    if tokenizer is not None:
+        encodings = tokenizer.encode_batch([text or "" for text in texts], add_special_tokens=False)
+        return [len(encoding.ids) for encoding in encodings]
+    return [_estimate(text) if text else 0 for text in texts]
+
+
+def count_message_tokens(messages: List[Dict[str, Any]], model: Optional[str] = None) -> int:
+    """Prompt tokens of a chat request including template overhead"""
+    counts = count_tokens_batch([str(msg.get("content", "")) for msg in messages], model)
+    return TOKENS_PER_REQUEST + sum(counts) + TOKENS_PER_MESSAGE * len(messages)
+
+
+@lru_cache(maxsize=int(os.getenv("MESSAGE_TOKEN_CACHE_SIZE", "16384")))
+def _cached_message_tokens(content: str, family: str) -> int:
+    tokenizer = load_tokenizer(family)
+    if tokenizer is not None:
+        tokens = len(tokenizer.encode(content, add_special_tokens=False).ids) if content else 0
+    else:
+        tokens = _estimate(content) if content else 0
+    return tokens + TOKENS_PER_MESSAGE
+
+
+def message_tokens(message: Dict[str, Any], model: Optional[str] = None) -> int:
+    """Tokens one chat message costs, memoized per content and tokenizer family"""
+    return _cached_message_tokens(str(message.get("content", "")), model_family(model))
+
+
+def usage_tokens(response: Any) -> Optional[Dict[str, int]]:
+    """Prompt/completion/total tokens reported by a completion, if any"""
+    usage = getattr(response, "usage", None)
+    if usage is None or usage.total_tokens is None:
+        return None
+    return {
+        "prompt_tokens": usage.prompt_tokens or 0,
+        "completion_tokens": usage.completion_tokens or 0,
+        "total_tokens": usage.total_tokens
+    }
@@ -0,0 +1,102 @@
+"""Train the learned task-type classifier from the tasks collection.
+
+Streams completed tasks from MongoDB, weights each by its intelligence score
+so routes that produced good answers count more, holds out every
+``--holdout``-th task for evaluation and saves the model to ``TASK_MODEL_DIR``.
+
+Only labels from trusted sources are used: manual corrections
+(``PUT /api/tasks/{id}/task_type``) by default, optionally keyword matches to
+bootstrap a first model. Tasks stored before the source was recorded were all
+classified by keywords and count as such. Labels the model predicted itself
+are never trained on, they would only reinforce its own mistakes::
+
+    python train_task_model.py --limit 200000
+    python train_task_model.py --sources manual,keywords
+
+The server picks the new model up on its next start.
+"""
+import argparse
+import os
+import sys
+from datetime import datetime, timedelta
+
+from dotenv import load_dotenv
+from pymongo import MongoClient
+
+from task_model import TASK_MODEL_DIM, TASK_MODEL_DIR, NaiveBayesTaskModel
+
+load_dotenv()
+
+MIN_SAMPLE_WEIGHT = 0.25  # Unscored tasks still carry their label
+TRUSTED_SOURCES = ("manual", "keywords")  # Values of metadata.classification_source usable as labels
+
+
+def sample_weight(task) -> float:
+    return max(MIN_SAMPLE_WEIGHT, float(task.get("intelligence_score") or 0.0))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--limit", type=int, default=0, help="Newest tasks to train on, 0 for all")
+    parser.add_argument("--days", type=int, default=0, help="Only tasks created in the last N days")
+    parser.add_argument("--holdout", type=int, default=10, help="Every Nth task is held out, 0 to train on all")
+    parser.add_argument("--dim", type=int, default=TASK_MODEL_DIM)
+    parser.add_argument("--alpha", type=float, default=0.1, help="Additive smoothing")
+    parser.add_argument("--sources", default="manual",
+                        help=f"Comma separated label sources to train on, of {', '.join(TRUSTED_SOURCES)}")
+    parser.add_argument("--output", default=TASK_MODEL_DIR)
+    args = parser.parse_args()
+
+    sources = [source.strip() for source in args.sources.split(",") if source.strip()]
+    untrusted = set(sources) - set(TRUSTED_SOURCES)
+    if not sources or untrusted:
+        print(f"Untrusted label sources: {', '.join(sorted(untrusted)) or 'none given'}", file=sys.stderr)
+        return 1
+
+    query = {
+        "status": "completed",
+        "task_type": {"$ne": None},
+        "prompt": {"$ne": None},
+        "metadata.classification_source": {"$in": sources}
+    }
+    if "keywords" in sources:
+        # Tasks from before sources were recorded were all classified by keywords
+        query["$or"] = [
+            {"metadata.classification_source": query.pop("metadata.classification_source")},
+            {"metadata.classification_source": {"$exists": False}}
+        ]
+    if args.days:
+        query["created_at"] = {"$gte": datetime.utcnow() - timedelta(days=args.days)}
+    db = MongoClient(os.getenv("MONGO_URL")).agentic_ai
+    cursor = db.tasks.find(query, {"_id": 0, "prompt": 1, "task_type": 1, "intelligence_score": 1}).sort("_id", -1)
+    if args.limit:
+        cursor = cursor.limit(args.limit)
+
+    held_out = []
+
+    def samples():
+        for i, task in enumerate(cursor.batch_size(1000)):
+            if args.holdout and i % args.holdout == 0:
+                held_out.append((task["prompt"], task["task_type"]))
+                continue
+            yield task["prompt"], task["task_type"], sample_weight(task)
+
+    try:
+        model = NaiveBayesTaskModel.train(samples(), dim=args.dim, alpha=args.alpha)
+    except ValueError as e:
+        print(f"Training failed: {e}", file=sys.stderr)
+        return 1
+    print(f"Trained on {model.meta['samples']} tasks, classes: {', '.join(model.classes)}")
+
+    if held_out:
+        predictions = model.predict_batch([prompt for prompt, _ in held_out])
+        correct = sum(1 for (_, label), prediction in zip(held_out, predictions) if prediction and prediction[0] == label)
+        print(f"Held-out accuracy on {', '.join(sources)} labels: {correct / len(held_out):.1%} of {len(held_out)}")
+
+    model.save(args.output)
+    print(f"Saved to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
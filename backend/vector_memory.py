@@ -0,0 +1,269 @@
+"""Per-agent semantic memory over past tasks.
+
+Each agent gets a directory under ``VECTOR_MEMORY_DIR`` holding
+
+* ``vectors.f32`` - one L2-normalized hashed n-gram vector per task, float32 rows
+* ``entries.jsonl`` - the matching task metadata, one line per row
+* ``df.npy`` - document frequency per hashed feature, used to IDF-weight queries
+* ``commit.json`` - rows and entry bytes of the last complete append
+
+Rows are only ever appended, under an exclusive file lock, so the index grows
+incrementally as tasks complete. Searches memory-map the vector file and keep
+only the byte offsets of the entries, reading just the matched lines, letting
+many agents and worker processes share the OS page cache instead of each
+holding every index in RAM.
+"""
+import fcntl
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+VECTOR_MEMORY_DIR = os.getenv("VECTOR_MEMORY_DIR", os.path.join(os.path.dirname(__file__), "vector_memory"))
+VECTOR_MEMORY_DIM = int(os.getenv("VECTOR_MEMORY_DIM", "1024"))
+
+_WORD = re.compile(r"\w+")
+_AGENT_ID = re.compile(r"[^A-Za-z0-9_.-]")
+
+
+def _features(text: str) -> List[str]:
+    words = _WORD.findall(text.lower())
+    features = list(words)
+    features.extend(f"{a} {b}" for a, b in zip(words, words[1:]))
+    # Character trigrams make recall robust to inflections and typos
+    for word in words:
+        if len(word) > 4:
+            features.extend(f"#{word[i:i + 3]}" for i in range(len(word) - 2))
+    return features
+
+
+def embed(text: str, dim: int = VECTOR_MEMORY_DIM) -> np.ndarray:
+    """Sublinear term-frequency vector of hashed word and character n-grams"""
+    features = _features(text)
+    if not features:
+        return np.zeros(dim, dtype=np.float32)
+    # crc32 is stable across processes, unlike the salted built-in hash
+    buckets = np.fromiter((zlib.crc32(f.encode()) % dim for f in features), dtype=np.int64, count=len(features))
+    vector = np.log1p(np.bincount(buckets, minlength=dim)).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def _line_ends(path: str, start: int = 0, chunk_size: int = 1 << 20) -> np.ndarray:
+    """Byte offsets just past each complete line of a file from ``start`` on"""
+    ends = []
+    with open(path, "rb") as f:
+        f.seek(start)
+        position = start
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            ends.append(np.flatnonzero(np.frombuffer(chunk, dtype=np.uint8) == 0x0A) + position + 1)
+            position += len(chunk)
+    return np.concatenate(ends) if ends else np.empty(0, dtype=np.int64)
+
+
+class VectorMemoryIndex:
+    """Append-only, memory-mapped hashed n-gram index per agent"""
+
+    def __init__(self, root: str = VECTOR_MEMORY_DIR, dim: int = VECTOR_MEMORY_DIM, max_open: int = 256):
+        self.root = root
+        self.dim = dim
+        self.max_open = max_open
+        # agent_id -> opened index state of recently searched agents. Searches run in
+        # worker threads: states are never changed once cached, only replaced, under the lock
+        self._open: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._open_lock = threading.Lock()
+
+    def _dir(self, agent_id: str) -> str:
+        return os.path.join(self.root, _AGENT_ID.sub("_", agent_id))
+
+    def exists(self, agent_id: str) -> bool:
+        return os.path.exists(os.path.join(self._dir(agent_id), "vectors.f32"))
+
+    @contextmanager
+    def _locked(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, ".lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _committed(self, path: str) -> Tuple[int, int]:
+        """Rows and entry bytes of the last complete append, cutting off what a crash left behind"""
+        vectors_path, entries_path = os.path.join(path, "vectors.f32"), os.path.join(path, "entries.jsonl")
+        if not os.path.exists(vectors_path) or not os.path.exists(entries_path):
+            return 0, 0
+        commit_path = os.path.join(path, "commit.json")
+        if os.path.exists(commit_path):
+            with open(commit_path) as f:
+                commit = json.load(f)
+            rows, entries_bytes = commit["rows"], commit["entries_bytes"]
+        else:
+            # Indexes written before commit records, scanned once
+            ends = _line_ends(entries_path)
+            rows = min(os.path.getsize(vectors_path) // (4 * self.dim), len(ends))
+            entries_bytes = int(ends[rows - 1]) if rows else 0
+        # Rows past the commit would pair every later vector with the wrong entry
+        if os.path.getsize(vectors_path) > rows * 4 * self.dim:
+            os.truncate(vectors_path, rows * 4 * self.dim)
+        if os.path.getsize(entries_path) > entries_bytes:
+            os.truncate(entries_path, entries_bytes)
+        return rows, entries_bytes
+
+    def _replace(self, path: str, name: str, write):
+        target = os.path.join(path, name)
+        with open(target + ".tmp", "wb") as f:
+            write(f)
+        os.replace(target + ".tmp", target)
+
+    def _append(self, path: str, items: List[Tuple[str, Dict[str, Any]]]):
+        rows, entries_bytes = self._committed(path)
+        vectors = np.stack([embed(text, self.dim) for text, _ in items])
+        lines = b"".join(json.dumps(entry, default=str).encode() + b"\n" for _, entry in items)
+        df_path = os.path.join(path, "df.npy")
+        df = np.load(df_path) if os.path.exists(df_path) else np.zeros(self.dim, dtype=np.float32)
+        df += (vectors > 0).sum(axis=0)
+        # Vectors first: readers only trust rows that also have an entry
+        with open(os.path.join(path, "vectors.f32"), "ab") as f:
+            f.write(vectors.tobytes())
+        with open(os.path.join(path, "entries.jsonl"), "ab") as f:
+            f.write(lines)
+        # Replaced atomically, so readers and a crash never see a partly written file
+        self._replace(path, "df.npy", lambda f: np.save(f, df))
+        commit = {"rows": rows + len(items), "entries_bytes": entries_bytes + len(lines)}
+        self._replace(path, "commit.json", lambda f: f.write(json.dumps(commit).encode()))
+
+    def add(self, agent_id: str, text: str, entry: Dict[str, Any]):
+        """Index one completed task"""
+        path = self._dir(agent_id)
+        with self._locked(path):
+            self._append(path, [(text, entry)])
+
+    def rebuild(self, agent_id: str, items: Iterable[Tuple[str, Dict[str, Any]]], batch_size: int = 512,
+                replace: bool = True) -> bool:
+        """Replace an agent's index with ``(text, entry)`` pairs, e.g. from stored tasks.
+
+        Runs under the agent's lock, so concurrent rebuilds and adds wait for
+        it. With ``replace=False`` an index built meanwhile by another worker
+        is kept; returns whether this call built the index.
+        """
+        path = self._dir(agent_id)
+        with self._locked(path):
+            if not replace and self.exists(agent_id):
+                return False
+            # Leftovers of a crashed rebuild, no rebuild can be running while we hold the lock
+            for name in os.listdir(path):
+                if name.startswith(".rebuild-"):
+                    shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+            staging = tempfile.mkdtemp(prefix=".rebuild-", dir=path)
+            try:
+                batch: List[Tuple[str, Dict[str, Any]]] = []
+                for item in items:
+                    batch.append(item)
+                    if len(batch) >= batch_size:
+                        self._append(staging, batch)
+                        batch = []
+                if batch:
+                    self._append(staging, batch)
+                for name in ("vectors.f32", "entries.jsonl"):
+                    open(os.path.join(staging, name), "a").close()  # An agent without tasks gets an empty index
+                # Without vectors.f32 the index counts as missing, so a crash mid-swap
+                # leaves it to be rebuilt instead of pairing new vectors with old entries
+                if os.path.exists(os.path.join(path, "vectors.f32")):
+                    os.remove(os.path.join(path, "vectors.f32"))
+                for name in ("entries.jsonl", "df.npy", "commit.json", "vectors.f32"):
+                    if os.path.exists(os.path.join(staging, name)):
+                        os.replace(os.path.join(staging, name), os.path.join(path, name))
+            finally:
+                shutil.rmtree(staging, ignore_errors=True)
+        with self._open_lock:
+            self._open.pop(agent_id, None)
+        return True
+
+    def _load(self, agent_id: str) -> Optional[Dict[str, Any]]:
+        path = self._dir(agent_id)
+        vectors_path = os.path.join(path, "vectors.f32")
+        try:
+            stat = os.stat(vectors_path)
+            inodes = (stat.st_ino, os.stat(os.path.join(path, "entries.jsonl")).st_ino)
+        except FileNotFoundError:
+            return None  # Missing, or being rebuilt
+        with self._open_lock:
+            cached = self._open.get(agent_id)
+            if cached and cached["inodes"] != inodes:
+                cached = None  # Rebuilt since it was opened
+            if cached and cached["size"] == stat.st_size:
+                self._open.move_to_end(agent_id)
+                return cached
+
+        # Refreshed into a new state, other threads may still be searching the cached one
+        ends = cached["ends"] if cached else np.empty(0, dtype=np.int64)
+        # Only scan the complete lines appended since the last load
+        start = int(ends[-1]) if len(ends) else 0
+        ends = np.concatenate([ends, _line_ends(os.path.join(path, "entries.jsonl"), start)])
+        rows = min(stat.st_size // (4 * self.dim), len(ends))
+        if rows == 0:
+            return None
+        state = {
+            "inodes": inodes,
+            "ends": ends,
+            "size": rows * 4 * self.dim,
+            "rows": rows,
+            "vectors": np.memmap(vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dim)),
+            "df": np.load(os.path.join(path, "df.npy"))
+        }
+
+        with self._open_lock:
+            self._open[agent_id] = state
+            self._open.move_to_end(agent_id)
+            while len(self._open) > self.max_open:
+                self._open.popitem(last=False)
+        return state
+
+    def _read_entries(self, agent_id: str, state: Dict[str, Any], rows: List[int]) -> Optional[List[Dict[str, Any]]]:
+        """Entries of the given rows, None when the file was rebuilt after ``state`` was loaded"""
+        ends = state["ends"]
+        entries = []
+        with open(os.path.join(self._dir(agent_id), "entries.jsonl"), "rb") as f:
+            if os.fstat(f.fileno()).st_ino != state["inodes"][1]:
+                return None
+            for i in rows:
+                begin = int(ends[i - 1]) if i else 0
+                f.seek(begin)
+                entries.append(json.loads(f.read(int(ends[i]) - begin)))
+        return entries
+
+    def search(self, agent_id: str, text: str, k: int = 3, min_score: float = 0.0) -> List[Dict[str, Any]]:
+        """Top-k past tasks most similar to ``text``, best first, each with its ``score``"""
+        for _ in range(2):
+            state = self._load(agent_id)
+            if state is None:
+                return []
+            rows, vectors, df = state["rows"], state["vectors"], state["df"]
+
+            query = embed(text, self.dim)
+            query *= np.log((1 + rows) / (1 + df)) + 1  # IDF weighting of the query terms
+            norm = np.linalg.norm(query)
+            if not norm:
+                return []
+            scores = vectors @ (query / norm)
+
+            top = np.argpartition(-scores, min(k, rows) - 1)[:k]
+            top = [int(i) for i in top[np.argsort(-scores[top])] if scores[i] >= min_score]
+            entries = self._read_entries(agent_id, state, top)
+            if entries is not None:
+                return [{**entry, "score": float(scores[i])} for i, entry in zip(top, entries)]
+            with self._open_lock:
+                self._open.pop(agent_id, None)  # Rebuilt meanwhile, reload once
+        return []
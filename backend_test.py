@@ -270,8 +270,14 @@ def test_conversation_support():
         history_response = requests.get(f"{API_BASE}/conversations/{conversation_id}", timeout=10)
         if history_response.status_code == 200:
             history = history_response.json()
+            history_messages = history.get('messages', [])
+            # Messages are paged from bucket storage, oldest first with their seq numbers
+            if any('seq' not in message for message in history_messages) or 'next_before' not in history:
+                print("❌ Conversation history is not in the paged format")
+                return None
             print(f"\n✅ Conversation history retrieved")
-            print(f"   Messages count: {len(history.get('messages', []))}")
+            print(f"   Messages count: {len(history_messages)}")
+            print(f"   Older messages cursor: {history.get('next_before')}")
             return conversation
         else:
             print("❌ Failed to retrieve conversation history")
@@ -458,8 +458,14 @@ def test_enhanced_conversation_memory():
         
         memory_efficiency = (successful_turns / len(messages)) * 100
         print(f"\n   Memory Management Test: {successful_turns}/{len(messages)} turns successful ({memory_efficiency:.1f}%)")
-        
-        return successful_turns >= 3  # At least 3 successful turns
+
+        # Each turn stores the prompt and the response, paged newest first
+        history = requests.get(f"{API_BASE}/conversations/{conversation_id}", params={"limit": 4}, timeout=10).json()
+        seqs = [message.get('seq') for message in history.get('messages', [])]
+        print(f"   Latest page seqs: {seqs}, older messages before: {history.get('next_before')}")
+        paged = seqs == list(range(2 * successful_turns - 4, 2 * successful_turns)) and history.get('next_before') == seqs[0]
+
+        return successful_turns >= 3 and paged  # At least 3 successful turns
         
     except Exception as e:
         print(f"❌ Enhanced conversation memory error: {str(e)}")
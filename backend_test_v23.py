@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+"""
+Backend API Testing for Agentic AI Platform v2.3
+Tests the endpoints added on top of v2.2:
+- Paged conversation history (bucketed message storage)
+- Token streaming for enhanced tasks
+- Asynchronous tasks with status polling and NDJSON subscription
+- NDJSON export of conversations and task history
+- Cold archive query and archival run
+- Batch task classification
+- Manual task type corrections
+- Model router statistics
+"""
+
+import requests
+import json
+import time
+import os
+from datetime import datetime
+
+# Get backend URL from environment
+BACKEND_URL = os.getenv('REACT_APP_BACKEND_URL', 'http://localhost:8001')
+API_BASE = f"{BACKEND_URL}/api"
+
+ANALYSIS_TASK = "Analyze the market trends for electric vehicles and provide insights on growth opportunities"
+CREATIVE_TASK = "Write a short poem about the sea"
+CODING_TASK = "Create a Python function to calculate fibonacci numbers with memoization"
+CONVERSATION_TASK = "Hello, I'd like to discuss project management strategies"
+
+def create_test_agent(name):
+    """Create an auto-routed agent for a test, returns its id or None"""
+    agent_data = {
+        "name": name,
+        "description": "Agent for testing v2.3 features",
+        "system_prompt": "You are a helpful AI assistant.",
+        "model": "auto",
+        "specialization": "conversation"
+    }
+    response = requests.post(f"{API_BASE}/agents", json=agent_data, timeout=10)
+    if response.status_code != 200:
+        print(f"❌ Failed to create test agent: {response.status_code}")
+        return None
+    return response.json().get('id')
+
+def read_ndjson(response):
+    """Parse the events of an NDJSON response as they arrive"""
+    return [json.loads(line) for line in response.iter_lines() if line]
+
+def test_conversation_paging():
+    """Test paged conversation history with seq numbers and next_before cursors"""
+    print("\n🔍 Testing Paged Conversation History...")
+    try:
+        agent_id = create_test_agent("Paging Test Agent v2.3")
+        if not agent_id:
+            return False
+
+        conv_response = requests.post(f"{API_BASE}/conversations", params={"agent_id": agent_id}, timeout=10)
+        if conv_response.status_code != 200:
+            print("❌ Failed to create conversation")
+            return False
+        conversation_id = conv_response.json().get('id')
+
+        for prompt in ["Hello there", "Tell me about CNNs", "And about overfitting?"]:
+            requests.post(
+                f"{API_BASE}/agents/{agent_id}/tasks/enhanced",
+                json={"agent_id": agent_id, "prompt": prompt, "conversation_id": conversation_id},
+                timeout=30
+            )
+
+        response = requests.get(f"{API_BASE}/conversations/{conversation_id}", params={"limit": 2}, timeout=10)
+        if response.status_code != 200:
+            print(f"❌ Conversation retrieval failed with status {response.status_code}")
+            return False
+        page = response.json()
+        messages = page.get('messages', [])
+        seqs = [message.get('seq') for message in messages]
+        print(f"   First page: {len(messages)} messages, seqs {seqs}, next_before {page.get('next_before')}")
+        if len(messages) != 2 or seqs != sorted(seqs) or page.get('next_before') != seqs[0]:
+            print("❌ First page is not the newest two messages in seq order")
+            return False
+
+        older = requests.get(
+            f"{API_BASE}/conversations/{conversation_id}",
+            params={"limit": 2, "before": page['next_before']},
+            timeout=10
+        ).json()
+        older_seqs = [message.get('seq') for message in older.get('messages', [])]
+        print(f"   Older page: seqs {older_seqs}, next_before {older.get('next_before')}")
+        if not older_seqs or max(older_seqs) >= seqs[0]:
+            print("❌ Older page overlaps the first page")
+            return False
+
+        print("✅ Conversation paging working")
+        return True
+    except Exception as e:
+        print(f"❌ Conversation paging error: {str(e)}")
+        return False
+
+def test_streaming_task():
+    """Test NDJSON token streaming of an enhanced task"""
+    print("\n🔍 Testing Streaming Enhanced Task...")
+    try:
+        agent_id = create_test_agent("Streaming Test Agent v2.3")
+        if not agent_id:
+            return False
+
+        start_time = time.time()
+        with requests.post(
+            f"{API_BASE}/agents/{agent_id}/tasks/enhanced/stream",
+            json={"agent_id": agent_id, "prompt": CREATIVE_TASK},
+            stream=True,
+            timeout=60
+        ) as response:
+            if response.status_code != 200:
+                print(f"❌ Streaming failed with status {response.status_code}")
+                return False
+            events = read_ndjson(response)
+
+        types = [event.get('type') for event in events]
+        tokens = [event['content'] for event in events if event.get('type') == 'token']
+        print(f"   Events: {len(events)} ({types.count('token')} tokens) in {time.time() - start_time:.2f}s")
+        if types[-1:] != ['done']:
+            print(f"❌ Stream did not finish with a done event: {events[-1:]}")
+            return False
+        task = events[-1]['task']
+        if task.get('response') != "".join(tokens) or task.get('status') != 'completed':
+            print("❌ Final task does not match the streamed tokens")
+            return False
+
+        print(f"✅ Streaming working, task {task.get('id')} completed")
+        return True
+    except Exception as e:
+        print(f"❌ Streaming task error: {str(e)}")
+        return False
+
+def test_async_task():
+    """Test 202 Accepted async tasks with polling and the events subscription"""
+    print("\n🔍 Testing Asynchronous Task Execution...")
+    try:
+        agent_id = create_test_agent("Async Test Agent v2.3")
+        if not agent_id:
+            return False
+
+        response = requests.post(
+            f"{API_BASE}/agents/{agent_id}/tasks/enhanced",
+            json={"agent_id": agent_id, "prompt": ANALYSIS_TASK, "async_mode": True},
+            timeout=10
+        )
+        if response.status_code != 202:
+            print(f"❌ Async task was not accepted: {response.status_code}")
+            return False
+        task = response.json()
+        print(f"   Accepted: {task.get('id')} ({task.get('status')})")
+
+        with requests.get(f"{BACKEND_URL}{task['events_url']}", stream=True, timeout=120) as events_response:
+            events = read_ndjson(events_response)
+        statuses = [event['task']['status'] for event in events if event.get('type') == 'status']
+        print(f"   Status events: {statuses}")
+
+        final = requests.get(f"{BACKEND_URL}{task['status_url']}", timeout=10).json()
+        if final.get('status') != 'completed' or statuses[-1:] != ['completed']:
+            print(f"❌ Async task ended as {final.get('status')}")
+            return False
+
+        print("✅ Async task execution working")
+        return True
+    except Exception as e:
+        print(f"❌ Async task error: {str(e)}")
+        return False
+
+def test_exports():
+    """Test NDJSON export of a conversation and of task history"""
+    print("\n🔍 Testing NDJSON Exports...")
+    try:
+        agent_id = create_test_agent("Export Test Agent v2.3")
+        if not agent_id:
+            return False
+        conversation_id = requests.post(
+            f"{API_BASE}/conversations", params={"agent_id": agent_id}, timeout=10
+        ).json().get('id')
+        requests.post(
+            f"{API_BASE}/agents/{agent_id}/tasks/enhanced",
+            json={"agent_id": agent_id, "prompt": CONVERSATION_TASK, "conversation_id": conversation_id},
+            timeout=30
+        )
+
+        with requests.get(
+            f"{API_BASE}/conversations/{conversation_id}/export",
+            params={"since": "2020-01-01T00:00:00Z"},
+            stream=True,
+            timeout=30
+        ) as response:
+            messages = read_ndjson(response) if response.status_code == 200 else None
+        print(f"   Conversation export: {len(messages) if messages is not None else 'failed'} messages")
+
+        with requests.get(f"{API_BASE}/tasks/export", params={"agent_id": agent_id}, stream=True, timeout=30) as response:
+            tasks = read_ndjson(response) if response.status_code == 200 else None
+        print(f"   Task export: {len(tasks) if tasks is not None else 'failed'} tasks")
+
+        if not messages or not tasks or any(task.get('agent_id') != agent_id for task in tasks):
+            print("❌ Exports incomplete")
+            return False
+
+        response = requests.get(
+            f"{API_BASE}/tasks/export", params={"agent_id": agent_id, "compress": True}, timeout=30
+        )
+        print(f"   Compressed export: {response.headers.get('content-type')}, {len(response.content)} bytes")
+        if response.status_code != 200 or not response.content.startswith(b"\x1f\x8b"):
+            print("❌ Compressed export is not a gzip file")
+            return False
+
+        print("✅ NDJSON exports working")
+        return True
+    except Exception as e:
+        print(f"❌ Export error: {str(e)}")
+        return False
+
+def test_archive():
+    """Test the archival run and archive queries"""
+    print("\n🔍 Testing Cold Archive...")
+    try:
+        run = requests.post(f"{API_BASE}/archive/run", timeout=120)
+        if run.status_code != 200:
+            print(f"❌ Archival run failed with status {run.status_code}")
+            return False
+        print(f"   Archival run: {run.json()}")
+
+        with requests.get(f"{API_BASE}/archive/tasks", params={"limit": 5}, stream=True, timeout=30) as response:
+            if response.status_code != 200:
+                print(f"❌ Archive query failed with status {response.status_code}")
+                return False
+            records = read_ndjson(response)
+        print(f"   Archived tasks returned: {len(records)}")
+
+        unknown = requests.get(f"{API_BASE}/archive/unknown", timeout=10)
+        if unknown.status_code != 404:
+            print("❌ Unknown archive not rejected")
+            return False
+
+        print("✅ Archive endpoints working")
+        return True
+    except Exception as e:
+        print(f"❌ Archive error: {str(e)}")
+        return False
+
+def test_batch_classification():
+    """Test batch classification against single task classification"""
+    print("\n🔍 Testing Batch Classification...")
+    try:
+        prompts = [ANALYSIS_TASK, CREATIVE_TASK, CODING_TASK, CONVERSATION_TASK] * 25
+        start_time = time.time()
+        response = requests.post(f"{API_BASE}/classify/batch", json={"prompts": prompts}, timeout=30)
+        if response.status_code != 200:
+            print(f"❌ Batch classification failed with status {response.status_code}")
+            return False
+        data = response.json()
+        results = data.get('results', [])
+        print(f"   {data.get('count')} prompts in {time.time() - start_time:.2f}s")
+        for prompt, result in list(zip(prompts, results))[:4]:
+            print(f"   {result.get('task_type')} ({result.get('confidence', 0):.2f}) -> {result.get('selected_model')}: {prompt[:40]}")
+
+        if len(results) != len(prompts) or results[:4] * 25 != results:
+            print("❌ Batch results inconsistent")
+            return False
+
+        print("✅ Batch classification working")
+        return True
+    except Exception as e:
+        print(f"❌ Batch classification error: {str(e)}")
+        return False
+
+def test_task_type_correction():
+    """Test that a corrected task type is stored as a manual classification"""
+    print("\n🔍 Testing Task Type Correction...")
+    try:
+        agent_id = create_test_agent("Correction Test Agent v2.3")
+        if not agent_id:
+            return False
+        task = requests.post(
+            f"{API_BASE}/agents/{agent_id}/tasks/enhanced",
+            json={"agent_id": agent_id, "prompt": CREATIVE_TASK},
+            timeout=30
+        ).json()
+        print(f"   Classified as {task.get('task_type')} by {task.get('metadata', {}).get('classification_source')}")
+
+        response = requests.put(f"{API_BASE}/tasks/{task['id']}/task_type", json={"task_type": "conversation"}, timeout=10)
+        if response.status_code != 200:
+            print(f"❌ Correction failed with status {response.status_code}")
+            return False
+        stored = requests.get(f"{API_BASE}/tasks/{task['id']}", timeout=10).json()
+        if stored.get('task_type') != 'conversation' or stored['metadata'].get('classification_source') != 'manual':
+            print("❌ Correction not stored as a manual label")
+            return False
+
+        invalid = requests.put(f"{API_BASE}/tasks/{task['id']}/task_type", json={"task_type": "unknown"}, timeout=10)
+        if invalid.status_code != 422:
+            print("❌ Unknown task type not rejected")
+            return False
+
+        print("✅ Task type correction working")
+        return True
+    except Exception as e:
+        print(f"❌ Task type correction error: {str(e)}")
+        return False
+
+def test_router_stats():
+    """Test the model router statistics endpoint"""
+    print("\n🔍 Testing Model Router Stats...")
+    try:
+        response = requests.get(f"{API_BASE}/router/stats", timeout=10)
+        if response.status_code != 200:
+            print(f"❌ Router stats failed with status {response.status_code}")
+            return False
+        data = response.json()
+        print(f"   Enabled: {data.get('enabled')}")
+        for task_type, entry in list(data.get('task_types', {}).items())[:5]:
+            print(f"   {task_type}: {entry.get('decision')}")
+
+        print("✅ Router stats working")
+        return 'task_types' in data
+    except Exception as e:
+        print(f"❌ Router stats error: {str(e)}")
+        return False
+
+def main():
+    """Main testing function for v2.3 features"""
+    print("🧪 Agentic AI Platform v2.3 - Backend Testing")
+    print("=" * 80)
+    print(f"Backend: {BACKEND_URL} ({datetime.utcnow().isoformat()})")
+
+    results = {
+        "conversation_paging": test_conversation_paging(),
+        "streaming_task": test_streaming_task(),
+        "async_task": test_async_task(),
+        "exports": test_exports(),
+        "archive": test_archive(),
+        "batch_classification": test_batch_classification(),
+        "task_type_correction": test_task_type_correction(),
+        "router_stats": test_router_stats()
+    }
+
+    print("\n" + "=" * 80)
+    print("🏁 AGENTIC AI PLATFORM v2.3 TEST RESULTS:")
+    print("=" * 80)
+    for test_name, passed in results.items():
+        status_icon = "✅" if passed else "❌"
+        print(f"   {test_name.replace('_', ' ').title()}: {status_icon}")
+
+    passed_tests = sum(1 for passed in results.values() if passed)
+    print(f"\n📊 OVERALL v2.3 SUCCESS RATE: {passed_tests / len(results) * 100:.1f}% ({passed_tests}/{len(results)})")
+    return passed_tests == len(results)
+
+if __name__ == "__main__":
+    success = main()
+    exit(0 if success else 1)